@@ -1,40 +1,267 @@
-from flask import Flask, request, jsonify
-from firebase_logic import store_message, get_messages
-from openai_logic import generate_ai_reply
+from flask import Flask, request, jsonify, Response, stream_with_context, make_response
+from firebase_logic import store_turn, get_messages, get_messages_page, stream_messages, get_rpc_stats, get_cache_stats
+from openai_logic import generate_ai_reply, get_parse_stats
+from history_window import HISTORY_CONTEXT_MESSAGES
+from reply_queue import ReplyQueue, QueueFullError, get_sender
+from turn_scheduler import TurnScheduler
+from idempotency import idempotency_cache, get_idempotency_stats, DONE, IN_FLIGHT
+from clients import warm_up, WARM_UP_CLIENTS, get_google_http_stats
+from llm_client import get_llm_stats
+from response_cache import get_response_cache_stats
+from llm_usage import get_usage_stats
+from telemetry import trace, span, log, current_trace_id, register_collector, render_metrics
+import atexit
+import json
 import os
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# ASYNC_REPLIES=true: ack Twilio immediately and reply from a background worker
+ASYNC_REPLIES = os.getenv("ASYNC_REPLIES", "false").lower() == "true"
+
+# Seconds of quiet that end a burst of texts (see turn_scheduler.py). Sync mode holds the webhook
+# request open while it waits, so there it defaults to 0: only texts that arrive while the
+# phone's previous reply is being generated get merged
+TURN_DEBOUNCE = float(os.getenv("TURN_DEBOUNCE", "1.0" if ASYNC_REPLIES else "0"))
+
+MESSAGES_PAGE_MAX = int(os.getenv("MESSAGES_PAGE_MAX", "500"))
+
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+reply_sender = None
+reply_queue = None
+
+
+def run_turn(from_number, texts, trace_id=None):
+    """One turn for a burst of texts: a single AI reply, stored together with the texts"""
+    received = [{"text": text, "direction": "received"} for text in texts]
+    try:
+        # The reply sees the newest messages (older ones are in the stored summary, see
+        # history_window.py) and is accounted to this phone's token budget
+        history = get_messages(from_number, limit=HISTORY_CONTEXT_MESSAGES) + received
+        ai_reply = generate_ai_reply("\n".join(texts), history, phone_number=from_number)
+    except Exception:
+        # Don't lose the customer's messages if the reply fails
+        store_turn(from_number, received)
+        raise
+
+    # Store the incoming messages and the AI reply in one batched write
+    store_turn(from_number, received + [{"text": ai_reply, "direction": "sent"}])
+    return ai_reply
+
+
+def send_turn(from_number, texts, trace_id=None):
+    """Async turn: the texts are already stored; generate one reply, store it and send it outbound"""
+    with span("sms.async_reply"):
+        history = get_messages(from_number, limit=HISTORY_CONTEXT_MESSAGES)
+        ai_reply = generate_ai_reply("\n".join(texts), history, phone_number=from_number)
+        store_turn(from_number, [{"text": ai_reply, "direction": "sent"}], metadata={"reply_pending": False})
+        with span("twilio.send"):
+            reply_sender.send(from_number, ai_reply)
+
+
+def process_reply(from_number, incoming_msg, trace_id=None):
+    """Worker job: add the message to its phone's next turn (see turn_scheduler.py)"""
+    # Same trace ID as the webhook request that queued it
+    with trace(trace_id):
+        turn_scheduler.submit(from_number, incoming_msg, trace_id, wait=False)
+
+
+# One turn at a time per phone; a burst of texts gets one reply
+turn_scheduler = TurnScheduler(send_turn if ASYNC_REPLIES else run_turn, debounce=TURN_DEBOUNCE)
+register_collector("turn_scheduler", turn_scheduler.stats)
+
+if ASYNC_REPLIES:
+    reply_sender = get_sender()
+    reply_queue = ReplyQueue(process_reply)
+    reply_queue.start()
+    # Let queued replies finish before the process exits
+    atexit.register(reply_queue.shutdown)
+    register_collector("reply_queue", reply_queue.stats)
+
+
+# Stats the other modules already keep, exported next to the stage histograms on /metrics
+register_collector("llm", get_llm_stats)
+register_collector("reply_cache", get_response_cache_stats)
+register_collector("conversation_cache", get_cache_stats)
+register_collector("order_parse", get_parse_stats)
+register_collector("firestore_rpc", get_rpc_stats)
+register_collector("llm_usage", get_usage_stats)
+register_collector("idempotency", get_idempotency_stats)
+register_collector("google_http", get_google_http_stats)
+
+from sheets_logic import USE_SHEETS_OUTBOX
+if USE_SHEETS_OUTBOX:
+    from sheets_outbox import get_outbox_stats
+    register_collector("sheets_outbox", get_outbox_stats)
+
+
+# WARM_UP_CLIENTS=firestore,openai,...: connect in the background so the first webhook doesn't pay for it
+if WARM_UP_CLIENTS:
+    warm_up(background=True)
+
+
+# PROVISION_TAB_DAYS=N: keep the next N days of order tabs created ahead of time
+PROVISION_TAB_DAYS = int(os.getenv("PROVISION_TAB_DAYS", "0"))
+if PROVISION_TAB_DAYS > 0:
+    from sheets_logic import start_tab_provisioner
+    start_tab_provisioner(PROVISION_TAB_DAYS)
+
+
 @app.route("/sms", methods=["POST"])
 def sms_receive():
+    # Twilio's MessageSid doubles as the trace ID, so log lines can be matched to its console
+    message_sid = request.form.get("MessageSid")
+    trace_id = message_sid or request.headers.get("X-Request-Id")
+    with trace(trace_id) as trace_id, span("sms.webhook"):
+        if message_sid:
+            response = handle_sms_once(message_sid)
+        else:
+            response = make_response(handle_sms())
+    response.headers["X-Trace-Id"] = trace_id
+    return response
+
+def handle_sms_once(message_sid):
+    """handle_sms, once per MessageSid: Twilio retries get the first response back"""
+    state, cached = idempotency_cache.begin(message_sid)
+    if state == DONE:
+        response = Response(cached["body"], status=cached["status"], mimetype=cached["mimetype"])
+        response.headers["X-Duplicate-Of"] = message_sid
+        return response
+    if state == IN_FLIGHT:
+        # Still being handled after waiting IDEMPOTENCY_WAIT; have Twilio try again later
+        response = jsonify({"error": "This message is still being processed."})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+
+    try:
+        response = make_response(handle_sms())
+    except Exception:
+        idempotency_cache.fail(message_sid)
+        raise
+    if response.status_code >= 500:
+        # e.g. the reply queue was full: let the retry do the work
+        idempotency_cache.fail(message_sid)
+    else:
+        idempotency_cache.complete(message_sid, {
+            "status": response.status_code,
+            "body": response.get_data(as_text=True),
+            "mimetype": response.mimetype,
+        })
+    return response
+
+def handle_sms():
     incoming_msg = request.form.get("Body", "").strip()
     from_number = request.form.get("From", "").strip()
 
-    # Store the incoming message as 'received'
-    store_message(from_number, incoming_msg, direction="received")
+    if reply_queue is not None:
+        if not reply_queue.has_room():
+            # Nothing stored yet, so Twilio's retry (on 5xx) starts over: shed load instead of blocking the webhook
+            return jsonify({"error": "Reply queue is full, try again later."}), 503
+        # Store the incoming message as 'received'; the conversation shows a reply is owed until one is stored
+        store_turn(from_number, [{"text": incoming_msg, "direction": "received"}], metadata={"reply_pending": True})
+        try:
+            reply_queue.submit(from_number, incoming_msg, current_trace_id())
+        except QueueFullError as e:
+            # Filled up since the check. A retry would store the message again, so ack it and leave it
+            # pending (reply_pending on the conversation); the phone's next text gets a reply that covers it
+            log(f"⚠️  Reply to {from_number} left pending: {e}")
+        return Response(EMPTY_TWIML, status=200, mimetype="text/xml")
 
-    # Generate AI reply
-    ai_reply = generate_ai_reply(incoming_msg)
+    # Waits for this phone's current turn and the debounce window, then runs run_turn
+    ai_reply = turn_scheduler.submit(from_number, incoming_msg, current_trace_id())
+    if ai_reply is None:
+        # Merged into the turn of a text that arrived right after it; that request carries the reply.
+        # Callers reading "reply" must allow null here (see Burst Coalescing in the README)
+        return jsonify({"reply": None, "coalesced": True}), 200
+    return jsonify({"reply": ai_reply}), 200
 
-    # Store the AI reply as 'sent'
-    store_message(from_number, ai_reply, direction="sent")
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, in-flight and error counts"""
+    return Response(render_metrics(), status=200, mimetype="text/plain; version=0.0.4")
 
-    return jsonify({"reply": ai_reply}), 200
+@app.route("/queue/stats", methods=["GET"])
+def queue_stats():
+    if reply_queue is None:
+        return jsonify({"async_replies": False, "turns": turn_scheduler.stats()}), 200
+    return jsonify({"async_replies": True, **reply_queue.stats(), "turns": turn_scheduler.stats()}), 200
+
+def _json_default(value):
+    # Firestore timestamps are datetime subclasses
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _dumps(data):
+    return json.dumps(data, default=_json_default, separators=(",", ":"))
+
+def _stream_messages_json(phone_number, since):
+    """Yield the {"messages": [...]} document one message at a time"""
+    yield '{"messages":['
+    first = True
+    for msg in stream_messages(phone_number, since=since):
+        yield ("" if first else ",") + _dumps(msg)
+        first = False
+    yield "]}"
 
 @app.route("/messages", methods=["GET"])
 def view_messages():
+    """
+    ?phone=...                 full history, streamed
+    &limit=N                   one page (newest N, oldest first) instead
+    &before=<id> / &after=<id> page older / newer than a message id
+    &since=<ISO timestamp>     only messages at or after this time (UTC unless it has an offset)
+    """
     phone_number = request.args.get("phone")
     if not phone_number:
         return jsonify({"error": "Missing phone number query parameter."}), 400
-    messages = get_messages(phone_number)
-    # Convert timestamp to string for JSON serialization
-    for msg in messages:
-        if msg.get("timestamp"):
-            msg["timestamp"] = str(msg["timestamp"])
-    return jsonify({"messages": messages}), 200
+
+    limit = request.args.get("limit")
+    before = request.args.get("before")
+    after = request.args.get("after")
+    since = request.args.get("since")
+    if before and after:
+        return jsonify({"error": "Use either before or after, not both."}), 400
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MESSAGES_PAGE_MAX:
+            return jsonify({"error": f"limit must be an integer between 1 and {MESSAGES_PAGE_MAX}."}), 400
+    if since:
+        try:
+            since = datetime.fromisoformat(since.replace("Z", "+00:00"))
+        except ValueError:
+            return jsonify({"error": "since must be an ISO 8601 timestamp."}), 400
+        # Stored timestamps are UTC; a timestamp without an offset is taken to be UTC too
+        since = since.replace(tzinfo=timezone.utc) if since.tzinfo is None else since.astimezone(timezone.utc)
+
+    # Full export: stream instead of building one big response
+    if limit is None and not before and not after:
+        return Response(
+            stream_with_context(_stream_messages_json(phone_number, since or None)),
+            status=200,
+            mimetype="application/json"
+        )
+
+    messages, has_more = get_messages_page(
+        phone_number, limit=limit or 50, before=before, after=after, since=since or None
+    )
+    body = {
+        "messages": messages,
+        "has_more": has_more,
+        # Pass these back as before=/after= to fetch the neighbouring pages
+        "before": messages[0]["id"] if messages else None,
+        "after": messages[-1]["id"] if messages else None,
+    }
+    return Response(_dumps(body), status=200, mimetype="application/json")
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=True, port=5001)
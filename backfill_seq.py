@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Give every stored Firestore message a seq
+Messages stored before seq existed are ordered by timestamp alone, and only
+this migration lets their conversations use the (timestamp, seq) order that
+keeps same-timestamp messages in place across pages. Safe to run again:
+conversations already migrated are skipped with one read.
+
+Create the indexes in firestore.indexes.json first (see Message Order in
+tests/README_LOCAL_TESTING.md)
+
+Usage: python backfill_seq.py
+"""
+
+import time
+from clients import get_firestore
+from firebase_logic import backfill_seq
+from store_config import CONVERSATION_STORE
+
+def backfill_all_conversations():
+    started = time.monotonic()
+    conversations = messages = 0
+    for conv_ref in get_firestore().collection('conversations').list_documents():
+        count = backfill_seq(conv_ref.id)
+        if count:
+            print(f"   ... {conv_ref.id}: {count:,} message(s)")
+        conversations += 1
+        messages += count
+    summary = {
+        "conversations": conversations,
+        "messages": messages,
+        "elapsed_s": round(time.monotonic() - started, 2),
+    }
+    print(f"\n✅ Checked {conversations} conversation(s), gave {messages:,} message(s) a seq "
+          f"in {summary['elapsed_s']}s")
+    return summary
+
+if __name__ == "__main__":
+    if CONVERSATION_STORE == "sqlite":
+        print("Nothing to do: the SQLite store has always kept a seq per message")
+    else:
+        print("🔢 Backfilling message seq numbers in Firebase...")
+        backfill_all_conversations()
+        print("Done!")
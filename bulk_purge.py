@@ -0,0 +1,139 @@
+"""
+Bulk purge engine for Firestore conversations
+Deletes messages in batched commits of up to 500 documents, pages through
+collections with cursors, and purges many conversations at once on a bounded
+thread pool. Supports a dry-run count and reports progress and throughput.
+"""
+
+import os
+import time
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))  # Firestore's per-commit maximum
+PURGE_WORKERS = int(os.getenv("PURGE_WORKERS", "8"))
+
+
+class PurgeProgress:
+    """Thread-safe counters with periodic progress output"""
+
+    def __init__(self, dry_run=False, report_every=2.0, quiet=False):
+        self.dry_run = dry_run
+        self.report_every = report_every
+        self.quiet = quiet
+        self.conversations = 0
+        self.documents = 0
+        self.commits = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def add(self, documents=0, conversations=0, commits=0):
+        with self._lock:
+            self.documents += documents
+            self.conversations += conversations
+            self.commits += commits
+            now = time.monotonic()
+            if not self.quiet and now - self._last_report >= self.report_every:
+                self._last_report = now
+                print(f"   ... {self.documents:,} docs in {self.conversations:,} conversations ({self.rate():,.0f} docs/s)")
+
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.documents / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        with self._lock:
+            return {
+                "dry_run": self.dry_run,
+                "conversations": self.conversations,
+                "documents": self.documents,
+                "commits": self.commits,
+                "elapsed_s": round(time.monotonic() - self.started, 2),
+                "docs_per_s": round(self.rate(), 1),
+            }
+
+
+def purge_collection(db, collection_ref, dry_run=False, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """
+    Delete (or count, with dry_run) every document in a collection.
+    Pages by document name with a cursor and only fetches document keys.
+    Returns the number of documents.
+    """
+    total = 0
+    last_doc = None
+    while True:
+        query = collection_ref.order_by("__name__").limit(batch_size).select([])
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        if not docs:
+            break
+        if not dry_run:
+            batch = db.batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            batch.commit()
+        total += len(docs)
+        if progress is not None:
+            progress.add(documents=len(docs), commits=0 if dry_run else 1)
+        if len(docs) < batch_size:
+            break
+        last_doc = docs[-1]
+    return total
+
+
+def purge_conversation(db, phone_number, dry_run=False, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """Delete a conversation's messages and its parent document; returns the message count"""
+    conv_ref = db.collection("conversations").document(phone_number)
+    count = purge_collection(db, conv_ref.collection("messages"), dry_run, batch_size, progress)
+    if not dry_run:
+        conv_ref.delete()
+    if progress is not None:
+        progress.add(conversations=1)
+    return count
+
+
+def _last_activity(conv_ref):
+    from firebase_admin import firestore
+
+    query = conv_ref.collection("messages").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(1)
+    for doc in query.stream():
+        return doc.to_dict().get("timestamp")
+    return None
+
+
+def purge_all_conversations(db, dry_run=False, workers=PURGE_WORKERS, batch_size=PURGE_BATCH_SIZE,
+                            older_than_days=None, quiet=False):
+    """
+    Purge every conversation (or only those idle for older_than_days) concurrently.
+    Returns the progress summary: conversations, documents, commits, elapsed_s, docs_per_s.
+    """
+    progress = PurgeProgress(dry_run=dry_run, quiet=quiet)
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days) if older_than_days else None
+
+    def purge_one(conv_ref):
+        if cutoff is not None:
+            last = _last_activity(conv_ref)
+            if last is not None and last >= cutoff:
+                return 0
+        return purge_conversation(db, conv_ref.id, dry_run, batch_size, progress)
+
+    # list_documents also finds conversations whose parent document was never written
+    conversation_refs = db.collection("conversations").list_documents(page_size=batch_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() submits its whole input up front, so feed it a few rounds of work at a time
+        # instead of a future per conversation in the database
+        while True:
+            chunk = list(islice(conversation_refs, workers * 4))
+            if not chunk:
+                break
+            # Results come back in order; errors surface here instead of being dropped
+            for _ in pool.map(purge_one, chunk):
+                pass
+    return progress.summary()
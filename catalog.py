@@ -0,0 +1,185 @@
+"""
+Product catalog with fast fuzzy lookup
+Loaded once from CATALOG_PATH (JSON or CSV). Used to canonicalize product names
+coming out of order extraction and to answer plain price/availability questions
+without an LLM round trip.
+
+Opt-in: without CATALOG_PATH the catalog is empty, so product names are left as
+the customer wrote them and price questions go to the LLM. catalog.example.json
+shows the format; its prices are placeholders, not real ones.
+"""
+
+import os
+import re
+import csv
+import json
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "")  # unset: no catalog
+CATALOG_EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), "catalog.example.json")
+# Minimum trigram similarity (0-1) for a fuzzy match
+CATALOG_MATCH_THRESHOLD = float(os.getenv("CATALOG_MATCH_THRESHOLD", "0.55"))
+# Reject a fuzzy match when the runner-up product scores within this margin
+CATALOG_AMBIGUITY_MARGIN = float(os.getenv("CATALOG_AMBIGUITY_MARGIN", "0.1"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_name(name):
+    """'Salmon, King ' / 'king salmons' -> 'king salmon' (lowercase, singular, sorted words)"""
+    words = []
+    for word in _WORD.findall(name.lower()):
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(sorted(words))
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Catalog:
+    def __init__(self, products):
+        """products: list of {name, aliases, price_per_lb, available}"""
+        self.products = products
+        self._by_product = {product["name"]: product for product in products}
+        self._by_name = {}    # normalized name/alias -> product
+        self._by_gram = {}    # trigram -> set of normalized names
+        for product in products:
+            for name in [product["name"]] + list(product.get("aliases", [])):
+                key = normalize_name(name)
+                if not key or key in self._by_name:
+                    continue
+                self._by_name[key] = product
+                for gram in _trigrams(key):
+                    self._by_gram.setdefault(gram, set()).add(key)
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH):
+        if not path:
+            return cls([])
+        if not os.path.exists(path):
+            print(f"⚠️  CATALOG_PATH {path} not found; running without a catalog")
+            return cls([])
+        if path.endswith(".csv"):
+            with open(path, newline="") as f:
+                products = []
+                for row in csv.DictReader(f):
+                    products.append({
+                        "name": row["name"],
+                        "aliases": [a.strip() for a in row.get("aliases", "").split("|") if a.strip()],
+                        "price_per_lb": float(row["price_per_lb"]) if row.get("price_per_lb") else None,
+                        "available": row.get("available", "true").strip().lower() in ("true", "yes", "1"),
+                    })
+        else:
+            with open(path) as f:
+                products = json.load(f)
+        return cls(products)
+
+    def match(self, name):
+        """Best catalog product for a free-text name, or None if nothing is close enough"""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self._by_name:
+            return self._by_name[key]
+
+        # Count shared trigrams per candidate, then score with the Dice coefficient
+        grams = _trigrams(key)
+        shared = {}
+        for gram in grams:
+            for candidate in self._by_gram.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        scores = {}  # product name -> best score over its name and aliases
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + len(_trigrams(candidate)))
+            product_name = self._by_name[candidate]["name"]
+            scores[product_name] = max(score, scores.get(product_name, 0.0))
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        if not ranked or ranked[0][1] < CATALOG_MATCH_THRESHOLD:
+            return None
+        # A generic name ("salmon") that fits several products equally well stays as-is
+        if len(ranked) > 1 and ranked[1][1] >= ranked[0][1] - CATALOG_AMBIGUITY_MARGIN:
+            return None
+        return self._by_product[ranked[0][0]]
+
+    def canonicalize_items(self, items):
+        """Replace free-text product names with catalog names where there's a match"""
+        canonical = []
+        for item in items or []:
+            item = dict(item)
+            product = self.match(str(item.get("product", "")))
+            if product is not None:
+                item["product"] = product["name"]
+            canonical.append(item)
+        return canonical
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """The shared catalog, loaded on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog.load()
+        return _catalog
+
+
+def set_catalog(catalog):
+    """Use `catalog` from now on (tests, or after reloading the file); None reloads CATALOG_PATH on next use"""
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog
+
+
+def canonicalize_order(order):
+    """Return the order with its item names canonicalized against the catalog"""
+    if not order or not isinstance(order.get("items"), list):
+        return order
+    order = dict(order)
+    order["items"] = get_catalog().canonicalize_items(order["items"])
+    return order
+
+
+# Plain price / availability questions, with the product name in the `product` group
+_QUESTION_PATTERNS = [
+    re.compile(r"^(?:how much|what(?:'s| is| are)? the price|what(?:'s| is| are)? the cost|price|cost)\s+(?:is|are|for|of|does|do)?\s*(?:the\s+|your\s+)?(?P<product>.+?)(?:\s+(?:cost|go for|going for|per (?:lb|pound)|a (?:lb|pound)|right now|today))*$"),
+    re.compile(r"^(?:what(?:'s| is| are)?|how much(?:'s| is| are)?)\s+(?:the\s+|your\s+)?(?P<product>.+?)\s+(?:going for|go for|cost|priced at|per (?:lb|pound)|a (?:lb|pound))(?:\s+(?:right now|today))?$"),
+    re.compile(r"^(?:do you|you) (?:have|got|carry|sell) (?:any\s+)?(?P<product>.+?)(?:\s+(?:right now|today|in stock|available))*$"),
+    re.compile(r"^(?:is|are) (?:the\s+|your\s+)?(?P<product>.+?) (?:available|in stock|in season)(?:\s+(?:right now|today))?$"),
+    re.compile(r"^(?:any|got any)\s+(?P<product>.+?)(?:\s+(?:right now|today|in stock|available))*$"),
+]
+_GREETING = re.compile(r"^(?:hi|hey|hello|yo)(?:\s+there)?[\s,!.]+")
+
+
+def answer_product_question(message):
+    """
+    Answer a plain price/availability question from the catalog.
+    Returns the reply text, or None if the message isn't one (or the product is unknown).
+    """
+    text = message.strip().lower()
+    text = _GREETING.sub("", text)
+    text = re.sub(r"[?!.]+$", "", text).strip()
+    for pattern in _QUESTION_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        product = get_catalog().match(match.group("product"))
+        if product is None:
+            return None
+        name = product["name"]
+        if not product.get("available", True):
+            return f"Sorry, we're out of {name} right now. Anything else I can get you?"
+        price = product.get("price_per_lb")
+        if price is None:
+            return f"Yep, we've got {name}! How much do you need?"
+        return f"{name} is ${price:.2f}/lb right now. How much do you need?"
+    return None
@@ -5,10 +5,15 @@ Interactive terminal demo for testing the SMS chatbot order flow
 """
 
 import sys
+import time
 from datetime import datetime
-from firebase_logic import store_message, get_messages, clear_conversation
-from openai_logic import generate_ai_reply, parse_order_from_conversation, is_order_complete, generate_order_confirmation_message, check_for_confirmation
+from firebase_logic import store_turn, clear_conversation
+from openai_logic import is_order_complete, generate_order_confirmation_message, check_for_confirmation, generate_reply_and_order, stream_ai_reply, COMBINED_TURN
 from sheets_logic import process_confirmed_order
+from order_state import get_order_state, update_order_state, record_order_state, reset_order_state
+from response_cache import get_response_cache_stats
+from llm_client import get_llm_stats
+from llm_usage import get_usage_stats
 
 def print_separator():
     print("═" * 60)
@@ -22,6 +27,37 @@ def print_message(sender, message, timestamp=None):
     else:
         print(f"[{timestamp}] 🤖 Bot: {message}")
 
+def stream_bot_message(chunks):
+    """Print a streamed bot reply as it arrives; returns the full text"""
+    timestamp = datetime.now().strftime("%H:%M")
+    print(f"[{timestamp}] 🤖 Bot: ", end="", flush=True)
+    parts = []
+    for chunk in chunks:
+        print(chunk, end="", flush=True)
+        parts.append(chunk)
+    print()
+    return "".join(parts).strip()
+
+def print_turn_timing(turn_latencies, reply_timings=None):
+    """Average end-to-end turn latency, for comparing COMBINED_TURN on/off"""
+    if turn_latencies:
+        mode = "combined" if COMBINED_TURN else "two-call"
+        average = sum(turn_latencies) / len(turn_latencies)
+        print(f"⏱️  Average turn latency ({mode}): {average:.2f}s over {len(turn_latencies)} turns")
+    if reply_timings:
+        ttft = sum(t["ttft_ms"] for t in reply_timings) / len(reply_timings)
+        total = sum(t["total_ms"] for t in reply_timings) / len(reply_timings)
+        print(f"⚡ Streamed replies: first text after {ttft:.0f} ms, complete after {total:.0f} ms (average)")
+    cache = get_response_cache_stats()
+    if cache["hits"]:
+        print(f"💬 Reply cache: {cache['hits']} hits ({cache['hit_rate']:.0%}), ~{cache['saved_ms'] / 1000:.1f}s of LLM time saved")
+    llm_stats = get_llm_stats()
+    if llm_stats["retries"] or llm_stats["hedges"]:
+        print(f"🔁 LLM: {llm_stats['retries']} retries, {llm_stats['hedges']} hedged ({llm_stats['hedge_wins']} won), p95 {llm_stats['p95_ms']:.0f} ms")
+    usage = get_usage_stats()
+    if usage["calls"]:
+        print(f"🪙 Tokens: {usage['prompt_tokens']:,} prompt + {usage['completion_tokens']:,} completion over {usage['calls']} calls (${usage['cost_usd']:.4f})")
+
 def main():
     print_separator()
     print("🐟 SEAFOOD DISTRIBUTION SMS CHATBOT - DEMO")
@@ -35,8 +71,12 @@ def main():
     phone_number = "+1-555-DEMO"
     # Clear any existing history for this demo number
     clear_conversation(phone_number)
+    # The conversation starts empty, so it's kept here instead of being re-read every turn
+    history = []
     
     conversation_state = "chatting"  # chatting, confirming, confirmed
+    turn_latencies = []
+    reply_timings = []  # {ttft_ms, total_ms} per streamed reply
     
     while True:
         try:
@@ -44,16 +84,19 @@ def main():
             user_input = input("\n💬 Your message: ").strip()
             
             if user_input.lower() in ['quit', 'exit', 'q']:
+                print_turn_timing(turn_latencies, reply_timings)
                 print("\n👋 Thanks for testing the SMS chatbot!")
                 break
             
             if user_input.lower() == 'reset':
                 # Clear current conversation in Firebase
                 clear_conversation(phone_number)
+                reset_order_state(phone_number)
                 
                 # Generate a new phone number to start fresh
                 import random
                 phone_number = f"+1-555-DEMO{random.randint(100, 999)}"
+                history = []
                 conversation_state = "chatting"
                 print(f"\n🔄 Conversation reset! New session started.")
                 print_separator()
@@ -62,16 +105,16 @@ def main():
             if not user_input:
                 continue
             
-            # Store the user message
-            store_message(phone_number, user_input, "received")
+            # This turn's messages are stored together in one batched write at the end
+            turn_messages = [{"text": user_input, "direction": "received"}]
             
-            # Get conversation history
-            conversation_history = get_messages(phone_number)
+            # Get conversation history (including the new message)
+            conversation_history = history + turn_messages
             
             # Check if this is a confirmation
             if conversation_state == "confirming" and check_for_confirmation(user_input):
-                # Process the confirmed order
-                order_details = parse_order_from_conversation(conversation_history)
+                # Process the confirmed order (already parsed when we asked for confirmation)
+                order_details = get_order_state(phone_number) or update_order_state(phone_number, conversation_history)
                 
                 try:
                     process_confirmed_order(phone_number, order_details)
@@ -80,38 +123,59 @@ def main():
                 except Exception as e:
                     ai_response = "✅ Your order has been confirmed! However, there was a technical issue saving it to our spreadsheet. Don't worry - we have your order details and will process it manually."
                 
-                store_message(phone_number, ai_response, "sent")
+                turn_messages.append({"text": ai_response, "direction": "sent"})
+                store_turn(phone_number, turn_messages)
                 print_message("Bot", ai_response)
+                reset_order_state(phone_number)
                 
                 # Auto-reset after order confirmation
                 import random
                 phone_number = f"+1-555-DEMO{random.randint(100, 999)}"
+                history = []
                 conversation_state = "chatting"
                 print(f"\n🔄 Ready for next customer! (Session auto-reset)")
                 print_separator()
                 continue
             
-            # Generate AI response
-            ai_response = generate_ai_reply(user_input, conversation_history)
-            store_message(phone_number, ai_response, "sent")
-            print_message("Bot", ai_response)
+            turn_started = time.perf_counter()
+            if COMBINED_TURN:
+                # One call returns both the reply and the order
+                ai_response, order_details = generate_reply_and_order(
+                    user_input, conversation_history, previous_order=get_order_state(phone_number),
+                    phone_number=phone_number
+                )
+                record_order_state(phone_number, conversation_history, order_details)
+                print_message("Bot", ai_response)
+            else:
+                # Generate AI response, shown as it streams in
+                timing = {}
+                ai_response = stream_bot_message(
+                    stream_ai_reply(user_input, conversation_history, phone_number=phone_number, timing=timing)
+                )
+                reply_timings.append(timing)
+            turn_messages.append({"text": ai_response, "direction": "sent"})
             
             # Check if we have a complete order to confirm
             if conversation_state == "chatting":
-                order_details = parse_order_from_conversation(conversation_history)
+                if not COMBINED_TURN:
+                    order_details = update_order_state(phone_number, conversation_history)
                 
                 if order_details and is_order_complete(order_details):
                     # Generate confirmation message
                     confirmation_msg = generate_order_confirmation_message(order_details, phone_number)
-                    store_message(phone_number, confirmation_msg, "sent")
+                    turn_messages.append({"text": confirmation_msg, "direction": "sent"})
                     
                     print("\n" + "─" * 60)
                     print_message("Bot", confirmation_msg)
                     print("─" * 60)
                     
                     conversation_state = "confirming"
+            store_turn(phone_number, turn_messages, metadata={"awaiting_confirmation": conversation_state == "confirming"})
+            history += turn_messages
+            turn_latencies.append(time.perf_counter() - turn_started)
         
         except KeyboardInterrupt:
+            print_turn_timing(turn_latencies, reply_timings)
             print("\n\n👋 Demo interrupted. Goodbye!")
             break
         except Exception as e:
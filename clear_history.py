@@ -1,46 +1,49 @@
 #!/usr/bin/env python3
 """
-Clear All Conversation History from Firebase
+Clear All Conversation History from Firebase (or the local SQLite store)
 Use this to completely reset all stored conversations
+
+Usage: python clear_history.py [--dry-run] [--workers N] [--older-than-days D]
 """
 
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
+from clients import get_firestore
+from bulk_purge import purge_all_conversations, PurgeProgress, PURGE_WORKERS
+from store_config import CONVERSATION_STORE
+from sqlite_store import get_sqlite_store
 
-def clear_all_conversations():
-    # Initialize Firebase if not already done
-    if not firebase_admin._apps:
-        firebase_json_path = os.path.join(os.path.dirname(__file__), "firebase.json")
-        cred = credentials.Certificate(firebase_json_path)
-        firebase_admin.initialize_app(cred)
-    
-    db = firestore.client()
-    
-    # Get all conversation documents
-    conversations_ref = db.collection('conversations')
-    conversations = conversations_ref.stream()
+def clear_all_conversations(dry_run=False, workers=PURGE_WORKERS, older_than_days=None):
+    # Clear the store the app is configured for (CONVERSATION_STORE)
+    if CONVERSATION_STORE == "sqlite":
+        store = get_sqlite_store()
+        progress = PurgeProgress(dry_run=dry_run)
+        store.purge_conversations(dry_run=dry_run, older_than_days=older_than_days, progress=progress)
+        summary = progress.summary()
+        where = f"the SQLite store ({store.path})"
+    else:
+        # Batched deletes, conversations purged in parallel
+        summary = purge_all_conversations(
+            get_firestore(), dry_run=dry_run, workers=workers, older_than_days=older_than_days
+        )
+        where = "Firebase"
     
-    deleted_count = 0
-    
-    for conversation in conversations:
-        phone_number = conversation.id
-        print(f"Deleting conversation for: {phone_number}")
-        
-        # Delete all messages in this conversation
-        messages_ref = conversation.reference.collection('messages')
-        messages = messages_ref.stream()
-        
-        for message in messages:
-            message.reference.delete()
-        
-        # Delete the conversation document itself
-        conversation.reference.delete()
-        deleted_count += 1
-    
-    print(f"\n✅ Cleared {deleted_count} conversation(s) from Firebase")
+    if dry_run:
+        print(f"\n🔍 Dry run: would clear {summary['conversations']} conversation(s) "
+              f"with {summary['documents']:,} message(s) from {where}")
+    else:
+        print(f"\n✅ Cleared {summary['conversations']} conversation(s) "
+              f"({summary['documents']:,} messages, {summary['commits']:,} commits) from {where}")
+    print(f"⏱️  {summary['elapsed_s']}s, {summary['docs_per_s']:,} docs/s")
+    return summary
 
 if __name__ == "__main__":
-    print("🗑️  Clearing all conversation history from Firebase...")
-    clear_all_conversations()
-    print("Done!") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clear conversation history from Firebase (or CONVERSATION_STORE=sqlite)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be deleted")
+    parser.add_argument("--workers", type=int, default=PURGE_WORKERS, help="Conversations purged in parallel")
+    parser.add_argument("--older-than-days", type=int, default=None,
+                        help="Only clear conversations with no messages in this many days")
+    args = parser.parse_args()
+    
+    print(f"🗑️  Clearing all conversation history ({CONVERSATION_STORE})...")
+    clear_all_conversations(args.dry_run, args.workers, args.older_than_days)
+    print("Done!")
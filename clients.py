@@ -0,0 +1,340 @@
+"""
+Shared, lazily created API clients
+Firestore, Sheets, Drive and OpenAI clients are built on first use and then
+reused, so importing a module that might need them costs nothing. Sheets and
+Drive are built from the discovery documents bundled with google-api-python-client
+instead of fetching them over the network.
+
+httplib2 isn't thread-safe, so the Sheets and Drive services share a pool of
+authorized transports (GoogleHttpPool) and each request borrows one of its own;
+the credentials behind them are refreshed by one thread at a time. A forked
+child (gunicorn --preload, multiprocessing) drops the clients it inherited and
+builds its own on first use.
+"""
+
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FIREBASE_JSON_PATH = os.path.join(os.path.dirname(__file__), "firebase.json")
+SERVICE_ACCOUNT_FILE = os.path.join(os.path.dirname(__file__), "google-service-account.json")
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# GOOGLE_API_ENDPOINT=http://127.0.0.1:PORT: send Sheets/Drive calls to a local stand-in (tests/standins.py)
+GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+
+# Idle Sheets/Drive transports kept for reuse; busy threads beyond this get a throwaway one
+GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "8"))
+
+# WARM_UP_CLIENTS=firestore,sheets,openai: clients to create (and connect) at startup
+WARM_UP_CLIENTS = [name.strip() for name in os.getenv("WARM_UP_CLIENTS", "").split(",") if name.strip()]
+
+_clients = {}
+_installed = set()  # names set with set_client, kept across a fork
+_lock = threading.RLock()
+# Seconds spent creating each client, for the cold-start benchmark
+init_times = {}
+_firebase_pid = None  # process that initialized the firebase_admin app
+
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _clients:
+            start = time.perf_counter()
+            _clients[name] = factory()
+            init_times[name] = time.perf_counter() - start
+        return _clients[name]
+
+
+def _create_firestore():
+    global _firebase_pid
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # Initialize Firebase only once
+    if not firebase_admin._apps:
+        cred = credentials.Certificate(FIREBASE_JSON_PATH)
+        firebase_admin.initialize_app(cred)
+        _firebase_pid = os.getpid()
+    if _firebase_pid is not None and _firebase_pid != os.getpid():
+        # Forked after the app was set up: firebase_admin would hand back the parent's
+        # client and its gRPC channel, so open a new one with the same credentials
+        from google.cloud import firestore as gcloud_firestore
+        app = firebase_admin.get_app()
+        return gcloud_firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+    return firestore.client()
+
+
+class SharedCredentials:
+    """
+    Credentials shared by every pooled transport. Only one thread refreshes an
+    expired (or rejected) token; the others wait for it and reuse the new one.
+    """
+
+    def __init__(self, credentials):
+        self._credentials = credentials
+        self._refresh_lock = threading.Lock()
+        self.refreshes = 0
+
+    def __getattr__(self, name):
+        return getattr(self._credentials, name)
+
+    def refresh(self, request):
+        stale_token = self._credentials.token
+        with self._refresh_lock:
+            # Skip it if another thread got a new token while this one waited
+            if self._credentials.token == stale_token or not self._credentials.valid:
+                self._credentials.refresh(request)
+                self.refreshes += 1
+
+    def before_request(self, request, method, url, headers):
+        if not self._credentials.valid:
+            self.refresh(request)
+        self._credentials.before_request(request, method, url, headers)
+
+
+def _create_google_credentials():
+    from google.oauth2 import service_account as gservice_account
+
+    if GOOGLE_API_ENDPOINT:
+        from google.auth.credentials import AnonymousCredentials
+        return AnonymousCredentials()
+
+    return SharedCredentials(
+        gservice_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    )
+
+
+def _new_authorized_http(credentials):
+    import google_auth_httplib2
+    from googleapiclient.http import build_http
+
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+
+
+class GoogleHttpPool:
+    """
+    Stands in for the httplib2.Http of a googleapiclient service, so one service
+    object can be used from any number of threads: each request borrows an
+    authorized transport nobody else is using. Up to `size` idle transports are
+    kept for their keep-alive connections.
+    """
+
+    def __init__(self, credentials, size=GOOGLE_HTTP_POOL_SIZE, http_factory=_new_authorized_http):
+        self.credentials = credentials
+        self.size = size
+        self._http_factory = http_factory
+        self._idle = []  # LIFO: the most recently used connection is the likeliest to still be open
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.created = 0
+        self.discarded = 0  # transports closed after an error or with the pool already full
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _acquire(self):
+        with self._lock:
+            self.requests += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if self._idle:
+                return self._idle.pop()
+            self.created += 1
+        try:
+            return self._http_factory(self.credentials)
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+                self.created -= 1
+            raise
+
+    def _release(self, http, reusable):
+        with self._lock:
+            self.in_use -= 1
+            if reusable and len(self._idle) < self.size:
+                self._idle.append(http)
+                return
+            self.discarded += 1
+        http.close()
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        http = self._acquire()
+        reusable = False
+        try:
+            response = http.request(uri, method, *args, **kwargs)
+            reusable = True
+            return response
+        finally:
+            # After an error the connection may be half-used; don't hand it to anyone else
+            self._release(http, reusable)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for http in idle:
+            http.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "transports": self.created,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "discarded": self.discarded,
+                "token_refreshes": getattr(self.credentials, "refreshes", 0),
+            }
+
+
+def _build(service, version):
+    from googleapiclient.discovery import build
+
+    # static_discovery: use the bundled discovery document, no HTTP fetch
+    client_options = {"api_endpoint": GOOGLE_API_ENDPOINT} if GOOGLE_API_ENDPOINT else None
+    return build(service, version, http=get_google_http(),
+                 static_discovery=True, cache_discovery=False, client_options=client_options)
+
+
+def _create_openai():
+    import httpx
+    from openai import OpenAI
+
+    # One keep-alive pool shared by every thread; llm_client does the retrying
+    max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    http_client = httpx.Client(limits=httpx.Limits(
+        max_connections=max_connections, max_keepalive_connections=max_connections
+    ))
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client, max_retries=0)
+
+
+def get_firestore():
+    return _get("firestore", _create_firestore)
+
+
+def get_google_credentials():
+    return _get("google_credentials", _create_google_credentials)
+
+
+def get_google_http():
+    """The transport pool behind the Sheets and Drive services"""
+    return _get("google_http", lambda: GoogleHttpPool(get_google_credentials()))
+
+
+def get_google_http_stats():
+    pool = _clients.get("google_http")
+    return pool.stats() if isinstance(pool, GoogleHttpPool) else {}
+
+
+def get_sheets_service():
+    return _get("sheets", lambda: _build("sheets", "v4"))
+
+
+def get_drive_service():
+    return _get("drive", lambda: _build("drive", "v3"))
+
+
+def get_openai_client():
+    return _get("openai", _create_openai)
+
+
+def _warm_firestore():
+    # The gRPC channel connects on the first call; a missing document is one cheap read
+    get_firestore().collection("conversations").document("_warmup").get()
+
+
+def _warm_google():
+    from google.auth.transport.requests import Request
+
+    if GOOGLE_API_ENDPOINT:
+        return  # Stand-ins take no token
+    # Fetch the OAuth token now instead of on the first Sheets/Drive call
+    get_google_credentials().refresh(Request())
+
+
+def _warm_openai():
+    get_openai_client().models.list()
+
+
+_WARMERS = {
+    "firestore": _warm_firestore,
+    "sheets": lambda: (get_sheets_service(), _warm_google()),
+    "drive": lambda: (get_drive_service(), _warm_google()),
+    "openai": _warm_openai,
+}
+
+
+def warm_up(names=None, background=False):
+    """
+    Create the named clients and open their connections ahead of the first request.
+    Failures are printed, not raised: warm-up is only an optimization.
+    """
+    names = WARM_UP_CLIENTS if names is None else names
+
+    def run():
+        for name in names:
+            warmer = _WARMERS.get(name)
+            if warmer is None:
+                print(f"⚠️ Unknown client to warm up: {name}")
+                continue
+            start = time.perf_counter()
+            try:
+                warmer()
+                print(f"🔥 Warmed up {name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+            except Exception as e:
+                print(f"⚠️ Warm-up of {name} failed: {e}")
+
+    if background:
+        thread = threading.Thread(target=run, name="client-warmup", daemon=True)
+        thread.start()
+        return thread
+    run()
+    return None
+
+
+def set_client(name, client):
+    """Use `client` for `name` from now on (fakes for tests, record/replay); None goes back to the real one"""
+    with _lock:
+        if client is None:
+            _clients.pop(name, None)
+            _installed.discard(name)
+            init_times.pop(name, None)
+            return
+        _clients[name] = client
+        _installed.add(name)
+        init_times[name] = 0.0
+
+
+def reset_clients():
+    """Drop every cached client (tests, or after credentials change)"""
+    with _lock:
+        _clients.clear()
+        _installed.clear()
+        init_times.clear()
+
+
+def _after_fork_in_child():
+    global _lock
+    # The parent's locks may have been held by threads that don't exist here, and its
+    # sockets and gRPC channels are shared with it: start over, keeping installed fakes
+    _lock = threading.RLock()
+    for name in list(_clients):
+        if name not in _installed:
+            del _clients[name]
+            init_times.pop(name, None)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,127 @@
+"""
+In-process LRU + TTL cache of recent conversations, keyed by phone number
+Sits in front of firebase_logic.get_messages so steady-state turns don't re-read Firestore.
+Writes are only seen by the process that made them, so every lookup is checked against
+the conversation's stored message_count (the conversation head): a conversation another
+process (gunicorn worker, clear_history, a demo) wrote to since is a miss.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "1000"))  # phone numbers
+CONVERSATION_CACHE_TTL = float(os.getenv("CONVERSATION_CACHE_TTL", "900"))  # seconds
+CONVERSATION_CACHE_TAIL = int(os.getenv("CONVERSATION_CACHE_TAIL", "100"))  # messages per phone
+
+
+class ConversationCache:
+    """
+    Each entry holds the most recent `tail` messages of one conversation.
+    An entry is `complete` when it holds the whole conversation, so callers
+    asking for the full history can be answered from it too, and knows the
+    conversation's message count, so lookups can tell it has gone stale.
+    """
+
+    def __init__(self, max_conversations=CONVERSATION_CACHE_SIZE, ttl=CONVERSATION_CACHE_TTL, tail=CONVERSATION_CACHE_TAIL):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self.tail = tail
+        self._entries = OrderedDict()  # phone -> {"messages", "complete", "count", "expires"}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    def _live_entry(self, phone_number):
+        entry = self._entries.get(phone_number)
+        if entry is None:
+            return None
+        if entry["expires"] <= time.monotonic():
+            del self._entries[phone_number]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(phone_number)
+        return entry
+
+    def get(self, phone_number, limit=None, message_count=None):
+        """
+        Return copies of the cached messages, or None on a miss.
+        message_count: the conversation's stored count; an entry that doesn't match is dropped
+        """
+        with self._lock:
+            entry = self._live_entry(phone_number)
+            if entry is not None and message_count is not None and entry["count"] != message_count:
+                del self._entries[phone_number]
+                self.stale += 1
+                entry = None
+            usable = entry is not None and (
+                entry["complete"] or (limit is not None and limit <= len(entry["messages"]))
+            )
+            if not usable:
+                self.misses += 1
+                return None
+            self.hits += 1
+            messages = entry["messages"]
+            if limit is not None:
+                messages = messages[-limit:] if limit > 0 else []
+            return [dict(msg) for msg in messages]
+
+    def put(self, phone_number, messages, complete, message_count=None):
+        """Cache the tail of a conversation fetched from Firestore (message_count: its stored count)"""
+        with self._lock:
+            messages = [dict(msg) for msg in messages]
+            if len(messages) > self.tail:
+                messages = messages[-self.tail:]
+                complete = False
+            self._entries[phone_number] = {
+                "messages": messages,
+                "complete": complete,
+                "count": message_count,
+                "expires": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(phone_number)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def append(self, phone_number, message):
+        """Write-through: add a newly stored message to a cached conversation"""
+        with self._lock:
+            entry = self._live_entry(phone_number)
+            if entry is None:
+                return
+            entry["messages"].append(dict(message))
+            if entry["count"] is not None:
+                entry["count"] += 1
+            if len(entry["messages"]) > self.tail:
+                del entry["messages"][0]
+                entry["complete"] = False
+            entry["expires"] = time.monotonic() + self.ttl
+
+    def invalidate(self, phone_number=None):
+        """Drop one conversation, or everything when phone_number is None"""
+        with self._lock:
+            if phone_number is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(phone_number, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "conversations": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale": self.stale,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
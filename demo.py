@@ -6,19 +6,26 @@ Simulates the full conversation flow without needing a real phone number
 
 import sys
 import os
+import time
 from datetime import datetime, timezone
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from firebase_logic import store_message, get_messages
+from firebase_logic import store_message, store_turn, get_conversation_head
 from openai_logic import (
-    generate_ai_reply, 
     parse_order_from_conversation, 
     is_order_complete,
     generate_order_confirmation_message,
-    check_for_confirmation
+    check_for_confirmation,
+    generate_reply_and_order,
+    stream_ai_reply,
+    COMBINED_TURN
 )
+from order_state import get_order_state, update_order_state, record_order_state, reset_order_state
+from response_cache import get_response_cache_stats
+from llm_client import get_llm_stats
+from llm_usage import get_usage_stats
 
 class SMSDemo:
     def __init__(self):
@@ -26,6 +33,8 @@ class SMSDemo:
         self.conversation_history = []
         self.current_order = None
         self.awaiting_confirmation = False
+        self.turn_latencies = []
+        self.reply_timings = []  # {ttft_ms, total_ms} per streamed reply
         
     def start_demo(self):
         print("🐟 SMS Seafood Chatbot Demo")
@@ -34,6 +43,7 @@ class SMSDemo:
         print("Type your messages as if you're texting the business.")
         print("Commands: 'quit', 'history', 'parse', 'order', 'reset'")
         print("-" * 40)
+        self.resume_pending_order()
         
         while True:
             try:
@@ -41,6 +51,7 @@ class SMSDemo:
                 user_message = input("\n📱 You: ").strip()
                 
                 if user_message.lower() == 'quit':
+                    self.show_turn_timing()
                     print("👋 Demo ended!")
                     break
                 elif user_message.lower() == 'history':
@@ -64,34 +75,53 @@ class SMSDemo:
                     self.awaiting_confirmation = False
                     continue
                 
-                # Store user message
-                store_message(self.phone_number, user_message, "received")
-                self.conversation_history.append({"direction": "received", "text": user_message})
+                # The user message is stored together with our reply in one batched write
+                user_entry = {"direction": "received", "text": user_message}
+                self.conversation_history.append(user_entry)
                 
-                # Check if we should show order confirmation
-                order_details = parse_order_from_conversation(self.conversation_history)
+                turn_started = time.perf_counter()
+                if COMBINED_TURN:
+                    # One call returns both the reply and the order
+                    print("🤖 AI is thinking...")
+                    ai_response, order_details = generate_reply_and_order(
+                        user_message,
+                        self.conversation_history,
+                        previous_order=get_order_state(self.phone_number),
+                        phone_number=self.phone_number
+                    )
+                    record_order_state(self.phone_number, self.conversation_history, order_details)
+                else:
+                    # Check if we should show order confirmation (only new messages are parsed)
+                    order_details = update_order_state(self.phone_number, self.conversation_history)
+                    ai_response = None
+
                 if order_details and is_order_complete(order_details) and not self.awaiting_confirmation:
                     # Show confirmation instead of generating AI response
                     self.current_order = order_details
                     confirmation_msg = generate_order_confirmation_message(order_details, self.phone_number)
                     
-                    store_message(self.phone_number, confirmation_msg, "sent")
-                    self.conversation_history.append({"direction": "sent", "text": confirmation_msg})
+                    reply_entry = {"direction": "sent", "text": confirmation_msg}
+                    # Kept on the conversation head, so a restart still knows we asked
+                    store_turn(self.phone_number, [user_entry, reply_entry], metadata={"awaiting_confirmation": True})
+                    self.conversation_history.append(reply_entry)
                     
                     print(f"🤖 Business:\n{confirmation_msg}")
                     self.awaiting_confirmation = True
                 else:
-                    # Generate normal AI response
-                    print("🤖 AI is thinking...")
-                    ai_response = generate_ai_reply(user_message, self.conversation_history)
-                    
-                    # Store AI response
-                    store_message(self.phone_number, ai_response, "sent")
-                    self.conversation_history.append({"direction": "sent", "text": ai_response})
+                    if ai_response is None:
+                        # Stream the normal AI response as it's generated
+                        ai_response = self.stream_reply(user_message)
+                    else:
+                        print(f"🤖 Business: {ai_response}")
                     
-                    print(f"🤖 Business: {ai_response}")
+                    # Store user message and AI response
+                    reply_entry = {"direction": "sent", "text": ai_response}
+                    store_turn(self.phone_number, [user_entry, reply_entry])
+                    self.conversation_history.append(reply_entry)
+                self.turn_latencies.append(time.perf_counter() - turn_started)
                 
             except KeyboardInterrupt:
+                self.show_turn_timing()
                 print("\n👋 Demo ended!")
                 break
             except Exception as e:
@@ -99,6 +129,19 @@ class SMSDemo:
                 import traceback
                 traceback.print_exc()
     
+    def resume_pending_order(self):
+        """Pick up an order that was waiting for confirmation when the last session ended"""
+        try:
+            head = get_conversation_head(self.phone_number)
+        except Exception as e:
+            print(f"⚠️  Couldn't load the conversation head: {e}")
+            return
+        order_state = head and head.get("order_state")
+        if head and head["awaiting_confirmation"] and order_state:
+            self.current_order = order_state["order"]
+            self.awaiting_confirmation = True
+            print("📋 An order from your last session is waiting for confirmation (type 'order' to see it).")
+    
     def process_order_confirmation(self):
         """Process confirmed order and send to Google Sheets"""
         print("\n✅ ORDER CONFIRMED!")
@@ -120,6 +163,7 @@ class SMSDemo:
             
             # Reset order state
             self.current_order = None
+            reset_order_state(self.phone_number)
             
         except Exception as e:
             error_msg = f"❌ Sorry, there was an error processing your order: {e}"
@@ -132,6 +176,39 @@ class SMSDemo:
             # Keep order state so customer can try again
             print("💡 Order state preserved - customer can try confirming again.")
     
+    def stream_reply(self, user_message):
+        """Print the AI reply chunk by chunk and return the full text"""
+        timing = {}
+        parts = []
+        print("🤖 Business: ", end="", flush=True)
+        for chunk in stream_ai_reply(user_message, self.conversation_history, phone_number=self.phone_number, timing=timing):
+            print(chunk, end="", flush=True)
+            parts.append(chunk)
+        print()
+        self.reply_timings.append(timing)
+        return "".join(parts).strip()
+    
+    def show_turn_timing(self):
+        """Average end-to-end turn latency, for comparing COMBINED_TURN on/off"""
+        if not self.turn_latencies:
+            return
+        mode = "combined" if COMBINED_TURN else "two-call"
+        average = sum(self.turn_latencies) / len(self.turn_latencies)
+        print(f"⏱️  Average turn latency ({mode}): {average:.2f}s over {len(self.turn_latencies)} turns")
+        if self.reply_timings:
+            ttft = sum(t["ttft_ms"] for t in self.reply_timings) / len(self.reply_timings)
+            total = sum(t["total_ms"] for t in self.reply_timings) / len(self.reply_timings)
+            print(f"⚡ Streamed replies: first text after {ttft:.0f} ms, complete after {total:.0f} ms (average)")
+        cache = get_response_cache_stats()
+        if cache["hits"]:
+            print(f"💬 Reply cache: {cache['hits']} hits ({cache['hit_rate']:.0%}), ~{cache['saved_ms'] / 1000:.1f}s of LLM time saved")
+        llm_stats = get_llm_stats()
+        if llm_stats["retries"] or llm_stats["hedges"]:
+            print(f"🔁 LLM: {llm_stats['retries']} retries, {llm_stats['hedges']} hedged ({llm_stats['hedge_wins']} won), p95 {llm_stats['p95_ms']:.0f} ms")
+        usage = get_usage_stats()
+        if usage["calls"]:
+            print(f"🪙 Tokens: {usage['prompt_tokens']:,} prompt + {usage['completion_tokens']:,} completion over {usage['calls']} calls (${usage['cost_usd']:.4f})")
+    
     def show_conversation_history(self):
         print("\n📜 Conversation History:")
         print("-" * 30)
@@ -154,7 +231,8 @@ class SMSDemo:
             print(f"   Delivery Address: {self.current_order.get('delivery_address', 'None')}")
             print("   Type 'CONFIRM' to place the order.")
         else:
-            order_details = parse_order_from_conversation(self.conversation_history)
+            # Already parsed this turn, so this is free unless the history changed
+            order_details = update_order_state(self.phone_number, self.conversation_history)
             if order_details:
                 print("📝 Partial order detected:")
                 print(f"   Items: {order_details.get('items', 'None')}")
@@ -177,7 +255,7 @@ class SMSDemo:
         
         try:
             # Parse order from conversation
-            order_details = parse_order_from_conversation(self.conversation_history)
+            order_details = parse_order_from_conversation(self.conversation_history, phone_number=self.phone_number)
             
             if order_details:
                 print("✅ Parsed Order Details:")
@@ -201,6 +279,7 @@ class SMSDemo:
         self.conversation_history = []
         self.current_order = None
         self.awaiting_confirmation = False
+        reset_order_state(self.phone_number)
         print("🔄 Conversation reset!")
 
 def main():
@@ -1,38 +1,331 @@
-import os
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
+import threading
+import time
+from itertools import groupby
+from datetime import datetime, timezone
+from conversation_cache import ConversationCache
+from bulk_purge import purge_conversation
+from clients import get_firestore
+from store_config import CONVERSATION_STORE, CONVERSATION_HEAD_SIZE
+from telemetry import span
+from llm_usage import usage_ledger
 
-# Initialize Firebase only once
-if not firebase_admin._apps:
-    firebase_json_path = os.path.join(os.path.dirname(__file__), "firebase.json")
-    cred = credentials.Certificate(firebase_json_path)
-    firebase_admin.initialize_app(cred)
+# Firestore is created on first use (see clients.py); `firebase_logic.db` still works
+def __getattr__(name):
+    if name == 'db':
+        return get_firestore()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-db = firestore.client()
+# Recent conversations kept in memory, updated write-through by store_message
+conversation_cache = ConversationCache()
+
+# CONVERSATION_STORE=sqlite: keep conversations in a local SQLite file instead of Firestore
+def _local_store():
+    if CONVERSATION_STORE != 'sqlite':
+        return None
+    from sqlite_store import get_sqlite_store
+    return get_sqlite_store()
+
+# Firestore round trips made by this module, so the per-turn cost is measurable
+rpc_stats = {'reads': 0, 'writes': 0}
+_rpc_lock = threading.Lock()
+
+def _count_rpc(kind, count=1):
+    with _rpc_lock:
+        rpc_stats[kind] += count
+
+def get_rpc_stats():
+    with _rpc_lock:
+        return dict(rpc_stats)
+
+# Client-side sequence numbers: strictly increasing within this process and
+# close to wall-clock order across processes, so ordering never depends on
+# SERVER_TIMESTAMP ties (messages committed in one batch share a timestamp)
+_last_seq = 0
+_seq_lock = threading.Lock()
+
+def _next_seq():
+    global _last_seq
+    with _seq_lock:
+        _last_seq = max(time.time_ns(), _last_seq + 1)
+        return _last_seq
+
+# Query order matching _message_sort_key: timestamp, then seq for messages sharing one.
+# Cursors (start_after / end_before) take both fields from the cursor document, so
+# pages split inside a batch of same-timestamp messages neither repeat nor skip any.
+# Needs the composite index in firestore.indexes.json. Firestore leaves documents without
+# a seq out of these queries, so conversations holding messages stored before seq existed
+# (no seq_ordered flag on the parent document) are ordered by timestamp alone until
+# backfill_seq.py has given them one
+def _ordered(query, direction=None, by_seq=True):
+    if not by_seq:
+        return query.order_by('timestamp') if direction is None else query.order_by('timestamp', direction=direction)
+    if direction is None:
+        return query.order_by('timestamp').order_by('seq')
+    return query.order_by('timestamp', direction=direction).order_by('seq', direction=direction)
+
+def _seq_ordered(phone_number):
+    """True once every message of the conversation has a seq"""
+    with span('firestore.get_conversation_head'):
+        doc = get_firestore().collection('conversations').document(phone_number).get()
+    _count_rpc('reads')
+    return doc.exists and bool((doc.to_dict() or {}).get('seq_ordered'))
+
+def backfill_seq(phone_number):
+    """Give messages stored without a seq one derived from their timestamp; returns how many"""
+    conv_ref = get_firestore().collection('conversations').document(phone_number)
+    if _seq_ordered(phone_number):
+        return 0
+    with span('firestore.backfill_seq'):
+        docs = list(conv_ref.collection('messages').order_by('timestamp').stream())
+    _count_rpc('reads')
+    missing = [doc for doc in docs if 'seq' not in (doc.to_dict() or {})]
+    for start in range(0, len(missing), 500):  # Firestore batch limit
+        batch = get_firestore().batch()
+        for offset, doc in enumerate(missing[start:start + 500], start):
+            ts = doc.to_dict().get('timestamp')
+            # The offset keeps messages that share a timestamp apart
+            batch.update(doc.reference, {'seq': (int(ts.timestamp() * 1e9) if ts else 0) + offset})
+        with span('firestore.backfill_seq'):
+            batch.commit()
+        _count_rpc('writes')
+    # Messages written from now on all get a seq, so the conversation stays ordered by it
+    with span('firestore.backfill_seq'):
+        conv_ref.set({'seq_ordered': True}, merge=True)
+    _count_rpc('writes')
+    return len(missing)
+
+def _message_sort_key(msg):
+    ts = msg.get('timestamp')
+    return (ts.timestamp() if ts else 0, msg.get('seq') or 0)
+
+# Store all of a turn's messages (and optional conversation-level metadata) in one commit
+# messages: list of {'text': ..., 'direction': 'sent' | 'received'}
+# metadata: fields merged into the parent conversations/{phone} document
+# The parent document also keeps the conversation head (see get_conversation_head),
+# updated in the same transaction as the messages
+def store_turn(phone_number, messages, metadata=None):
+    store = _local_store()
+    if store is not None:
+        store.store_turn(phone_number, messages, _next_seq, metadata)
+        return
+
+    from firebase_admin import firestore
+
+    db = get_firestore()
+    conv_ref = db.collection('conversations').document(phone_number)
+    # The cached copy and the head use the local clock in place of the server timestamp
+    now = datetime.now(timezone.utc)
+    stored = []
+    for msg in messages:
+        doc_ref = conv_ref.collection('messages').document()
+        message_data = {
+            'direction': msg['direction'],  # 'sent' or 'received'
+            'text': msg['text'],
+            'timestamp': firestore.SERVER_TIMESTAMP,
+            'seq': _next_seq()
+        }
+        stored.append((doc_ref, message_data))
+    head_entries = [{**data, 'timestamp': now, 'id': doc_ref.id} for doc_ref, data in stored]
+
+    # Retried on contention; the message ids and sequence numbers stay the same across attempts
+    @firestore.transactional
+    def commit(transaction):
+        snapshot = conv_ref.get(transaction=transaction)
+        _count_rpc('reads')
+        head = (snapshot.to_dict() or {}) if snapshot.exists else {}
+        fields = {}
+        if 'message_count' in head:
+            count = head['message_count']
+        else:
+            # First turn, or a conversation stored before heads existed: count it once
+            count = _count_messages(conv_ref)
+            if count == 0:
+                # A new conversation: all of its messages will have a seq
+                fields['seq_ordered'] = True
+        recent = (head.get('recent') or []) + head_entries
+        for doc_ref, message_data in stored:
+            transaction.set(doc_ref, message_data)
+        transaction.set(conv_ref, {
+            **(metadata or {}),
+            **fields,
+            'recent': recent[-CONVERSATION_HEAD_SIZE:] if CONVERSATION_HEAD_SIZE > 0 else [],
+            'message_count': count + len(stored),
+        }, merge=True)
+
+    with span('firestore.store_turn'):
+        commit(db.transaction())
+    _count_rpc('writes')
+
+    for entry in head_entries:
+        conversation_cache.append(phone_number, entry)
+
+def _count_messages(conv_ref):
+    with span('firestore.count_messages'):
+        result = conv_ref.collection('messages').count().get()
+    _count_rpc('reads')
+    return result[0][0].value
 
 # Store a message for a phone number
 # direction: 'sent' (from system) or 'received' (from user)
 def store_message(phone_number, text, direction):
-    message_data = {
-        'direction': direction,  # 'sent' or 'received'
-        'text': text,
-        'timestamp': firestore.SERVER_TIMESTAMP
-    }
-    db.collection('conversations').document(phone_number).collection('messages').add(message_data)
-
-# Retrieve all messages for a phone number, ordered by timestamp
-def get_messages(phone_number):
-    messages_ref = db.collection('conversations').document(phone_number).collection('messages')
-    query = messages_ref.order_by('timestamp')
-    docs = query.stream()
-    messages = []
-    for doc in docs:
-        data = doc.to_dict()
-        data['id'] = doc.id
-        messages.append(data)
+    store_turn(phone_number, [{'text': text, 'direction': direction}])
+
+def _doc_to_message(doc):
+    data = doc.to_dict()
+    data['id'] = doc.id
+    return data
+
+def _docs_to_messages(docs):
+    messages = [_doc_to_message(doc) for doc in docs]
+    _count_rpc('reads')
+    # Break timestamp ties with the client sequence number
+    messages.sort(key=_message_sort_key)
     return messages
 
+# Fetch only the newest `count` messages (returned oldest first)
+def _fetch_tail(phone_number, count, by_seq):
+    from firebase_admin import firestore
+
+    messages_ref = get_firestore().collection('conversations').document(phone_number).collection('messages')
+    query = _ordered(messages_ref, firestore.Query.DESCENDING, by_seq).limit(count)
+    # _docs_to_messages puts them back in chronological order
+    with span('firestore.get_messages'):
+        return _docs_to_messages(query.stream())
+
+def _fetch_all(phone_number, by_seq):
+    messages_ref = get_firestore().collection('conversations').document(phone_number).collection('messages')
+    with span('firestore.get_messages'):
+        return _docs_to_messages(_ordered(messages_ref, by_seq=by_seq).stream())
+
+# Retrieve messages for a phone number, ordered by timestamp
+# limit: only return the most recent `limit` messages (default: all of them)
+def get_messages(phone_number, limit=None):
+    store = _local_store()
+    if store is not None:
+        return store.get_messages(phone_number, limit)
+
+    # One document read: the head answers most turns by itself, and its message_count
+    # tells whether the cached copy has missed writes made by other processes
+    head = _read_head(phone_number)
+    if head is None:
+        # New conversation, or one not written to since heads were added: nothing to check a cached copy against
+        conversation_cache.invalidate(phone_number)
+        if limit is None:
+            return _fetch_all(phone_number, False)
+        return _fetch_tail(phone_number, limit, False) if limit > 0 else []
+
+    count = head['message_count']
+    cached = conversation_cache.get(phone_number, limit, count)
+    if cached is not None:
+        return cached
+
+    recent = head['recent']
+    if count <= len(recent) or (limit is not None and limit <= len(recent)):
+        messages = recent
+    elif limit is not None:
+        # Fetch just the tail, enough to answer the next turns from the cache too
+        messages = _fetch_tail(phone_number, max(limit, conversation_cache.tail), head['seq_ordered'])
+    else:
+        messages = _fetch_all(phone_number, head['seq_ordered'])
+    conversation_cache.put(phone_number, messages, len(messages) >= count, count)
+
+    if limit is not None:
+        return [dict(msg) for msg in messages[-limit:]] if limit > 0 else []
+    return [dict(msg) for msg in messages]
+
+# One page of messages for the /messages endpoint, oldest first
+# before / after: message ids to page from (exclusive); since: datetime lower bound
+# Returns (messages, has_more)
+def get_messages_page(phone_number, limit=50, before=None, after=None, since=None):
+    store = _local_store()
+    if store is not None:
+        return store.get_messages_page(phone_number, limit, before, after, since)
+
+    with span('firestore.messages_page'):
+        return _firestore_page(phone_number, limit, before, after, since)
+
+def _firestore_page(phone_number, limit, before, after, since):
+    messages_ref = get_firestore().collection('conversations').document(phone_number).collection('messages')
+    query = messages_ref
+    if since is not None:
+        query = query.where('timestamp', '>=', since)
+    query = _ordered(query, by_seq=_seq_ordered(phone_number))
+
+    if after is not None:
+        cursor = messages_ref.document(after).get()
+        _count_rpc('reads')
+        if not cursor.exists:
+            return [], False
+        query = query.start_after(cursor).limit(limit + 1)
+        messages = _docs_to_messages(query.stream())
+        has_more = len(messages) > limit
+        return messages[:limit], has_more
+
+    if before is not None:
+        cursor = messages_ref.document(before).get()
+        _count_rpc('reads')
+        if not cursor.exists:
+            return [], False
+        query = query.end_before(cursor)
+
+    # Newest page (or the page just before the cursor)
+    messages = _docs_to_messages(query.limit_to_last(limit + 1).get())
+    has_more = len(messages) > limit
+    return messages[-limit:] if limit else [], has_more
+
+# Stream every message without building the whole list in memory
+def stream_messages(phone_number, since=None):
+    store = _local_store()
+    if store is not None:
+        yield from store.stream_messages(phone_number, since)
+        return
+
+    messages_ref = get_firestore().collection('conversations').document(phone_number).collection('messages')
+    query = messages_ref
+    if since is not None:
+        query = query.where('timestamp', '>=', since)
+    by_seq = _seq_ordered(phone_number)
+    _count_rpc('reads')
+    with span('firestore.stream_messages'):
+        docs = _ordered(query, by_seq=by_seq).stream()
+        if by_seq:
+            for doc in docs:
+                yield _doc_to_message(doc)
+        else:
+            # Ordered by timestamp alone: put each run of same-timestamp messages in seq order
+            for _, run in groupby(docs, key=lambda doc: doc.to_dict().get('timestamp')):
+                yield from sorted((_doc_to_message(doc) for doc in run), key=_message_sort_key)
+
+def _read_head(phone_number):
+    with span('firestore.get_conversation_head'):
+        doc = get_firestore().collection('conversations').document(phone_number).get()
+    _count_rpc('reads')
+    data = (doc.to_dict() or {}) if doc.exists else {}
+    if 'message_count' not in data:
+        return None
+    return {
+        'recent': data.get('recent') or [],
+        'message_count': data['message_count'],
+        'order_state': data.get('order_state'),
+        'awaiting_confirmation': data.get('awaiting_confirmation', False),
+        'reply_pending': data.get('reply_pending', False),
+        'seq_ordered': data.get('seq_ordered', False),
+    }
+
+# Everything a turn needs from storage, from the parent conversations/{phone} document:
+# {'recent': last CONVERSATION_HEAD_SIZE messages (oldest first), 'message_count',
+#  'order_state', 'awaiting_confirmation', 'reply_pending' (async mode: a text has no reply yet)}
+# None for a new conversation (or one not written to since heads were added)
+def get_conversation_head(phone_number):
+    store = _local_store()
+    if store is not None:
+        return store.get_conversation_head(phone_number)
+    return _read_head(phone_number)
+
+def get_cache_stats():
+    """Hit/miss/eviction counters for the conversation cache"""
+    return conversation_cache.stats()
+
 # Example usage
 def print_conversation(phone_number):
     messages = get_messages(phone_number)
@@ -42,9 +335,186 @@ def print_conversation(phone_number):
 
 def clear_conversation(phone_number):
     """Delete all stored messages for the given phone number"""
-    conv_ref = db.collection('conversations').document(phone_number).collection('messages')
-    for doc in conv_ref.stream():
-        doc.reference.delete()
+    store = _local_store()
+    if store is not None:
+        store.clear_conversation(phone_number)
+    else:
+        # Batched deletes (up to 500 per commit); the parent document only holds
+        # derived state (e.g. the running order) so it goes too
+        with span('firestore.purge'):
+            purge_conversation(get_firestore(), phone_number)
+
+    # Whichever store it was, drop what this process still keeps for the conversation
+    from order_state import forget_order_state
+    conversation_cache.invalidate(phone_number)
+    usage_ledger.forget_conversation(phone_number)
+    forget_order_state(phone_number)
+
+# Running order state is kept on the parent conversations/{phone} document
+def load_order_state(phone_number):
+    store = _local_store()
+    if store is not None:
+        return store.load_order_state(phone_number)
+
+    with span('firestore.load_order_state'):
+        doc = get_firestore().collection('conversations').document(phone_number).get()
+    _count_rpc('reads')
+    if not doc.exists:
+        return None
+    return (doc.to_dict() or {}).get('order_state')
+
+def save_order_state(phone_number, order_state):
+    store = _local_store()
+    if store is not None:
+        store.save_order_state(phone_number, order_state)
+        return
+
+    fields = {'order_state': order_state}
+    if order_state is None:
+        # No running order, so nothing is waiting to be confirmed
+        fields['awaiting_confirmation'] = False
+    with span('firestore.save_order_state'):
+        get_firestore().collection('conversations').document(phone_number).set(fields, merge=True)
+    _count_rpc('writes')
+
+# Rolling history summary (see history_window.py), also on the parent document
+def load_history_summary(phone_number):
+    store = _local_store()
+    if store is not None:
+        return store.load_history_summary(phone_number)
+
+    with span('firestore.load_history_summary'):
+        doc = get_firestore().collection('conversations').document(phone_number).get()
+    _count_rpc('reads')
+    if not doc.exists:
+        return None
+    return (doc.to_dict() or {}).get('history_summary')
+
+def save_history_summary(phone_number, summary):
+    store = _local_store()
+    if store is not None:
+        store.save_history_summary(phone_number, summary)
+        return
+
+    with span('firestore.save_history_summary'):
+        get_firestore().collection('conversations').document(phone_number).set({'history_summary': summary}, merge=True)
+    _count_rpc('writes')
+
+# Token accounting flushes (see llm_usage.py)
+# usage: [{phone, call_type, calls, prompt_tokens, completion_tokens, cost_usd}] increments
+# orders: per-confirmed-order cost rollups
+def store_usage(usage, orders):
+    store = _local_store()
+    if store is not None:
+        store.store_usage(usage, orders)
+        return
+
+    from firebase_admin import firestore
+
+    db = get_firestore()
+    writes = []
+    for row in usage:
+        counters = {field: firestore.Increment(row[field])
+                    for field in ('calls', 'prompt_tokens', 'completion_tokens', 'cost_usd')}
+        writes.append((db.collection('llm_usage').document(row['phone']), {row['call_type']: counters}))
+    for order in orders:
+        writes.append((db.collection('llm_usage').document(order['phone']).collection('orders').document(), order))
+    # A batch holds at most 500 writes
+    for start in range(0, len(writes), 500):
+        batch = db.batch()
+        for doc_ref, data in writes[start:start + 500]:
+            batch.set(doc_ref, data, merge=True)
+        with span('firestore.store_usage'):
+            batch.commit()
+        _count_rpc('writes')
+
+# Webhook idempotency records, one per Twilio MessageSid (see idempotency.py)
+# {status: 'in_flight' | 'done', response, updated (epoch seconds)}
+def _webhook_request_ref(sid):
+    return get_firestore().collection('webhook_requests').document(sid)
+
+def _webhook_record(data):
+    return {'status': data.get('status'), 'response': data.get('response'), 'updated': data.get('updated', 0)}
+
+# Returns None if this caller now owns the MessageSid, otherwise the existing record.
+# An in-flight claim older than stale_after seconds (its process died) is taken over.
+def claim_webhook_request(sid, stale_after, ttl):
+    store = _local_store()
+    if store is not None:
+        return store.claim_webhook_request(sid, stale_after)
+
+    from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+    ref = _webhook_request_ref(sid)
+    now = time.time()
+    # expires_at is for a Firestore TTL policy on the collection
+    claim = {'status': 'in_flight', 'response': None, 'updated': now,
+             'expires_at': datetime.fromtimestamp(now + ttl, timezone.utc)}
+    try:
+        with span('firestore.claim_webhook_request'):
+            ref.create(claim)
+        _count_rpc('writes')
+        return None
+    except AlreadyExists:
+        pass
+
+    with span('firestore.claim_webhook_request'):
+        doc = ref.get()
+    _count_rpc('reads')
+    if not doc.exists:
+        return {'status': 'in_flight', 'response': None, 'updated': now}
+    record = _webhook_record(doc.to_dict() or {})
+    if record['status'] == 'in_flight' and record['updated'] < now - stale_after:
+        try:
+            # Only if nobody else took it over since we read it
+            with span('firestore.claim_webhook_request'):
+                ref.set(claim, option=get_firestore().write_option(last_update_time=doc.update_time))
+            _count_rpc('writes')
+            return None
+        except FailedPrecondition:
+            pass
+    return record
+
+def get_webhook_request(sid):
+    store = _local_store()
+    if store is not None:
+        return store.get_webhook_request(sid)
+
+    with span('firestore.get_webhook_request'):
+        doc = _webhook_request_ref(sid).get()
+    _count_rpc('reads')
+    return _webhook_record(doc.to_dict() or {}) if doc.exists else None
+
+def finish_webhook_request(sid, response, ttl):
+    store = _local_store()
+    if store is not None:
+        store.finish_webhook_request(sid, response)
+        return
+
+    now = time.time()
+    with span('firestore.finish_webhook_request'):
+        _webhook_request_ref(sid).set({
+            'status': 'done', 'response': response, 'updated': now,
+            'expires_at': datetime.fromtimestamp(now + ttl, timezone.utc)
+        })
+    _count_rpc('writes')
+
+def release_webhook_request(sid):
+    store = _local_store()
+    if store is not None:
+        store.release_webhook_request(sid)
+        return
+
+    with span('firestore.release_webhook_request'):
+        _webhook_request_ref(sid).delete()
+    _count_rpc('writes')
+
+def prune_webhook_requests(older_than):
+    """SQLite only; Firestore records expire through a TTL policy on expires_at"""
+    store = _local_store()
+    if store is not None:
+        return store.prune_webhook_requests(older_than)
+    return 0
 
 if __name__ == "__main__":
     # Example: store and print conversation for a phone number
@@ -0,0 +1,149 @@
+"""
+Token-bounded conversation window for reply prompts
+Keeps the newest messages verbatim and folds older ones into a rolling summary,
+so the prompt stays the same size no matter how long a customer's history gets.
+The summary is stored on the parent conversation document (firebase_logic, or the
+SQLite store), next to the conversation head, so it isn't kept in process memory.
+"""
+
+import os
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
+
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Stored messages a turn fetches for its reply: the window plus the messages added since the
+# last summary refresh. More than HISTORY_MAX_MESSAGES, so a conversation that has outgrown
+# the window never looks short enough to skip its summary
+HISTORY_CONTEXT_MESSAGES = HISTORY_MAX_MESSAGES + 10
+
+# Where summaries are kept, per phone {"summary", "covered_id"}: the id of the last message
+# folded in ({"summary", "covered", "last_hash"} for histories without ids):
+# None = the conversation store, or an object with load(key) / save(key, state)
+_summary_store = None
+
+
+def set_summary_store(store):
+    """Keep summaries somewhere else (tests, replays); None goes back to the conversation store"""
+    global _summary_store
+    _summary_store = store
+
+
+def _load_summary(key):
+    if _summary_store is not None:
+        return _summary_store.load(key)
+    from firebase_logic import load_history_summary
+    return load_history_summary(key)
+
+
+def _save_summary(key, state):
+    if _summary_store is not None:
+        _summary_store.save(key, state)
+        return
+    from firebase_logic import save_history_summary
+    save_history_summary(key, state)
+
+
+def estimate_tokens(text):
+    """Token count with tiktoken when installed, otherwise ~4 characters per token"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _message_tokens(msg):
+    return estimate_tokens(msg["text"]) + 4  # Per-message chat overhead
+
+
+def _message_hash(msg):
+    return hashlib.sha256(f"{msg['direction']}:{msg['text']}".encode("utf-8")).hexdigest()
+
+
+def _fits(messages, max_messages, token_budget):
+    return len(messages) <= max_messages and sum(_message_tokens(m) for m in messages) <= token_budget
+
+
+def _keep_count(messages, max_messages, token_budget):
+    """How many of the newest messages fit in the given limits (at least one)"""
+    kept, tokens = 0, 0
+    for msg in reversed(messages):
+        tokens += _message_tokens(msg)
+        if kept >= max_messages or (kept and tokens > token_budget):
+            break
+        kept += 1
+    return max(kept, 1)
+
+
+def _summary_end(history, state):
+    """Index of the first message the stored summary doesn't cover, None if it isn't this history's"""
+    if state.get("covered_id") is not None:
+        ids = [msg.get("id") for msg in history]
+        if state["covered_id"] in ids:
+            return len(ids) - ids[::-1].index(state["covered_id"])
+        # A tail that doesn't reach back to the last summarized message is all newer than it
+        return 0 if any(ids) else None
+    # Messages without ids (replays, tests) are the whole history, matched by position
+    covered = state.get("covered", 0)
+    if covered > len(history) or (covered and _message_hash(history[covered - 1]) != state.get("last_hash")):
+        return None
+    return covered
+
+
+def window_history(conversation_history, summarize, key=None,
+                   max_messages=HISTORY_MAX_MESSAGES, token_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Split a conversation into (summary, recent_messages).
+    conversation_history: the newest HISTORY_CONTEXT_MESSAGES stored messages (with their
+    ids) plus the turn's new ones are enough; without ids it must be the whole history
+    summarize: callable(previous_summary, messages) -> new summary text
+    key: conversation key (phone number) the rolling summary is stored under;
+    without one nothing is stored and every overflowing call summarizes afresh
+
+    The summary only gets refreshed when the verbatim part overflows; it then
+    folds enough messages to bring the window down to half its limits, so
+    most turns reuse the stored summary as-is.
+    """
+    # Short conversations never need a summary (any stored one is for a cleared history)
+    if _fits(conversation_history, max_messages, token_budget):
+        return "", conversation_history
+
+    state = _load_summary(key) if key is not None else None
+    start = _summary_end(conversation_history, state) if state is not None else None
+    if start is None:
+        # Nothing stored, or the history it covers has changed (e.g. cleared)
+        state, start = {"summary": ""}, 0
+
+    recent = conversation_history[start:]
+    if _fits(recent, max_messages, token_budget):
+        return state["summary"], recent
+
+    keep = _keep_count(recent, max(max_messages // 2, 1), token_budget // 2)
+    boundary = len(conversation_history) - keep
+    if any(msg.get("id") is not None for msg in conversation_history):
+        # Only fold up to a stored message, so the next turn's tail can find where the summary ends
+        while boundary > start and conversation_history[boundary - 1].get("id") is None:
+            boundary -= 1
+        if boundary == start:
+            return state["summary"], recent
+    last = conversation_history[boundary - 1]
+    summary = summarize(state["summary"], conversation_history[start:boundary])
+    if last.get("id") is not None:
+        state = {"summary": summary, "covered_id": last["id"]}
+    else:
+        state = {"summary": summary, "covered": boundary, "last_hash": _message_hash(last)}
+    if key is not None:
+        _save_summary(key, state)
+    return summary, conversation_history[boundary:]
+
+
+def forget_summary(key):
+    """Drop the stored summary for a conversation"""
+    _save_summary(key, None)
@@ -0,0 +1,212 @@
+"""
+MessageSid idempotency for the /sms webhook
+Twilio retries a webhook it thinks timed out, with the same MessageSid. The
+first request for a SID claims it; a retry that arrives while it's still being
+handled waits for it, and one that arrives afterwards gets the stored response
+back, so the message isn't stored twice and the reply isn't generated twice.
+
+Claims and responses live in a bounded in-process cache, backed by a record
+per SID in the conversation store (Firestore webhook_requests/{sid}, or the
+SQLite store's webhook_requests table) so retries that land on another
+process or after a restart are caught too.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from telemetry import log
+
+load_dotenv()
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # SIDs kept in memory
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))  # seconds a response is kept for retries
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "15"))  # seconds a retry waits for the first request
+IDEMPOTENCY_STALE = float(os.getenv("IDEMPOTENCY_STALE", "120"))  # seconds before an abandoned claim is taken over
+# IDEMPOTENCY_STORE=false: in-process only, no storage round trip per webhook
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "true").lower() == "true"
+POLL_INTERVAL = 0.25  # seconds between checks on another process's claim
+PRUNE_EVERY = 1000  # claims between clean-ups of expired SQLite records
+
+NEW = "new"  # this caller owns the SID and must call complete() or fail()
+DONE = "done"  # already handled; the stored response comes with it
+IN_FLIGHT = "in_flight"  # still being handled elsewhere after waiting IDEMPOTENCY_WAIT
+
+
+class _StoreRecords:
+    """Persistent records through firebase_logic (Firestore or SQLite)"""
+
+    def claim(self, sid, stale_after, ttl):
+        from firebase_logic import claim_webhook_request
+        return claim_webhook_request(sid, stale_after, ttl)
+
+    def get(self, sid):
+        from firebase_logic import get_webhook_request
+        return get_webhook_request(sid)
+
+    def finish(self, sid, response, ttl):
+        from firebase_logic import finish_webhook_request
+        finish_webhook_request(sid, response, ttl)
+
+    def release(self, sid):
+        from firebase_logic import release_webhook_request
+        release_webhook_request(sid)
+
+    def prune(self, older_than):
+        from firebase_logic import prune_webhook_requests
+        return prune_webhook_requests(older_than)
+
+
+class IdempotencyCache:
+    """
+    begin(sid) -> (NEW, None) | (DONE, response) | (IN_FLIGHT, None)
+    response: any JSON-serializable value describing what was sent back
+    records: persistent backing (claim/get/finish/release/prune), None for in-process only
+    """
+
+    def __init__(self, max_entries=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL, wait=IDEMPOTENCY_WAIT,
+                 stale_after=IDEMPOTENCY_STALE, records=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.wait = wait
+        self.stale_after = stale_after
+        self.records = records
+        self._entries = OrderedDict()  # sid -> {"state", "response", "expires"}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._claims = 0
+
+        # Metrics
+        self.requests = 0
+        self.duplicates = 0  # retries answered with the stored response
+        self.duplicates_from_store = 0  # ... of which only the persistent record knew about
+        self.waited = 0  # retries that arrived while the first request was still running
+        self.gave_up = 0  # retries that waited IDEMPOTENCY_WAIT and still found it in flight
+        self.store_errors = 0
+
+    def _live_entry(self, sid):
+        entry = self._entries.get(sid)
+        if entry is not None and entry["state"] == DONE and entry["expires"] < time.monotonic():
+            del self._entries[sid]
+            return None
+        return entry
+
+    def _set(self, sid, state, response=None):
+        """Lock held"""
+        self._entries[sid] = {"state": state, "response": response, "expires": time.monotonic() + self.ttl}
+        self._entries.move_to_end(sid)
+        excess = len(self._entries) - self.max_entries
+        if excess > 0:
+            # Oldest first; in-flight claims stay, their owner still has to finish them
+            evict = []
+            for key, entry in self._entries.items():
+                if entry["state"] != IN_FLIGHT:
+                    evict.append(key)
+                    if len(evict) == excess:
+                        break
+            for key in evict:
+                del self._entries[key]
+
+    def begin(self, sid):
+        """Claim a MessageSid, or find out what happened to it"""
+        deadline = time.monotonic() + self.wait
+        with self._lock:
+            self.requests += 1
+            entry = self._live_entry(sid)
+            if entry is not None and entry["state"] == IN_FLIGHT:
+                # A concurrent retry: wait for the first request instead of doing the work again
+                self.waited += 1
+                while entry is not None and entry["state"] == IN_FLIGHT:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.gave_up += 1
+                        return IN_FLIGHT, None
+                    self._changed.wait(remaining)
+                    entry = self._live_entry(sid)
+            if entry is not None:
+                self.duplicates += 1
+                return DONE, entry["response"]
+            self._set(sid, IN_FLIGHT)
+            self._claims += 1
+            prune = self.records is not None and self._claims % PRUNE_EVERY == 0
+
+        if self.records is None:
+            return NEW, None
+        try:
+            if prune:
+                self.records.prune(self.ttl)
+            record = self.records.claim(sid, self.stale_after, self.ttl)
+            # Claimed by another process: poll its record until it's done
+            while record is not None and record["status"] == IN_FLIGHT and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                record = self.records.get(sid)
+                if record is None:
+                    # Its owner failed and released it
+                    record = self.records.claim(sid, self.stale_after, self.ttl)
+        except Exception as e:
+            # Better to risk a duplicate reply than to drop the message
+            log(f"⚠️  Idempotency record for {sid} unavailable: {e}")
+            with self._lock:
+                self.store_errors += 1
+            return NEW, None
+
+        if record is None:
+            return NEW, None
+        with self._lock:
+            if record["status"] == DONE:
+                self._set(sid, DONE, record["response"])
+                self.duplicates += 1
+                self.duplicates_from_store += 1
+                self._changed.notify_all()
+                return DONE, record["response"]
+            self._entries.pop(sid, None)
+            self.gave_up += 1
+            self._changed.notify_all()
+        return IN_FLIGHT, None
+
+    def complete(self, sid, response):
+        """Store the response for a SID claimed with begin(); retries get it from now on"""
+        with self._lock:
+            self._set(sid, DONE, response)
+            self._changed.notify_all()
+        if self.records is not None:
+            try:
+                self.records.finish(sid, response, self.ttl)
+            except Exception as e:
+                log(f"⚠️  Couldn't store the response for {sid}: {e}")
+                with self._lock:
+                    self.store_errors += 1
+
+    def fail(self, sid):
+        """Give up a claimed SID so a retry handles it from scratch"""
+        with self._lock:
+            self._entries.pop(sid, None)
+            self._changed.notify_all()
+        if self.records is not None:
+            try:
+                self.records.release(sid)
+            except Exception as e:
+                log(f"⚠️  Couldn't release {sid}: {e}")
+                with self._lock:
+                    self.store_errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "requests": self.requests,
+                "duplicates": self.duplicates,
+                "duplicates_from_store": self.duplicates_from_store,
+                "waited": self.waited,
+                "gave_up": self.gave_up,
+                "store_errors": self.store_errors,
+                "duplicate_rate": round(self.duplicates / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+idempotency_cache = IdempotencyCache(records=_StoreRecords() if IDEMPOTENCY_STORE else None)
+
+
+def get_idempotency_stats():
+    return idempotency_cache.stats()
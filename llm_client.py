@@ -0,0 +1,211 @@
+"""
+Deadline-bounded chat completions with retries and hedged requests
+Every LLM call in openai_logic goes through LLMClient.chat: each call gets an
+overall deadline, 429/5xx/timeouts are retried with jittered exponential
+backoff, and (optionally) a slow call is hedged with a second identical
+request once it runs past the recent p95 latency.
+"""
+
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from clients import get_openai_client
+
+load_dotenv()
+
+OPENAI_DEADLINE = float(os.getenv("OPENAI_DEADLINE", "30"))  # seconds per call, retries included
+OPENAI_MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))  # seconds
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))  # seconds
+# OPENAI_HEDGE=true: send a second request when the first is slower than the recent p95
+OPENAI_HEDGE = os.getenv("OPENAI_HEDGE", "false").lower() == "true"
+OPENAI_HEDGE_DELAY = float(os.getenv("OPENAI_HEDGE_DELAY", "3"))  # seconds, until there's enough latency data
+# LLM_REPLAY=record|replay: capture or serve completions from a cassette (see llm_replay.py)
+LLM_REPLAY = os.getenv("LLM_REPLAY", "").lower()
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+def is_retryable(error):
+    """429s, 5xx, timeouts and dropped connections are worth another try"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Timeouts and connection errors carry no status code
+    return type(error).__name__ in ("APITimeoutError", "APIConnectionError", "TimeoutError", "ConnectionError")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class LLMClient:
+    def __init__(self, client=None, deadline=OPENAI_DEADLINE, max_attempts=OPENAI_MAX_ATTEMPTS,
+                 backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX,
+                 hedge=OPENAI_HEDGE, hedge_delay=OPENAI_HEDGE_DELAY):
+        """client: an openai.OpenAI-compatible client (defaults to the shared one from clients.py)"""
+        self._client = client
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # seconds, successful requests only
+        # Streams return once the headers arrive, long before the completion: kept apart
+        # so they don't drag down the p95 that hedging waits for
+        self._stream_latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.counters = {
+            "calls": 0,
+            "requests": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+            "failures": 0,
+        }
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else get_openai_client()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def _hedge_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+            return self._pool
+
+    def current_hedge_delay(self):
+        """p95 of recent request latencies, or the configured delay until there's enough data"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return self.hedge_delay
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def _request(self, timeout, kwargs):
+        self._count("requests")
+        started = time.monotonic()
+        response = self.client.chat.completions.create(timeout=timeout, **kwargs)
+        with self._lock:
+            latencies = self._stream_latencies if kwargs.get("stream") else self._latencies
+            latencies.append(time.monotonic() - started)
+        return response
+
+    def _hedged_request(self, timeout, kwargs, on_discarded=None):
+        """
+        Primary request, plus a backup if it outlives the hedge delay; first success wins.
+        on_discarded(response) is called with the losing request's response if it succeeds too.
+        """
+        pool = self._hedge_pool()
+        primary = pool.submit(self._request, timeout, kwargs)
+        delay = self.current_hedge_delay()
+        if delay >= timeout:
+            return primary.result()
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self._count("hedges")
+        backup = pool.submit(self._request, timeout - delay, kwargs)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count("hedge_wins")
+                    # The other request is left to finish on its own; it's still billed
+                    if on_discarded is not None:
+                        loser = primary if future is backup else backup
+                        loser.add_done_callback(lambda f: f.exception() is None and on_discarded(f.result()))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def chat(self, deadline=None, hedge=None, on_discarded=None, **kwargs):
+        """
+        chat.completions.create(**kwargs) bounded by `deadline` seconds in total.
+        Raises DeadlineExceeded if no attempt succeeds in time, or the last
+        non-retryable error as-is.
+        on_discarded(response): called (possibly later, from another thread) with the response
+        of a hedged request that lost the race, so its token usage can still be accounted
+        """
+        deadline = self.deadline if deadline is None else deadline
+        hedge = self.hedge if hedge is None else hedge
+        # Streams can't be raced against each other
+        hedge = hedge and not kwargs.get("stream")
+        self._count("calls")
+        give_up_at = time.monotonic() + deadline
+        last_error = None
+
+        for attempt in range(self.max_attempts):
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                self._count("retries")
+            try:
+                if hedge:
+                    return self._hedged_request(remaining, kwargs, on_discarded)
+                return self._request(remaining, kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._count("failures")
+                    raise
+                last_error = e
+
+            # Full jitter: sleep a random time up to the exponential cap
+            backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            retry_after = getattr(getattr(last_error, "response", None), "headers", {}) or {}
+            try:
+                backoff = max(backoff, float(retry_after.get("retry-after", 0)))
+            except (TypeError, ValueError, AttributeError):
+                pass
+            if attempt + 1 == self.max_attempts:
+                # Out of attempts before the deadline
+                self._count("failures")
+                raise last_error
+            if time.monotonic() + backoff >= give_up_at:
+                break
+            time.sleep(backoff)
+
+        self._count("failures")
+        self._count("deadline_exceeded")
+        raise DeadlineExceeded(f"No completion within {deadline:.1f}s (last error: {last_error})")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            samples = sorted(self._latencies)
+            stream_samples = sorted(self._stream_latencies)
+        stats["p50_ms"] = round(samples[len(samples) // 2] * 1000, 1) if samples else 0.0
+        stats["p95_ms"] = round(samples[max(0, int(len(samples) * 0.95) - 1)] * 1000, 1) if samples else 0.0
+        # Streamed requests: time to the response headers, not to the last token
+        stats["stream_headers_p50_ms"] = round(stream_samples[len(stream_samples) // 2] * 1000, 1) if stream_samples else 0.0
+        stats["stream_headers_p95_ms"] = round(stream_samples[max(0, int(len(stream_samples) * 0.95) - 1)] * 1000, 1) if stream_samples else 0.0
+        stats["hedge_delay_ms"] = round(self.current_hedge_delay() * 1000, 1)
+        return stats
+
+
+if LLM_REPLAY:
+    from llm_replay import ReplayClient
+    llm = LLMClient(ReplayClient(mode=LLM_REPLAY), hedge=False)
+else:
+    llm = LLMClient()
+
+
+def get_llm_stats():
+    """Request, retry and hedge counters plus recent latency percentiles"""
+    return llm.stats()
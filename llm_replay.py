@@ -0,0 +1,158 @@
+"""
+Record / replay of chat completions
+ReplayClient stands in for the OpenAI client under llm_client.LLMClient.
+In record mode it calls the real API and saves each response in a JSON
+cassette keyed by a hash of the request; in replay mode it answers from the
+cassette without any network I/O. Enable with LLM_REPLAY=record|replay.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", os.path.join(os.path.dirname(__file__), "tests", "replay", "cassette.json"))
+
+# Request fields that change the completion; timeouts and the like don't
+KEY_FIELDS = ("model", "messages", "response_format", "temperature", "max_tokens", "stream")
+
+
+class ReplayMiss(KeyError):
+    pass
+
+
+def request_key(kwargs):
+    """Stable hash of the parts of a chat.completions.create call that matter"""
+    request = {field: kwargs[field] for field in KEY_FIELDS if kwargs.get(field) is not None}
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:24]
+
+
+def _response(content, usage):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role="assistant", content=content),
+            finish_reason="stop",
+        )],
+        usage=SimpleNamespace(**usage),
+    )
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=text), finish_reason=None)])
+
+
+def _usage_dict(response):
+    usage = getattr(response, "usage", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+    }
+
+
+class ReplayClient:
+    def __init__(self, path=LLM_CASSETTE, mode="replay", client=None, fallback=None):
+        """
+        mode: 'record' (call the API, save responses) or 'replay' (cassette only)
+        client: the real OpenAI client for record mode (defaults to the shared one)
+        fallback: fallback(kwargs) -> content for replay misses; without it a miss raises ReplayMiss
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"LLM_REPLAY must be 'record' or 'replay', not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._client = client
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self.cassette = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.cassette = json.load(f)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.prompt_chars = 0  # characters sent in prompts, across all requests
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def client(self):
+        if self._client is None:
+            from clients import get_openai_client
+            self._client = get_openai_client()
+        return self._client
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.cassette, f, indent=1, sort_keys=True, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def _store(self, key, kwargs, entry):
+        entry["request"] = {field: kwargs[field] for field in KEY_FIELDS if kwargs.get(field) is not None}
+        with self._lock:
+            self.cassette[key] = entry
+            self.recorded += 1
+            self._save()
+
+    def create(self, **kwargs):
+        key = request_key(kwargs)
+        with self._lock:
+            self.requests += 1
+            self.prompt_chars += sum(len(str(m.get("content", ""))) for m in kwargs.get("messages", []))
+            entry = self.cassette.get(key)
+            if entry is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is None and self.mode == "record":
+            return self._record(key, kwargs)
+        if entry is None:
+            if self.fallback is None:
+                raise ReplayMiss(f"No recorded completion for request {key}")
+            entry = {"content": self.fallback(kwargs), "usage": {}}
+
+        if kwargs.get("stream"):
+            chunks = entry.get("chunks") or [entry["content"]]
+            return iter([_chunk(text) for text in chunks])
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, **entry.get("usage", {})}
+        return _response(entry["content"], usage)
+
+    def _record(self, key, kwargs):
+        response = self.client.chat.completions.create(**kwargs)
+        if not kwargs.get("stream"):
+            self._store(key, kwargs, {
+                "content": response.choices[0].message.content,
+                "usage": _usage_dict(response),
+            })
+            return response
+        return self._record_stream(key, kwargs, response)
+
+    def _record_stream(self, key, kwargs, stream):
+        chunks = []
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._store(key, kwargs, {"content": "".join(chunks), "chunks": chunks, "usage": {}})
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "requests": self.requests,
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+                "prompt_chars": self.prompt_chars,
+            }
@@ -0,0 +1,270 @@
+"""
+Token and cost accounting for chat completions, with prompt budgets
+Every completion openai_logic makes is recorded here by call type (reply,
+extract, summary, ...) and phone number. Totals are kept in memory and
+flushed to the conversation store every USAGE_FLUSH_INTERVAL seconds; when
+an order is confirmed, what its conversation cost is rolled up and stored
+with it. Optional hard token budgets are checked before a prompt is sent:
+oversized reply prompts lose their oldest history turns, and anything that
+still doesn't fit raises TokenBudgetExceeded.
+
+Both budgets are off by default. The conversation budget only resets when an
+order is confirmed through process_confirmed_order, and a conversation over it
+gets BUDGET_EXCEEDED_REPLY without anyone being alerted, so only turn it on
+with something watching the llm_usage rejected counter.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from history_window import estimate_tokens
+
+load_dotenv()
+
+# Max prompt tokens for one completion (0 = no limit)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+# Max tokens (prompt + completion) one conversation may use until its order is confirmed (0 = no limit)
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "0"))
+# Seconds between flushes to storage (0 = keep in memory only)
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "60"))
+USAGE_TRACKED_PHONES = 10000
+
+# USD per 1M tokens: (prompt, completion); LLM_PRICES='{"model": [in, out]}' adds or overrides
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+
+class TokenBudgetExceeded(Exception):
+    """The prompt (or the conversation so far) is over its token budget; nothing was sent"""
+
+
+def message_tokens(messages):
+    """Estimated prompt tokens of a chat messages array"""
+    return sum(estimate_tokens(str(m.get("content") or "")) + 4 for m in messages)
+
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES["gpt-3.5-turbo"])
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def _empty_totals():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+
+def _add(totals, prompt_tokens, completion_tokens, cost, calls=1):
+    totals["calls"] += calls
+    totals["prompt_tokens"] += prompt_tokens
+    totals["completion_tokens"] += completion_tokens
+    totals["cost_usd"] += cost
+
+
+def _store_usage(usage, orders):
+    from firebase_logic import store_usage
+    store_usage(usage, orders)
+
+
+class UsageLedger:
+    def __init__(self, prompt_budget=PROMPT_TOKEN_BUDGET, conversation_budget=CONVERSATION_TOKEN_BUDGET,
+                 flush_interval=USAGE_FLUSH_INTERVAL, sink=_store_usage):
+        """
+        sink: sink(usage, orders) persists a flush, where usage is a list of
+        {phone, call_type, calls, prompt_tokens, completion_tokens, cost_usd} increments
+        and orders a list of per-order rollups
+        """
+        self.prompt_budget = prompt_budget
+        self.conversation_budget = conversation_budget
+        self.flush_interval = flush_interval
+        self.sink = sink
+        self._lock = threading.Lock()
+        self._by_type = {}  # call_type -> totals
+        self._open_orders = OrderedDict()  # phone -> {"totals", "by_type"} since the last confirmed order
+        self._pending = {}  # (phone, call_type) -> totals not flushed yet
+        self._pending_orders = []
+        self._flusher = None
+        self.counters = {"estimated": 0, "trimmed": 0, "rejected": 0, "orders": 0, "flushes": 0, "flush_errors": 0}
+
+    def fit_prompt(self, messages, phone_number=None):
+        """
+        Check a prompt against the budgets before it is sent.
+        Returns the messages, with the oldest history turns dropped if that's what it takes
+        to fit the per-call budget (system prompts and the newest message are always kept).
+        Raises TokenBudgetExceeded if it still doesn't fit, or the conversation is over its budget.
+        """
+        tokens = [message_tokens([m]) for m in messages]
+        total = sum(tokens)
+
+        if self.prompt_budget and total > self.prompt_budget:
+            dropped = set()
+            for i in range(len(messages) - 1):
+                if total <= self.prompt_budget:
+                    break
+                if messages[i].get("role") != "system":
+                    dropped.add(i)
+                    total -= tokens[i]
+            if total > self.prompt_budget:
+                self._count("rejected")
+                raise TokenBudgetExceeded(f"Prompt needs ~{total} tokens, the per-call budget is {self.prompt_budget}")
+            messages = [m for i, m in enumerate(messages) if i not in dropped]
+            self._count("trimmed")
+
+        if self.conversation_budget and phone_number:
+            with self._lock:
+                entry = self._open_orders.get(phone_number)
+                spent = entry["totals"]["prompt_tokens"] + entry["totals"]["completion_tokens"] if entry else 0
+            if spent + total > self.conversation_budget:
+                self._count("rejected")
+                raise TokenBudgetExceeded(
+                    f"Conversation {phone_number} has used {spent} tokens, its budget is {self.conversation_budget}"
+                )
+        return messages
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record(self, call_type, phone_number, model, prompt_tokens, completion_tokens, estimated=False):
+        """Account for one finished completion"""
+        cost = cost_usd(model, prompt_tokens, completion_tokens)
+        key = phone_number or "unknown"
+        with self._lock:
+            _add(self._by_type.setdefault(call_type, _empty_totals()), prompt_tokens, completion_tokens, cost)
+            _add(self._pending.setdefault((key, call_type), _empty_totals()), prompt_tokens, completion_tokens, cost)
+            if phone_number:
+                entry = self._open_orders.get(phone_number)
+                if entry is None:
+                    entry = self._open_orders[phone_number] = {"totals": _empty_totals(), "by_type": {}}
+                self._open_orders.move_to_end(phone_number)
+                while len(self._open_orders) > USAGE_TRACKED_PHONES:
+                    self._open_orders.popitem(last=False)
+                _add(entry["totals"], prompt_tokens, completion_tokens, cost)
+                _add(entry["by_type"].setdefault(call_type, _empty_totals()), prompt_tokens, completion_tokens, cost)
+            if estimated:
+                self.counters["estimated"] += 1
+        self._start_flusher()
+
+    def record_response(self, call_type, phone_number, model, response, messages):
+        """record() with the counts from response.usage, estimated when the API didn't report any"""
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        if prompt_tokens:
+            self.record(call_type, phone_number, model, prompt_tokens, completion_tokens)
+            return
+        content = response.choices[0].message.content or ""
+        self.record(call_type, phone_number, model, message_tokens(messages), estimate_tokens(content), estimated=True)
+
+    def close_order(self, phone_number, order_ref=None):
+        """
+        Roll up what the phone's conversation cost since its last confirmed order,
+        queue it for storage and start the next order from zero.
+        Returns the rollup: {phone, order_ref, confirmed_at, calls, prompt_tokens, completion_tokens, cost_usd, by_type}
+        """
+        with self._lock:
+            entry = self._open_orders.pop(phone_number, None) or {"totals": _empty_totals(), "by_type": {}}
+            rollup = {
+                "phone": phone_number,
+                "order_ref": order_ref,
+                "confirmed_at": time.time(),
+                **entry["totals"],
+                "by_type": entry["by_type"],
+            }
+            self._pending_orders.append(rollup)
+            self.counters["orders"] += 1
+        self._start_flusher()
+        return rollup
+
+    def forget_conversation(self, phone_number):
+        """Drop the open-order totals (e.g. the conversation was cleared)"""
+        with self._lock:
+            self._open_orders.pop(phone_number, None)
+
+    def conversation_usage(self, phone_number):
+        """Totals since the phone's last confirmed order"""
+        with self._lock:
+            entry = self._open_orders.get(phone_number)
+            return dict(entry["totals"]) if entry else _empty_totals()
+
+    def by_call_type(self):
+        with self._lock:
+            return {call_type: dict(totals) for call_type, totals in sorted(self._by_type.items())}
+
+    def reset(self):
+        """Forget everything, flushed or not"""
+        with self._lock:
+            self._by_type.clear()
+            self._open_orders.clear()
+            self._pending.clear()
+            self._pending_orders.clear()
+            for name in self.counters:
+                self.counters[name] = 0
+
+    def stats(self):
+        with self._lock:
+            totals = _empty_totals()
+            for call_type_totals in self._by_type.values():
+                _add(totals, call_type_totals["prompt_tokens"], call_type_totals["completion_tokens"],
+                     call_type_totals["cost_usd"], calls=call_type_totals["calls"])
+            totals["cost_usd"] = round(totals["cost_usd"], 6)
+            return {
+                **totals,
+                **self.counters,
+                "pending_flush": len(self._pending) + len(self._pending_orders),
+            }
+
+    def flush(self):
+        """Hand the increments since the last flush to the sink; they're kept for next time if it fails"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            orders, self._pending_orders = self._pending_orders, []
+        if not pending and not orders:
+            return 0
+        usage = [
+            {"phone": phone, "call_type": call_type, **totals}
+            for (phone, call_type), totals in pending.items()
+        ]
+        try:
+            self.sink(usage, orders)
+        except Exception as e:
+            print(f"⚠️  Token usage flush failed, will retry: {e}")
+            with self._lock:
+                for key, totals in pending.items():
+                    _add(self._pending.setdefault(key, _empty_totals()), totals["prompt_tokens"],
+                         totals["completion_tokens"], totals["cost_usd"], calls=totals["calls"])
+                self._pending_orders[:0] = orders
+                self.counters["flush_errors"] += 1
+            return 0
+        self._count("flushes")
+        return len(usage) + len(orders)
+
+    def _start_flusher(self):
+        if self._flusher is not None or not self.flush_interval:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+
+            def loop():
+                while True:
+                    time.sleep(self.flush_interval)
+                    self.flush()
+
+            self._flusher = threading.Thread(target=loop, name="llm-usage-flusher", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+
+usage_ledger = UsageLedger()
+
+
+def get_usage_stats():
+    """Tokens, cost and budget counters across all completions"""
+    return usage_ledger.stats()
@@ -1,15 +1,25 @@
 import os
-import openai
 from dotenv import load_dotenv
 import json
 import re
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from order_extractor import extract_order, merge_items
+from catalog import canonicalize_order, answer_product_question
+from history_window import window_history, estimate_tokens
+from llm_client import llm
+from response_cache import RESPONSE_CACHE, response_cache
+from telemetry import span, log
+from llm_usage import usage_ledger, TokenBudgetExceeded, message_tokens
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
-def generate_ai_reply(user_message, conversation_history=None):
-    system_prompt = """
+REPLY_SYSTEM_PROMPT = """
     You are a helpful person working at a seafood distribution company. You're friendly, casual, and genuinely want to help customers place their orders.
     
     Talk like a real person would - be natural, warm, and conversational. Don't sound like a customer service script.
@@ -39,13 +49,46 @@ def generate_ai_reply(user_message, conversation_history=None):
     
     Be human, be helpful, be real.
     """
-    
-    # Build messages array with conversation history
+
+
+# Sent instead of a generated reply when a conversation has used up its token budget
+BUDGET_EXCEEDED_REPLY = "Thanks! Someone from our team will text you back shortly to help finish your order."
+
+
+def _complete(call_type, phone_number=None, **kwargs):
+    """
+    One chat completion: prompt budget check (may trim old history, or raise
+    TokenBudgetExceeded before anything is sent), timing span and token accounting
+    """
+    kwargs["messages"] = usage_ledger.fit_prompt(kwargs["messages"], phone_number)
+
+    def record(response):
+        usage_ledger.record_response(call_type, phone_number, kwargs["model"], response, kwargs["messages"])
+
+    with span(f"openai.{call_type}"):
+        # A hedged request that loses the race still uses tokens
+        response = llm.chat(on_discarded=record, **kwargs)
+    record(response)
+    return response
+
+
+def _chat_messages(system_prompt, user_message, conversation_history=None, phone_number=None):
+    """
+    Build the chat messages array: system prompt, then the history (or just the current message).
+    Long histories are windowed: older turns are folded into a rolling summary.
+    """
     messages = [{"role": "system", "content": system_prompt}]
     
     if conversation_history:
+        summary, recent = window_history(
+            conversation_history,
+            lambda previous, folded: summarize_history(previous, folded, phone_number),
+            key=phone_number
+        )
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation with this customer:\n{summary}"})
         # Add conversation history
-        for msg in conversation_history:
+        for msg in recent:
             if msg["direction"] == "received":
                 messages.append({"role": "user", "content": msg["text"]})
             else:
@@ -53,33 +96,225 @@ def generate_ai_reply(user_message, conversation_history=None):
     else:
         # Just add the current message if no history
         messages.append({"role": "user", "content": user_message})
-    
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=messages
+    return messages
+
+
+def summarize_history(previous_summary, messages, phone_number=None):
+    """Fold older messages into the rolling conversation summary"""
+    transcript = ""
+    for msg in messages:
+        who = "Customer" if msg["direction"] == "received" else "Us"
+        transcript += f"{who}: {msg['text']}\n"
+
+    prompt = (
+        "Update the summary of a text conversation between a seafood distributor and a customer. "
+        "Keep what matters for future orders: products and quantities, delivery dates, addresses, "
+        "preferences and anything still unresolved. Stay under 120 words."
+        f"\n\nCurrent summary:\n{previous_summary or '(none yet)'}"
+        f"\n\nNew messages to fold in:\n{transcript}"
+        "\nUpdated summary:"
     )
+    try:
+        response = _complete(
+            "summary", phone_number,
+            model="gpt-3.5-turbo",
+            messages=[{"role": "user", "content": prompt}]
+        )
+    except TokenBudgetExceeded as e:
+        log(f"⚠️  Summary skipped: {e}")
+        return previous_summary or ""
+    return response.choices[0].message.content.strip()
+
+
+def generate_ai_reply(user_message, conversation_history=None, phone_number=None):
+    # Plain price/availability questions are answered straight from the catalog
+    local_answer = answer_product_question(user_message)
+    if local_answer is not None:
+        return local_answer
+
+    # Greetings and other context-free one-liners are answered from the reply cache
+    cache_key = response_cache.key_for(user_message, conversation_history) if RESPONSE_CACHE else None
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Build messages array with conversation history
+    messages = _chat_messages(REPLY_SYSTEM_PROMPT, user_message, conversation_history, phone_number)
+    
+    started = time.perf_counter()
+    try:
+        response = _complete(
+            "reply", phone_number,
+            model="gpt-3.5-turbo",
+            messages=messages
+        )
+    except TokenBudgetExceeded as e:
+        log(f"⚠️  Reply not generated: {e}")
+        return BUDGET_EXCEEDED_REPLY
     ai_reply = response.choices[0].message.content.strip()
+    if cache_key is not None and ai_reply:
+        response_cache.put(cache_key, ai_reply, (time.perf_counter() - started) * 1000)
     return ai_reply
 
 
-def parse_order_from_conversation(conversation):
-    # Build a conversation string for the prompt (customer messages only)
-    convo_str = ""
-    for msg in conversation:
-        if msg["direction"] == "received":
-            convo_str += f"Customer: {msg['text']}\n"
+def stream_ai_reply(user_message, conversation_history=None, phone_number=None, timing=None):
+    """
+    Streaming generate_ai_reply: yields the reply text in chunks as they arrive.
+    timing: optional dict, filled in with ttft_ms (time to first text) and total_ms
+    """
+    started = time.perf_counter()
+    if timing is None:
+        timing = {}
 
-    # Get current date info for intelligent year handling
-    from datetime import datetime, timezone
-    current_date = datetime.now(timezone.utc)
+    # Local and cached answers arrive all at once
+    local_answer = answer_product_question(user_message)
+    cache_key = response_cache.key_for(user_message, conversation_history) if RESPONSE_CACHE and local_answer is None else None
+    if local_answer is None and cache_key is not None:
+        local_answer = response_cache.get(cache_key)
+    if local_answer is not None:
+        timing["ttft_ms"] = timing["total_ms"] = (time.perf_counter() - started) * 1000
+        yield local_answer
+        return
+
+    messages = _chat_messages(REPLY_SYSTEM_PROMPT, user_message, conversation_history, phone_number)
+    try:
+        messages = usage_ledger.fit_prompt(messages, phone_number)
+    except TokenBudgetExceeded as e:
+        log(f"⚠️  Reply not generated: {e}")
+        timing["ttft_ms"] = timing["total_ms"] = (time.perf_counter() - started) * 1000
+        yield BUDGET_EXCEEDED_REPLY
+        return
+
+    parts = []
+    usage = None
+    # The span covers the whole stream, not just the time to first token
+    with span("openai.stream"):
+        # include_usage: the last chunk carries the token counts (and no choices)
+        stream = llm.chat(model="gpt-3.5-turbo", messages=messages, stream=True,
+                          stream_options={"include_usage": True})
+        for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not parts and text:
+                # Same as generate_ai_reply's strip()
+                text = text.lstrip()
+            if not text:
+                continue
+            if not parts:
+                timing["ttft_ms"] = (time.perf_counter() - started) * 1000
+            parts.append(text)
+            yield text
+    timing["total_ms"] = (time.perf_counter() - started) * 1000
+
+    ai_reply = "".join(parts).strip()
+    # Same call type as generate_ai_reply: a reply costs the same whether or not it was streamed
+    if usage is not None and usage.prompt_tokens:
+        usage_ledger.record("reply", phone_number, "gpt-3.5-turbo", usage.prompt_tokens, usage.completion_tokens)
+    else:
+        usage_ledger.record("reply", phone_number, "gpt-3.5-turbo", message_tokens(messages),
+                            estimate_tokens(ai_reply), estimated=True)
+    if cache_key is not None and ai_reply:
+        response_cache.put(cache_key, ai_reply, timing["total_ms"])
+
+
+# Memoized parses keyed by conversation fingerprint
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "500"))
+# Try the rule-based extractor (order_extractor) before calling the LLM
+ORDER_FAST_PATH = os.getenv("ORDER_FAST_PATH", "true").lower() == "true"
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+parse_stats = {
+    "memo_hits": 0,
+    "fast_path_hits": 0,
+    "full_parses": 0,
+    "incremental_parses": 0,
+    "combined_turns": 0,
+    "last_prompt_tokens": 0,
+    "last_latency_ms": 0.0,
+}
+
+
+def customer_messages(conversation):
+    """Texts of the customer's ('received') messages, oldest first"""
+    return [msg["text"] for msg in conversation if msg["direction"] == "received"]
+
+
+def conversation_fingerprint(texts):
+    """Stable hash of a list of customer message texts"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _memo_get(fingerprint):
+    with _parse_cache_lock:
+        if fingerprint in _parse_cache:
+            _parse_cache.move_to_end(fingerprint)
+            parse_stats["memo_hits"] += 1
+            return copy.deepcopy(_parse_cache[fingerprint])
+    return None
+
+
+def _memo_put(fingerprint, order):
+    with _parse_cache_lock:
+        _parse_cache[fingerprint] = copy.deepcopy(order)
+        while len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+
+
+def get_parse_stats():
+    """Memo hits, rule-based vs LLM parses, and the last LLM call's prompt size/latency"""
+    with _parse_cache_lock:
+        stats = dict(parse_stats)
+    llm_parses = stats["full_parses"] + stats["incremental_parses"]
+    attempts = stats["fast_path_hits"] + llm_parses
+    # Share of parses the local extractor answered without calling the LLM
+    stats["fast_path_hit_rate"] = round(stats["fast_path_hits"] / attempts, 3) if attempts else 0.0
+    return stats
+
+
+def _fast_path(fingerprint, messages, previous_order=None):
+    """Try the rule-based extractor; returns the order or None if the LLM is needed"""
+    if not ORDER_FAST_PATH:
+        return None
+    with span("parse.fast_path"):
+        order = extract_order(messages, previous_order)
+        if order is None:
+            return None
+        # Canonical names can make two spellings the same product; the later one wins
+        order = canonicalize_order(order)
+        order["items"] = merge_items([], order["items"])
+    with _parse_cache_lock:
+        parse_stats["fast_path_hits"] += 1
+    if fingerprint is not None:
+        _memo_put(fingerprint, order)
+    return order
+
+
+# PIN_TODAY=YYYY-MM-DD: treat that as today's date in prompts (record/replay, benchmarks)
+PIN_TODAY = os.getenv("PIN_TODAY")
+
+
+def today():
+    """Now in UTC, or midnight UTC of PIN_TODAY when set"""
+    if PIN_TODAY:
+        return datetime.strptime(PIN_TODAY, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc)
+
+
+def _order_extraction_rules(current_date):
+    """Field and formatting rules shared by the full and incremental extraction prompts"""
     current_year = current_date.year
     next_year = current_year + 1
     current_month = current_date.month
     current_day = current_date.day
 
-    prompt = (
-        "Given the following conversation between a customer and an assistant at a seafood distributor, "
-        "extract the order details as JSON with these fields: items (list of {product, quantity}), delivery_date, delivery_address, and any notes. "
+    return (
         "\nIMPORTANT REQUIREMENTS:"
         "\n1. All quantities MUST be in pounds (lbs). If no unit is specified, assume pounds."
         f"\n2. For dates: TODAY IS {current_date.strftime('%B %d, %Y')} (Month {current_month}, Day {current_day}, Year {current_year})"
@@ -97,24 +332,187 @@ def parse_order_from_conversation(conversation):
         "\n7. IMPORTANT: Always include a city name. If only a street address is given, you must infer or ask for the city."
         "\n\nExample format:"
         f'\n{{"items": [{{"product": "salmon", "quantity": "10 lbs"}}], "delivery_date": "Friday, July 25, {current_year if current_month < 7 or (current_month == 7 and current_day <= 25) else next_year}", "delivery_address": "123 Main St, Seattle, WA", "notes": "Before noon"}}'
-        f"\n\nConversation:\n{convo_str}\n"
+    )
+
+
+def _run_order_extraction(prompt, current_date, phone_number=None):
+    """Send an extraction prompt and pull the JSON object out of the reply"""
+    started = time.perf_counter()
+    try:
+        response = _complete(
+            "extract", phone_number,
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": f"You are an expert at extracting structured order data. Your most important task is to correctly determine the year for delivery dates. Today is {current_date.strftime('%B %d, %Y')}. If a customer provides a month and day that has already passed this year, you must use the next year. Otherwise, use the current year. Ensure all quantities are in pounds and all addresses are in Washington state."},
+                {"role": "user", "content": prompt}
+            ]
+        )
+    except TokenBudgetExceeded as e:
+        log(f"⚠️  Order not parsed: {e}")
+        return None
+    with _parse_cache_lock:
+        parse_stats["last_latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        usage = getattr(response, "usage", None)
+        parse_stats["last_prompt_tokens"] = getattr(usage, "prompt_tokens", 0) if usage else 0
+    content = response.choices[0].message.content
+    # Try to extract JSON from the response
+    with span("parse.extraction_json"):
+        match = re.search(r'({.*})', content, re.DOTALL)
+        if match:
+            return json.loads(match.group(1))
+        else:
+            return None
+
+
+def parse_order_from_conversation(conversation, phone_number=None):
+    texts = customer_messages(conversation)
+    fingerprint = conversation_fingerprint(texts)
+    cached = _memo_get(fingerprint)
+    if cached is not None:
+        return cached
+
+    # Plain "10 lbs salmon" style messages don't need the LLM
+    order = _fast_path(fingerprint, texts)
+    if order is not None:
+        return order
+
+    # Build a conversation string for the prompt (customer messages only)
+    convo_str = ""
+    for text in texts:
+        convo_str += f"Customer: {text}\n"
+
+    # Get current date info for intelligent year handling
+    current_date = today()
+
+    prompt = (
+        "Given the following conversation between a customer and an assistant at a seafood distributor, "
+        "extract the order details as JSON with these fields: items (list of {product, quantity}), delivery_date, delivery_address, and any notes. "
+        + _order_extraction_rules(current_date)
+        + f"\n\nConversation:\n{convo_str}\n"
         "Order JSON:"
     )
 
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": f"You are an expert at extracting structured order data. Your most important task is to correctly determine the year for delivery dates. Today is {current_date.strftime('%B %d, %Y')}. If a customer provides a month and day that has already passed this year, you must use the next year. Otherwise, use the current year. Ensure all quantities are in pounds and all addresses are in Washington state."},
-            {"role": "user", "content": prompt}
-        ]
+    order = canonicalize_order(_run_order_extraction(prompt, current_date, phone_number))
+    with _parse_cache_lock:
+        parse_stats["full_parses"] += 1
+    if order is not None:
+        _memo_put(fingerprint, order)
+    return order
+
+
+def parse_order_update(previous_order, new_messages, fingerprint=None, phone_number=None):
+    """
+    Incremental extraction: send only the previous order state and the customer
+    messages since the last parse, and get back the updated order.
+    new_messages: list of customer message texts
+    fingerprint: fingerprint of the whole conversation, used for memoization
+    """
+    if fingerprint is not None:
+        cached = _memo_get(fingerprint)
+        if cached is not None:
+            return cached
+
+    order = _fast_path(fingerprint, new_messages, previous_order)
+    if order is not None:
+        return order
+
+    convo_str = ""
+    for text in new_messages:
+        convo_str += f"Customer: {text}\n"
+
+    current_date = today()
+
+    prompt = (
+        "You are keeping track of an order a customer is placing with a seafood distributor. "
+        "Below is the order as understood so far, followed by the customer's newest messages. "
+        "Update the order with anything the new messages add, change or remove, and return the COMPLETE updated order "
+        "as JSON with these fields: items (list of {product, quantity}), delivery_date, delivery_address, and any notes. "
+        "Keep every field from the current order that the new messages don't change."
+        + _order_extraction_rules(current_date)
+        + f"\n\nCurrent order:\n{json.dumps(previous_order or {})}\n"
+        f"\nNew customer messages:\n{convo_str}\n"
+        "Updated order JSON:"
     )
+
+    order = canonicalize_order(_run_order_extraction(prompt, current_date, phone_number))
+    with _parse_cache_lock:
+        parse_stats["incremental_parses"] += 1
+    if order is not None and fingerprint is not None:
+        _memo_put(fingerprint, order)
+    return order
+
+
+# COMBINED_TURN=true: one JSON-mode call returns both the reply and the order
+COMBINED_TURN = os.getenv("COMBINED_TURN", "false").lower() == "true"
+
+
+def generate_reply_and_order(user_message, conversation_history=None, previous_order=None, phone_number=None):
+    """
+    Single structured call for a whole turn.
+    Returns (reply, order): the customer-facing reply text and the current order
+    (same shape as parse_order_from_conversation, or None if it couldn't be read).
+    """
+    # A price question doesn't change the order, so it needs no LLM call either
+    local_answer = answer_product_question(user_message)
+    if local_answer is not None:
+        return local_answer, previous_order
+
+    # A cached greeting can't change the order either
+    cache_key = response_cache.key_for(user_message, conversation_history) if RESPONSE_CACHE else None
+    if cache_key is not None:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached, previous_order
+
+    current_date = today()
+    system_prompt = (
+        REPLY_SYSTEM_PROMPT
+        + "\n    While you chat, also keep track of the customer's order."
+        "\n    Respond ONLY with a JSON object with two keys:"
+        '\n    "reply": the text message you send the customer,'
+        '\n    "order": the order so far as an object with items (list of {product, quantity}), delivery_date, delivery_address, and notes (null for anything not given yet).'
+        + _order_extraction_rules(current_date)
+    )
+    if previous_order:
+        system_prompt += f"\n\nOrder so far (update it with anything new):\n{json.dumps(previous_order)}"
+
+    messages = _chat_messages(system_prompt, user_message, conversation_history, phone_number)
+
+    started = time.perf_counter()
+    try:
+        response = _complete(
+            "combined", phone_number,
+            model="gpt-3.5-turbo",
+            messages=messages,
+            response_format={"type": "json_object"}
+        )
+    except TokenBudgetExceeded as e:
+        log(f"⚠️  Turn not generated: {e}")
+        return BUDGET_EXCEEDED_REPLY, previous_order
+    with _parse_cache_lock:
+        parse_stats["last_latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        usage = getattr(response, "usage", None)
+        parse_stats["last_prompt_tokens"] = getattr(usage, "prompt_tokens", 0) if usage else 0
+        parse_stats["combined_turns"] += 1
+
     content = response.choices[0].message.content
-    # Try to extract JSON from the response
-    match = re.search(r'({.*})', content, re.DOTALL)
-    if match:
-        return json.loads(match.group(1))
-    else:
-        return None
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        # Not valid JSON after all - treat the whole thing as the reply
+        return content.strip(), None
+
+    reply = str(data.get("reply", "")).strip()
+    order = canonicalize_order(data.get("order")) if isinstance(data.get("order"), dict) else None
+
+    # Only cache replies to turns that didn't touch the order
+    if cache_key is not None and reply and not (order or {}).get("items"):
+        response_cache.put(cache_key, reply, parse_stats["last_latency_ms"])
+
+    # Later parses of the same conversation can reuse this order
+    if order is not None and conversation_history:
+        _memo_put(conversation_fingerprint(customer_messages(conversation_history)), order)
+    return reply, order
 
 
 def is_order_complete(order_details):
@@ -0,0 +1,174 @@
+"""
+Rule-based order item extractor
+Handles the common "10 lbs salmon, 5 pounds halibut" style of message locally,
+so the LLM is only needed when a message says something the rules don't understand.
+"""
+
+import os
+import re
+from dotenv import load_dotenv
+from catalog import get_catalog
+
+load_dotenv()
+
+# Pounds per case when the customer orders by the case
+CASE_WEIGHT_LBS = float(os.getenv("CASE_WEIGHT_LBS", "10"))
+
+# Unit aliases -> pounds per unit (None = per case, see CASE_WEIGHT_LBS)
+UNIT_TO_LBS = {
+    "lb": 1.0, "lbs": 1.0, "pound": 1.0, "pounds": 1.0, "#": 1.0,
+    "kg": 2.20462, "kgs": 2.20462, "kilo": 2.20462, "kilos": 2.20462,
+    "kilogram": 2.20462, "kilograms": 2.20462,
+    "oz": 1 / 16, "ounce": 1 / 16, "ounces": 1 / 16,
+    "case": None, "cases": None, "cs": None,
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "fifteen": 15, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "hundred": 100,
+}
+
+# Phrases that carry no order information and can be dropped from a segment
+FILLER_PATTERN = re.compile(
+    r"\b(hi|hey|hello|yo|thanks|thank you|please|pls|plz|ok|okay|"
+    r"i need|i'd like|i would like|i want|i'll take|i will take|can i get|could i get|"
+    r"can i order|i'd like to order|i want to order|send me|get me|we need|need|"
+    r"also|too|as well|for me|of|some|fresh)\b",
+    re.IGNORECASE,
+)
+
+# Words that mean a "quantity + word" match is really a date, time or address
+NON_PRODUCT_WORDS = {
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december", "jan", "feb", "mar", "apr",
+    "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "today", "tomorrow", "am", "pm", "noon", "deliver", "delivery", "by", "at", "on", "to",
+    "st", "street", "ave", "avenue", "rd", "road", "blvd", "boulevard", "way", "dr", "drive",
+    "ln", "lane", "pl", "place", "ct", "court", "hwy", "highway", "pkwy", "suite", "ste",
+    # Changes, questions and negations need the LLM to interpret
+    "actually", "make", "change", "instead", "more", "less", "extra", "remove", "cancel",
+    "no", "not", "don't", "dont", "what", "how", "much", "price", "cost", "is", "are", "do",
+    "you", "have", "the", "it", "i", "we", "my", "our", "than", "per", "each",
+}
+
+# Packaging with no known weight: "2 boxes salmon" needs the LLM (or a question back)
+CONTAINER_WORDS = {
+    "box", "boxes", "bag", "bags", "pack", "packs", "package", "packages", "crate", "crates",
+    "tray", "trays", "tub", "tubs", "bucket", "buckets", "bin", "bins", "tote", "totes",
+    "piece", "pieces", "pc", "pcs", "dozen", "unit", "units", "order", "orders",
+}
+
+# Product names longer than this are more likely a sentence than an item
+MAX_PRODUCT_WORDS = 4
+
+SEGMENT_SPLIT = re.compile(r"[,;\n&+]|\band\b|\bplus\b", re.IGNORECASE)
+
+_UNIT_ALT = "|".join(sorted((re.escape(u) for u in UNIT_TO_LBS), key=len, reverse=True))
+_NUMBER_ALT = r"\d+(?:\.\d+)?|" + "|".join(NUMBER_WORDS)
+_PRODUCT = r"[a-z][a-z' -]{1,40}?"
+
+# "10 lbs salmon", "10lb salmon", "2 cases of halibut", "ten pounds cod"
+QTY_FIRST = re.compile(
+    rf"^(?P<qty>{_NUMBER_ALT})\s*(?P<unit>{_UNIT_ALT})?\.?\s+(?P<product>{_PRODUCT})$",
+    re.IGNORECASE,
+)
+# "salmon 10 lbs", "halibut x 5", "salmon - 10lbs"
+PRODUCT_FIRST = re.compile(
+    rf"^(?P<product>{_PRODUCT})\s*[-:x]?\s*(?P<qty>{_NUMBER_ALT})\s*(?P<unit>{_UNIT_ALT})?\.?$",
+    re.IGNORECASE,
+)
+
+
+def _to_number(token):
+    token = token.lower()
+    if token in NUMBER_WORDS:
+        return float(NUMBER_WORDS[token])
+    return float(token)
+
+
+def _to_pounds(quantity, unit):
+    if not unit:
+        return quantity  # No unit means pounds
+    per_unit = UNIT_TO_LBS[unit.lower()]
+    if per_unit is None:
+        per_unit = CASE_WEIGHT_LBS
+    return quantity * per_unit
+
+
+def format_pounds(pounds):
+    """Render a weight the same way the LLM extractor does, e.g. '10 lbs'"""
+    return f"{round(pounds, 2):g} lbs"
+
+
+def _clean_segment(segment):
+    segment = FILLER_PATTERN.sub(" ", segment.lower())
+    segment = re.sub(r"[!?]+|\.+(?=\s|$)", " ", segment)
+    return re.sub(r"\s+", " ", segment).strip(" -:")
+
+
+def extract_items(message):
+    """
+    Extract items from one customer message.
+    Returns (items, confident): items is a list of {product, quantity} in pounds,
+    confident is False when part of the message didn't match any rule.
+    A quantity needs a unit unless the product is in the catalog.
+    A message with nothing but filler (e.g. "hi") returns ([], True).
+    """
+    items = []
+    for segment in SEGMENT_SPLIT.split(message):
+        cleaned = _clean_segment(segment)
+        if not cleaned:
+            continue
+        match = QTY_FIRST.match(cleaned) or PRODUCT_FIRST.match(cleaned)
+        if not match:
+            return [], False
+        product = match.group("product").strip(" -'")
+        words = product.split()
+        if (not product or len(words) > MAX_PRODUCT_WORDS or set(words) & NON_PRODUCT_WORDS
+                or product in NUMBER_WORDS or set(words) & (CONTAINER_WORDS | set(UNIT_TO_LBS))):
+            return [], False
+        # A bare number is only a quantity next to a product we know ("Seattle 98101" isn't an order)
+        if not match.group("unit") and get_catalog().match(product) is None:
+            return [], False
+        pounds = _to_pounds(_to_number(match.group("qty")), match.group("unit"))
+        items.append({"product": product, "quantity": format_pounds(pounds)})
+    return items, True
+
+
+def merge_items(existing, new_items):
+    """Merge new items into an item list; a product mentioned again takes the new quantity"""
+    merged = [dict(item) for item in (existing or [])]
+    for item in new_items:
+        for current in merged:
+            if str(current.get("product", "")).lower() == str(item["product"]).lower():
+                current["quantity"] = item["quantity"]
+                break
+        else:
+            merged.append(dict(item))
+    return merged
+
+
+def extract_order(messages, previous_order=None):
+    """
+    Run the extractor over several customer messages.
+    Returns the order dict (same shape as the LLM extractor) or None when any
+    message needs the LLM.
+    """
+    items = (previous_order or {}).get("items", [])
+    for message in messages:
+        new_items, confident = extract_items(message)
+        if not confident:
+            return None
+        items = merge_items(items, new_items)
+
+    order = {
+        "items": items,
+        "delivery_date": None,
+        "delivery_address": None,
+        "notes": None,
+    }
+    if previous_order:
+        order.update({k: v for k, v in previous_order.items() if k != "items"})
+    return order
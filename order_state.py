@@ -0,0 +1,117 @@
+"""
+Running order state per phone number
+Keeps the parsed order alongside how much of the conversation it covers, so each
+turn only sends the new customer messages to the extractor instead of the whole transcript.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from conversation_cache import CONVERSATION_CACHE_SIZE, CONVERSATION_CACHE_TTL
+from firebase_logic import load_order_state, save_order_state
+from openai_logic import (
+    customer_messages,
+    conversation_fingerprint,
+    parse_order_from_conversation,
+    parse_order_update,
+)
+
+# phone -> (expires, {"order", "parsed_count", "fingerprint"}): copies of what is persisted
+# on the parent conversation document, bounded like the conversation cache (LRU + TTL).
+# An entry another worker has moved past is still a prefix of the conversation, so
+# the worst a stale one costs is re-parsing a few more messages
+_states = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache(phone_number, state):
+    with _lock:
+        _states[phone_number] = (time.monotonic() + CONVERSATION_CACHE_TTL, state)
+        _states.move_to_end(phone_number)
+        while len(_states) > CONVERSATION_CACHE_SIZE:
+            _states.popitem(last=False)
+
+
+def _load(phone_number):
+    with _lock:
+        entry = _states.get(phone_number)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                _states.move_to_end(phone_number)
+                return entry[1]
+            del _states[phone_number]
+    state = load_order_state(phone_number)
+    if state is not None:
+        _cache(phone_number, state)
+    return state
+
+
+def _save(phone_number, state):
+    _cache(phone_number, state)
+    save_order_state(phone_number, state)
+
+
+def get_order_state(phone_number):
+    """The last parsed order for this phone (None if nothing parsed yet)"""
+    state = _load(phone_number)
+    return state["order"] if state else None
+
+
+def update_order_state(phone_number, conversation):
+    """
+    Bring the running order up to date with the conversation and return it.
+    - unchanged customer messages: return the stored order, no LLM call
+    - messages appended since the last parse: incremental extraction on just those
+    - anything else (history edited or cleared): full re-parse
+    """
+    texts = customer_messages(conversation)
+    fingerprint = conversation_fingerprint(texts)
+    state = _load(phone_number)
+
+    if state and state.get("fingerprint") == fingerprint:
+        return state["order"]
+
+    parsed_count = state.get("parsed_count", 0) if state else 0
+    is_continuation = (
+        state is not None
+        and state.get("order") is not None
+        and 0 < parsed_count <= len(texts)
+        and conversation_fingerprint(texts[:parsed_count]) == state.get("fingerprint")
+    )
+
+    if is_continuation:
+        order = parse_order_update(state["order"], texts[parsed_count:], fingerprint=fingerprint, phone_number=phone_number)
+    else:
+        order = parse_order_from_conversation(conversation, phone_number=phone_number)
+
+    if order is not None:
+        _save(phone_number, {
+            "order": order,
+            "parsed_count": len(texts),
+            "fingerprint": fingerprint,
+        })
+    return order
+
+
+def record_order_state(phone_number, conversation, order):
+    """Store an order produced elsewhere (e.g. a combined reply+order call) as the running state"""
+    if order is None:
+        return
+    texts = customer_messages(conversation)
+    _save(phone_number, {
+        "order": order,
+        "parsed_count": len(texts),
+        "fingerprint": conversation_fingerprint(texts),
+    })
+
+
+def forget_order_state(phone_number):
+    """Drop the cached copy only (the stored state went with its cleared conversation)"""
+    with _lock:
+        _states.pop(phone_number, None)
+
+
+def reset_order_state(phone_number):
+    """Forget the running order (e.g. after it's confirmed or the conversation is reset)"""
+    forget_order_state(phone_number)
+    save_order_state(phone_number, None)
@@ -0,0 +1,188 @@
+"""
+Background reply queue for the /sms webhook
+Lets the webhook ack Twilio right away while a bounded pool of worker
+threads generates the AI reply and sends it back out through Twilio.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REPLY_WORKERS = int(os.getenv("REPLY_WORKERS", "4"))
+REPLY_QUEUE_SIZE = int(os.getenv("REPLY_QUEUE_SIZE", "100"))
+REPLY_DRAIN_TIMEOUT = float(os.getenv("REPLY_DRAIN_TIMEOUT", "30"))
+
+
+class QueueFullError(Exception):
+    """Raised when the reply queue is at capacity"""
+
+
+class TwilioSender:
+    """Sends outbound SMS through the Twilio REST API"""
+
+    def __init__(self, account_sid=None, auth_token=None, from_number=None):
+        from twilio.rest import Client
+
+        self.client = Client(
+            account_sid or os.getenv("TWILIO_ACCOUNT_SID"),
+            auth_token or os.getenv("TWILIO_AUTH_TOKEN"),
+        )
+        self.from_number = from_number or os.getenv("TWILIO_FROM_NUMBER")
+
+    def send(self, to_number, body):
+        message = self.client.messages.create(to=to_number, from_=self.from_number, body=body)
+        return message.sid
+
+
+class StubSender:
+    """Records outbound messages instead of sending them (local testing)"""
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body):
+        with self._lock:
+            self.sent.append({"to": to_number, "body": body})
+            return f"STUB{len(self.sent):06d}"
+
+
+def get_sender():
+    """Pick the outbound sender: TWILIO_SENDER=stub records messages locally"""
+    if os.getenv("TWILIO_SENDER", "twilio").lower() == "stub":
+        return StubSender()
+    return TwilioSender()
+
+
+class ReplyQueue:
+    """
+    Bounded worker pool for reply jobs.
+    handler: callable run on a worker thread for every submitted job
+    backend: any queue.Queue-like object (put_nowait/get), defaults to an in-process queue
+    """
+
+    def __init__(self, handler, workers=REPLY_WORKERS, maxsize=REPLY_QUEUE_SIZE, backend=None):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = backend if backend is not None else queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._accepting = False
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._waits = deque(maxlen=1000)
+        self._total_wait = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._accepting:
+                return
+            self._accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"reply-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, *args):
+        """Queue a job without blocking; raises QueueFullError if the queue is full"""
+        with self._lock:
+            if not self._accepting:
+                raise QueueFullError("Reply queue is not accepting jobs")
+            try:
+                self._queue.put_nowait((time.monotonic(), args))
+            except queue.Full:
+                self.rejected += 1
+                raise QueueFullError(f"Reply queue is full ({self.maxsize} jobs)")
+            self._pending += 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._pending)
+
+    def has_room(self):
+        """True if submit() would accept a job right now (backends without full() always have room)"""
+        with self._lock:
+            full = getattr(self._queue, "full", None)
+            return self._accepting and not (full is not None and full())
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            enqueued_at, args = job
+            wait = time.monotonic() - enqueued_at
+            try:
+                self.handler(*args)
+                ok = True
+            except Exception as e:
+                print(f"❌ Reply job failed: {e}")
+                ok = False
+            with self._lock:
+                self._waits.append(wait)
+                self._total_wait += wait
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    def stats(self):
+        """Queue depth and wait-time metrics"""
+        with self._lock:
+            waits = sorted(self._waits)
+            finished = self.completed + self.failed
+            return {
+                "depth": self._pending,
+                "max_depth": self.max_depth,
+                "capacity": self.maxsize,
+                "workers": self.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self._total_wait / finished * 1000, 2) if finished else 0.0,
+                "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 2) if waits else 0.0,
+                "max_wait_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+            }
+
+    def shutdown(self, drain=True, timeout=REPLY_DRAIN_TIMEOUT):
+        """
+        Stop accepting jobs and stop the workers.
+        drain: wait (up to timeout seconds) for queued jobs to finish first
+        Returns the number of jobs still pending.
+        """
+        with self._lock:
+            if not self._accepting:
+                return self._pending
+            self._accepting = False
+            if drain:
+                deadline = time.monotonic() + timeout
+                while self._pending > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._idle.wait(remaining)
+            pending = self._pending
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+        return pending
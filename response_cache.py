@@ -0,0 +1,126 @@
+"""
+Reply cache for trivial, context-free messages ("hi", "hello", "are you open tomorrow?")
+Keyed by the normalized message text and where it falls in the conversation,
+so a greeting that opens a conversation is answered without an LLM call.
+Messages that could carry order details (numbers, long texts) bypass it.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))  # entries
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
+# Bypass rules: longer messages, or ones matching the pattern, always go to the LLM
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "6"))
+RESPONSE_CACHE_BYPASS_PATTERN = os.getenv("RESPONSE_CACHE_BYPASS_PATTERN", r"\d|@|\b(?:lbs?|pounds?|kg|cases?|order|cancel|confirm|yes|no)\b")
+# Conversation positions that may be cached: first (no earlier messages), mid
+RESPONSE_CACHE_POSITIONS = [p.strip() for p in os.getenv("RESPONSE_CACHE_POSITIONS", "first").split(",") if p.strip()]
+
+
+def normalize_message(text):
+    """'Hiii!! ' / 'hi' / 'HI :)' -> 'hi' (lowercase, no punctuation, stretched letters collapsed)"""
+    text = text.lower()
+    text = re.sub(r"[^a-z0-9@'\s]", " ", text)
+    text = text.replace("'", "")
+    text = re.sub(r"(.)\1{2,}", r"\1", text)
+    return " ".join(text.split())
+
+
+def conversation_position(conversation_history):
+    """'first' when the customer's current message is all there is, else 'mid'"""
+    if not conversation_history or len(conversation_history) <= 1:
+        return "first"
+    return "mid"
+
+
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL,
+                 max_words=RESPONSE_CACHE_MAX_WORDS, bypass_pattern=RESPONSE_CACHE_BYPASS_PATTERN,
+                 positions=RESPONSE_CACHE_POSITIONS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_words = max_words
+        self.bypass = re.compile(bypass_pattern) if bypass_pattern else None
+        self.positions = set(positions)
+        self._entries = OrderedDict()  # (normalized text, position) -> (reply, expires)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        # Running average of a miss's LLM latency, credited as time saved on each hit
+        self.avg_miss_ms = 0.0
+        self.saved_ms = 0.0
+        self.hit_time_us = 0.0
+
+    def key_for(self, message, conversation_history=None):
+        """Cache key for this turn, or None if the bypass rules send it to the LLM"""
+        position = conversation_position(conversation_history)
+        text = normalize_message(message)
+        if (not text or position not in self.positions
+                or len(text.split()) > self.max_words
+                or (self.bypass is not None and self.bypass.search(text))):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        return (text, position)
+
+    def get(self, key):
+        started = time.perf_counter()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += self.avg_miss_ms
+            self.hit_time_us += (time.perf_counter() - started) * 1e6
+            return entry[0]
+
+    def put(self, key, reply, latency_ms=None):
+        """Store a reply; latency_ms is how long the LLM took to produce it"""
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if latency_ms is not None:
+                self.avg_miss_ms = latency_ms if not self.avg_miss_ms else 0.8 * self.avg_miss_ms + 0.2 * latency_ms
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "avg_hit_us": round(self.hit_time_us / self.hits, 1) if self.hits else 0.0,
+                "avg_miss_ms": round(self.avg_miss_ms, 1),
+                "saved_ms": round(self.saved_ms, 1),
+            }
+
+
+response_cache = ResponseCache()
+
+
+def get_response_cache_stats():
+    return response_cache.stats()
@@ -1,36 +1,32 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.oauth2 import service_account as gservice_account
-from googleapiclient.discovery import build
-from datetime import datetime, timezone
-
-# Initialize Firebase only once
-if not firebase_admin._apps:
-    firebase_json_path = os.path.join(os.path.dirname(__file__), "firebase.json")
-    cred = credentials.Certificate(firebase_json_path)
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
-
-# Google Sheets and Drive API setup
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-]
-SERVICE_ACCOUNT_FILE = os.path.join(os.path.dirname(__file__), "google-service-account.json")
+from datetime import datetime, timezone, timedelta
+import random
+import threading
+import time
+from clients import get_firestore, get_sheets_service, get_drive_service
+from telemetry import span
+from llm_usage import usage_ledger
+
+# Firestore, Sheets and Drive clients are created on first use (see clients.py)
+# so importing this module is cheap; the old module attributes still resolve
+_LAZY_CLIENTS = {
+    "db": get_firestore,
+    "sheets_service": get_sheets_service,
+    "drive_service": get_drive_service,
+}
 
-gcredentials = gservice_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES
-)
-sheets_service = build("sheets", "v4", credentials=gcredentials)
-drive_service = build("drive", "v3", credentials=gcredentials)
+def __getattr__(name):
+    if name in _LAZY_CLIENTS:
+        return _LAZY_CLIENTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- NEW: Use one master spreadsheet to avoid quota issues ---
 # MANUALLY CREATE A SPREADSHEET IN YOUR DRIVE AND PASTE THE ID HERE
 MASTER_SPREADSHEET_ID = "1xh0awAjdBRv4MP5poZExV-saRiBZU2Vu2VCu4RLqwHE" 
 
+# SHEETS_OUTBOX=true: confirmed orders go to a local outbox and are flushed in batches
+USE_SHEETS_OUTBOX = os.getenv("SHEETS_OUTBOX", "false").lower() == "true"
+
 # Folder configuration is no longer needed for sheet creation
 # ORDERS_FOLDER_ID = "1tLiyIY-hDVLMBP_mUnxvAAP3y8XiiEte"
 
@@ -39,6 +35,142 @@ def get_orders_folder_id():
     # This is now only for reference, not for creating sheets
     return "1tLiyIY-hDVLMBP_mUnxvAAP3y8XiiEte"
 
+ORDER_HEADER_ROW = [
+    "Order Time", "Customer Phone", "Business Name", "Order Items", 
+    "Delivery Address", "Delivery Date", "Notes", "Status"
+]
+
+# Helper: Sortable tab name for a delivery date
+def tab_name_for_date(delivery_date):
+    """
+    'Friday, January 17, 2025' or '2025-01-17' -> '2025-01-17 (Fri, Jan 17)'
+    Falls back to the delivery_date string itself if it can't be parsed.
+    """
+    try:
+        # Handle various date formats
+        if ',' in delivery_date:
+            # Format like "Friday, January 17, 2025"
+            date_part = delivery_date.split(', ', 1)[1]  # Remove day of week
+            parsed_date = datetime.strptime(date_part, '%B %d, %Y')
+        else:
+            # Try other formats
+            parsed_date = datetime.strptime(delivery_date, '%Y-%m-%d')
+        
+        # Create sortable tab name: "2025-01-17 (Friday, Jan 17)"
+        return f"{parsed_date.strftime('%Y-%m-%d')} ({parsed_date.strftime('%a, %b %d')})"
+    except:
+        # If parsing fails, use original name
+        return delivery_date
+
+# Helper: Spreadsheet row for an order
+def build_order_row(delivery_date, order_data):
+    # Extract business name from address (first part before comma)
+    address = order_data.get("delivery_address", "")
+    business_name = address.split(",")[0].strip() if "," in address else "Unknown Business"
+    
+    # Format order items as a readable string
+    if isinstance(order_data.get("order"), list):
+        # If order is a list of items
+        items_str = ", ".join([f"{item.get('quantity', '')} {item.get('product', '')}" 
+                             for item in order_data.get("order", [])])
+    else:
+        # If order is already a string
+        items_str = str(order_data.get("order", ""))
+    
+    # Prepare row data
+    return [
+        order_data.get("timestamp", datetime.now(timezone.utc).isoformat()),
+        order_data.get("phone", ""),
+        business_name,
+        items_str,
+        order_data.get("delivery_address", ""),
+        delivery_date,
+        order_data.get("notes", ""),
+        "Confirmed"
+    ]
+
+# Helper: Map of tab title -> sheetId for the master spreadsheet
+def get_sheet_ids():
+    # Only ask for tab properties instead of the whole spreadsheet metadata
+    with span("sheets.get_metadata"):
+        sheet_metadata = get_sheets_service().spreadsheets().get(
+            spreadsheetId=MASTER_SPREADSHEET_ID,
+            fields="sheets.properties(sheetId,title)"
+        ).execute()
+    return {
+        sheet["properties"]["title"]: sheet["properties"]["sheetId"]
+        for sheet in sheet_metadata.get("sheets", [])
+    }
+
+# In-memory tab index (title -> sheetId), so orders don't re-read spreadsheet metadata
+_tab_index = None
+_tab_index_lock = threading.Lock()
+
+def get_tab_index(refresh=False):
+    """Cached title -> sheetId map; refresh=True re-reads it from the API"""
+    global _tab_index
+    with _tab_index_lock:
+        if _tab_index is None or refresh:
+            _tab_index = get_sheet_ids()
+        return dict(_tab_index)
+
+def invalidate_tab_index():
+    global _tab_index
+    with _tab_index_lock:
+        _tab_index = None
+
+# Helper: addSheet + header row requests for a new tab, sent as part of one batchUpdate
+def _new_tab_requests(title, sheet_id):
+    return [
+        {
+            'addSheet': {
+                'properties': {
+                    'sheetId': sheet_id,
+                    'title': title
+                }
+            }
+        },
+        {
+            'appendCells': {
+                'sheetId': sheet_id,
+                'rows': [{'values': [{'userEnteredValue': {'stringValue': value}} for value in ORDER_HEADER_ROW]}],
+                'fields': 'userEnteredValue'
+            }
+        }
+    ]
+
+# Helper: Create several tabs (with header rows) in a single batchUpdate
+def create_tabs(titles):
+    global _tab_index
+    titles = list(dict.fromkeys(titles))
+    if not titles:
+        return []
+    used_ids = set(get_tab_index().values())
+    new_ids = {}
+    requests = []
+    for title in titles:
+        # Pick the sheetId ourselves so the index can be updated without re-reading it
+        sheet_id = random.randint(1, 2**31 - 1)
+        while sheet_id in used_ids:
+            sheet_id = random.randint(1, 2**31 - 1)
+        used_ids.add(sheet_id)
+        new_ids[title] = sheet_id
+        requests.extend(_new_tab_requests(title, sheet_id))
+    try:
+        with span("sheets.create_tabs"):
+            get_sheets_service().spreadsheets().batchUpdate(
+                spreadsheetId=MASTER_SPREADSHEET_ID,
+                body={'requests': requests}
+            ).execute()
+    except Exception:
+        # e.g. a concurrent create beat us to it - the cached index can't be trusted
+        invalidate_tab_index()
+        raise
+    with _tab_index_lock:
+        if _tab_index is not None:
+            _tab_index.update(new_ids)
+    return titles
+
 # Helper: Get or create a TAB (sheet) for a delivery date in the master spreadsheet
 def get_or_create_sheet_for_date(delivery_date):
     """
@@ -50,71 +182,57 @@ def get_or_create_sheet_for_date(delivery_date):
 
     try:
         # Create a sortable tab name (YYYY-MM-DD format for easy sorting)
-        from datetime import datetime
-        
-        # Try to parse the delivery_date to create a sortable name
-        try:
-            # Handle various date formats
-            if ',' in delivery_date:
-                # Format like "Friday, January 17, 2025"
-                date_part = delivery_date.split(', ', 1)[1]  # Remove day of week
-                parsed_date = datetime.strptime(date_part, '%B %d, %Y')
-            else:
-                # Try other formats
-                parsed_date = datetime.strptime(delivery_date, '%Y-%m-%d')
-            
-            # Create sortable tab name: "2025-01-17 (Friday, Jan 17)"
-            sortable_name = f"{parsed_date.strftime('%Y-%m-%d')} ({parsed_date.strftime('%a, %b %d')})"
-        except:
-            # If parsing fails, use original name
-            sortable_name = delivery_date
-        
-        # Check if a sheet with this name already exists
-        sheet_metadata = sheets_service.spreadsheets().get(spreadsheetId=MASTER_SPREADSHEET_ID).execute()
-        sheets = sheet_metadata.get('sheets', [])
+        sortable_name = tab_name_for_date(delivery_date)
         
-        for sheet in sheets:
-            sheet_title = sheet.get('properties', {}).get('title', '')
-            # Check both the sortable name and original delivery_date
-            if sheet_title == sortable_name or sheet_title == delivery_date:
+        # Check both the sortable name and original delivery_date, re-reading
+        # the tab list once in case another process created it
+        for refresh in (False, True):
+            index = get_tab_index(refresh=refresh)
+            if sortable_name in index or delivery_date in index:
                 return MASTER_SPREADSHEET_ID
 
-        # If not found, create a new tab with the sortable name
-        body = {
-            'requests': [
-                {
-                    'addSheet': {
-                        'properties': {
-                            'title': sortable_name
-                        }
-                    }
-                }
-            ]
-        }
-        sheets_service.spreadsheets().batchUpdate(
-            spreadsheetId=MASTER_SPREADSHEET_ID,
-            body=body
-        ).execute()
-
-        # Add header row to the new sheet
-        header_row = [
-            "Order Time", "Customer Phone", "Business Name", "Order Items", 
-            "Delivery Address", "Delivery Date", "Notes", "Status"
-        ]
-        
-        # Use the sortable name in the range
-        sheets_service.spreadsheets().values().append(
-            spreadsheetId=MASTER_SPREADSHEET_ID,
-            range=f"'{sortable_name}'!A1", 
-            valueInputOption="RAW",
-            body={"values": [header_row]}
-        ).execute()
+        # If not found, create a new tab (and its header row) with the sortable name
+        try:
+            create_tabs([sortable_name])
+        except Exception:
+            if sortable_name not in get_tab_index():
+                raise
 
         return MASTER_SPREADSHEET_ID
 
     except Exception as e:
         raise e
 
+# Helper: Pre-create the next few days' tabs so confirmations never pay for it
+def provision_date_tabs(days=7, start_date=None):
+    """
+    Create any missing tabs for start_date (default today) through the next `days` days.
+    Returns the titles that were created.
+    """
+    start_date = start_date or datetime.now().date()
+    titles = [
+        tab_name_for_date((start_date + timedelta(days=offset)).strftime('%Y-%m-%d'))
+        for offset in range(days)
+    ]
+    index = get_tab_index(refresh=True)
+    return create_tabs([title for title in titles if title not in index])
+
+def start_tab_provisioner(days=7, interval=6 * 3600):
+    """Background job that keeps the next `days` days of tabs provisioned"""
+    def loop():
+        while True:
+            try:
+                created = provision_date_tabs(days)
+                if created:
+                    print(f"📅 Provisioned order tabs: {', '.join(created)}")
+            except Exception as e:
+                print(f"⚠️  Tab provisioning failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="sheets-tab-provisioner", daemon=True)
+    thread.start()
+    return thread
+
 # Helper: Add an order to the correct sheet (now a tab)
 def add_order_to_sheet(delivery_date, order_data):
     """
@@ -126,50 +244,17 @@ def add_order_to_sheet(delivery_date, order_data):
         spreadsheet_id = get_or_create_sheet_for_date(delivery_date)
         
         # Create the same sortable tab name used in get_or_create_sheet_for_date
-        from datetime import datetime
-        try:
-            if ',' in delivery_date:
-                date_part = delivery_date.split(', ', 1)[1]
-                parsed_date = datetime.strptime(date_part, '%B %d, %Y')
-            else:
-                parsed_date = datetime.strptime(delivery_date, '%Y-%m-%d')
-            
-            tab_name = f"{parsed_date.strftime('%Y-%m-%d')} ({parsed_date.strftime('%a, %b %d')})"
-        except:
-            tab_name = delivery_date
-        
-        # Extract business name from address (first part before comma)
-        address = order_data.get("delivery_address", "")
-        business_name = address.split(",")[0].strip() if "," in address else "Unknown Business"
-        
-        # Format order items as a readable string
-        if isinstance(order_data.get("order"), list):
-            # If order is a list of items
-            items_str = ", ".join([f"{item.get('quantity', '')} {item.get('product', '')}" 
-                                 for item in order_data.get("order", [])])
-        else:
-            # If order is already a string
-            items_str = str(order_data.get("order", ""))
-        
-        # Prepare row data
-        row = [
-            order_data.get("timestamp", datetime.now(timezone.utc).isoformat()),
-            order_data.get("phone", ""),
-            business_name,
-            items_str,
-            order_data.get("delivery_address", ""),
-            delivery_date,
-            order_data.get("notes", ""),
-            "Confirmed"
-        ]
+        tab_name = tab_name_for_date(delivery_date)
+        row = build_order_row(delivery_date, order_data)
         
         # Add row to spreadsheet, using the sortable tab name
-        sheets_service.spreadsheets().values().append(
-            spreadsheetId=spreadsheet_id,
-            range=f"'{tab_name}'!A1",
-            valueInputOption="RAW",
-            body={"values": [row]}
-        ).execute()
+        with span("sheets.append"):
+            get_sheets_service().spreadsheets().values().append(
+                spreadsheetId=spreadsheet_id,
+                range=f"'{tab_name}'!A1",
+                valueInputOption="RAW",
+                body={"values": [row]}
+            ).execute()
         
         return spreadsheet_id
         
@@ -195,8 +280,18 @@ def process_confirmed_order(phone_number, order_details):
         
         delivery_date = order_details.get("delivery_date", "")
         
-        # Add to spreadsheet
-        spreadsheet_id = add_order_to_sheet(delivery_date, order_data)
+        if USE_SHEETS_OUTBOX:
+            # Durable local write now, batched Sheets write later
+            from sheets_outbox import enqueue_order
+            enqueue_order(delivery_date, order_data)
+            spreadsheet_id = MASTER_SPREADSHEET_ID
+        else:
+            # Add to spreadsheet
+            spreadsheet_id = add_order_to_sheet(delivery_date, order_data)
+        
+        # What the conversation behind this order cost in tokens, stored with the usage totals.
+        # Only once the order is written, so a failed write that gets retried isn't rolled up twice
+        usage_ledger.close_order(phone_number, order_ref=order_data["timestamp"])
         
         return spreadsheet_id
         
@@ -207,7 +302,7 @@ def process_confirmed_order(phone_number, order_details):
 def list_order_sheets():
     """Get all order sheets from Firestore"""
     try:
-        sheets_ref = db.collection("order_sheets")
+        sheets_ref = get_firestore().collection("order_sheets")
         docs = sheets_ref.stream()
         
         sheets = []
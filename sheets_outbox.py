@@ -0,0 +1,302 @@
+"""
+Durable outbox for Google Sheets order rows
+Confirmed orders are written to a local SQLite file first, then a background
+flusher appends them to the master spreadsheet in batches, paced to stay
+under the Sheets per-minute write quota and retried with backoff on errors.
+Flushers claim rows with a lease before sending them, so several processes
+can share one outbox file without appending the same row twice.
+"""
+
+import os
+import json
+import uuid
+import time
+import random
+import sqlite3
+import threading
+import atexit
+from dotenv import load_dotenv
+from telemetry import span, log
+
+load_dotenv()
+
+SHEETS_OUTBOX_PATH = os.getenv("SHEETS_OUTBOX_PATH", os.path.join(os.path.dirname(__file__), "sheets_outbox.db"))
+SHEETS_WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+SHEETS_FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", "2"))  # seconds
+SHEETS_FLUSH_BATCH = int(os.getenv("SHEETS_FLUSH_BATCH", "200"))  # rows per flush
+SHEETS_MAX_ATTEMPTS = int(os.getenv("SHEETS_MAX_ATTEMPTS", "8"))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "2"))  # seconds
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "300"))  # seconds
+SHEETS_CLAIM_SECONDS = float(os.getenv("SHEETS_CLAIM_SECONDS", "300"))  # lease on claimed rows
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` requests per minute with bursts up to `capacity`"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until `tokens` are available; returns False if timeout runs out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SheetsOutbox:
+    def __init__(self, path=SHEETS_OUTBOX_PATH, writes_per_minute=SHEETS_WRITES_PER_MINUTE, sheets=None):
+        """
+        path: SQLite file holding the outbox
+        sheets: module providing the Sheets helpers (defaults to sheets_logic)
+        """
+        self.path = path
+        self.bucket = TokenBucket(writes_per_minute)
+        self._sheets = sheets
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._owner = uuid.uuid4().hex  # claimed_by value of this flusher
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tab TEXT NOT NULL,
+                delivery_date TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created REAL NOT NULL,
+                flushed_at REAL,
+                claimed_by TEXT,
+                claimed_until REAL
+            )
+        """)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        for column, kind in (("claimed_by", "TEXT"), ("claimed_until", "REAL")):
+            if column not in columns:  # Outbox file from before claims
+                self._conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {kind}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, next_attempt)")
+        self._conn.commit()
+
+    @property
+    def sheets(self):
+        if self._sheets is None:
+            import sheets_logic
+            self._sheets = sheets_logic
+        return self._sheets
+
+    def enqueue(self, delivery_date, order_data):
+        """Durably record an order row; returns the outbox id"""
+        row = self.sheets.build_order_row(delivery_date, order_data)
+        tab = self.sheets.tab_name_for_date(delivery_date)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (tab, delivery_date, row_json, created) VALUES (?, ?, ?, ?)",
+                (tab, delivery_date, json.dumps(row), time.time())
+            )
+            self._conn.commit()
+        self._wake.set()
+        return cursor.lastrowid
+
+    def _claim_rows(self):
+        """Lease due rows to this flusher; one UPDATE, so two flushers never get the same row"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE outbox SET claimed_by = ?, claimed_until = ? WHERE id IN ("
+                "SELECT id FROM outbox WHERE status = 'pending' AND next_attempt <= ? "
+                "AND (claimed_until IS NULL OR claimed_until < ?) ORDER BY id LIMIT ?"
+                ") RETURNING id, tab, delivery_date, row_json, attempts",
+                (self._owner, now + SHEETS_CLAIM_SECONDS, now, now, SHEETS_FLUSH_BATCH)
+            ).fetchall()
+            self._conn.commit()
+        return sorted(rows)
+
+    def _sheet_ids_for(self, rows):
+        """title -> sheetId for every tab in this batch, creating missing tabs first"""
+        sheet_ids = self.sheets.get_tab_index()  # Cached, normally no API call
+        missing = sorted({
+            tab for _, tab, delivery_date, _, _ in rows
+            if tab and tab not in sheet_ids and delivery_date not in sheet_ids
+        })
+        if missing:
+            # All missing tabs (with headers) in one call
+            self.bucket.acquire()
+            try:
+                self.sheets.create_tabs(missing)
+            except Exception:
+                pass  # Possibly created concurrently; the refresh below tells us
+            self.bucket.acquire()
+            sheet_ids = self.sheets.get_tab_index(refresh=True)
+        return sheet_ids
+
+    def flush_once(self):
+        """Send every due row, one batchUpdate per tab; returns the number of rows flushed"""
+        with self._flush_lock:
+            rows = self._claim_rows()
+            if not rows:
+                return 0
+            try:
+                sheet_ids = self._sheet_ids_for(rows)
+            except Exception as e:
+                self._record_failure(rows, e)
+                return 0
+
+            by_tab = {}
+            for row in rows:
+                _, tab, delivery_date, _, _ = row
+                sheet_id = sheet_ids.get(tab, sheet_ids.get(delivery_date))
+                by_tab.setdefault(sheet_id, []).append(row)
+
+            flushed = 0
+            for sheet_id, tab_rows in by_tab.items():
+                if sheet_id is None:
+                    # No tab to append to (e.g. an empty delivery date); don't send it to another tab
+                    self._record_failure(tab_rows, f"No sheet tab for {tab_rows[0][1]!r}")
+                    continue
+                flushed += self._send(sheet_id, tab_rows)
+            return flushed
+
+    def _send(self, sheet_id, rows):
+        """appendCells for one tab; if the batch fails, retry its rows one at a time
+        so a single bad row doesn't hold back (or fail) the rest"""
+        try:
+            self._append(sheet_id, rows)
+        except Exception as e:
+            if len(rows) == 1:
+                self._record_failure(rows, e)
+                return 0
+            log(f"⚠️  Sheets outbox batch failed ({len(rows)} rows), retrying one by one: {e}")
+            return sum(self._send(sheet_id, [row]) for row in rows)
+        self._mark_flushed(rows)
+        return len(rows)
+
+    def _append(self, sheet_id, rows):
+        request = {
+            "appendCells": {
+                "sheetId": sheet_id,
+                "rows": [
+                    {"values": [{"userEnteredValue": {"stringValue": str(value)}} for value in json.loads(row_json)]}
+                    for _, _, _, row_json, _ in rows
+                ],
+                "fields": "userEnteredValue"
+            }
+        }
+        self.bucket.acquire()
+        with span("sheets.outbox_flush"):
+            self.sheets.sheets_service.spreadsheets().batchUpdate(
+                spreadsheetId=self.sheets.MASTER_SPREADSHEET_ID,
+                body={"requests": [request]}
+            ).execute()
+
+    def _mark_flushed(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'flushed', flushed_at = ?, last_error = NULL, "
+                "claimed_by = NULL, claimed_until = NULL WHERE id = ? AND claimed_by = ?",
+                [(time.time(), row[0], self._owner) for row in rows]
+            )
+            self._conn.commit()
+
+    def _record_failure(self, rows, error):
+        log(f"⚠️  Sheets outbox flush failed ({len(rows)} rows): {error}")
+        now = time.time()
+        updates = []
+        for row_id, _, _, _, attempts in rows:
+            attempts += 1
+            status = "failed" if attempts >= SHEETS_MAX_ATTEMPTS else "pending"
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempts))
+            updates.append((status, attempts, now + delay, str(error)[:500], row_id, self._owner))
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ?, "
+                "claimed_by = NULL, claimed_until = NULL WHERE id = ? AND claimed_by = ?",
+                updates
+            )
+            self._conn.commit()
+
+    def retry_failed(self):
+        """Put rows that ran out of attempts back in the queue"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = 0, "
+                "claimed_by = NULL, claimed_until = NULL WHERE status = 'failed'"
+            )
+            self._conn.commit()
+        self._wake.set()
+        return cursor.rowcount
+
+    def stats(self):
+        """Row counts by status: pending, flushed, failed"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "flushed", "failed")}
+
+    def start(self, interval=SHEETS_FLUSH_INTERVAL):
+        """Run the flusher on a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                flushed = self.flush_once()
+                if not flushed:
+                    self._wake.wait(interval)
+                    self._wake.clear()
+
+        self._thread = threading.Thread(target=loop, name="sheets-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """Stop the flusher, making one last flush attempt first if drain is set"""
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+        if drain:
+            self.flush_once()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """Shared outbox with its flusher running"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = SheetsOutbox()
+            _outbox.start()
+            atexit.register(_outbox.stop)
+        return _outbox
+
+
+def enqueue_order(delivery_date, order_data):
+    return get_outbox().enqueue(delivery_date, order_data)
+
+
+def get_outbox_stats():
+    return get_outbox().stats()
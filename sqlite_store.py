@@ -0,0 +1,388 @@
+"""
+Local SQLite conversation store
+Drop-in replacement for the Firestore storage behind firebase_logic, for
+single-node deployments, offline runs and load tests. Selected with
+CONVERSATION_STORE=sqlite; messages live in one WAL-mode file, ordered by
+the same client sequence numbers the Firestore path uses.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from store_config import CONVERSATION_HEAD_SIZE
+
+load_dotenv()
+
+SQLITE_STORE_PATH = os.getenv("SQLITE_STORE_PATH", os.path.join(os.path.dirname(__file__), "conversations.db"))
+STREAM_CHUNK = 500  # rows fetched per query while streaming
+
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+def _row_to_message(row):
+    msg_id, seq, direction, text, ts = row
+    return {"id": msg_id, "seq": seq, "direction": direction, "text": text, "timestamp": _to_datetime(ts)}
+
+
+class SQLiteConversationStore:
+    """Same operations and message shape ({id, seq, direction, text, timestamp}) as firebase_logic"""
+
+    def __init__(self, path=SQLITE_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commits survive a process crash, only an OS crash can lose the last few
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                phone TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                direction TEXT NOT NULL,
+                text TEXT NOT NULL,
+                timestamp REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS messages_phone_seq ON messages (phone, seq)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                phone TEXT PRIMARY KEY,
+                data_json TEXT NOT NULL
+            )
+        """)
+        # Token accounting (see llm_usage.py): running totals and per-order rollups
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                phone TEXT NOT NULL,
+                call_type TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                PRIMARY KEY (phone, call_type)
+            )
+        """)
+        # Webhook idempotency records keyed by Twilio MessageSid (see idempotency.py)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_requests (
+                sid TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                response_json TEXT,
+                updated REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_costs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phone TEXT NOT NULL,
+                confirmed_at REAL NOT NULL,
+                data_json TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def _load_conversation(self, phone_number):
+        row = self._conn.execute("SELECT data_json FROM conversations WHERE phone = ?", (phone_number,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _merge_conversation(self, phone_number, fields, data=None):
+        if data is None:
+            data = self._load_conversation(phone_number)
+        data.update(fields)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations (phone, data_json) VALUES (?, ?)",
+            (phone_number, json.dumps(data))
+        )
+
+    def store_turn(self, phone_number, messages, next_seq, metadata=None, head_size=CONVERSATION_HEAD_SIZE):
+        """
+        Store a turn's messages (and optional conversation metadata) in one transaction,
+        updating the conversation head (last head_size messages and the message count) with them.
+        next_seq: callable returning the next sequence number
+        Returns the stored messages.
+        """
+        now = datetime.now(timezone.utc)
+        stored = []
+        for msg in messages:
+            stored.append({
+                "id": uuid.uuid4().hex[:20],
+                "seq": next_seq(),
+                "direction": msg["direction"],
+                "text": msg["text"],
+                "timestamp": now,
+            })
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (id, phone, seq, direction, text, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                [(m["id"], phone_number, m["seq"], m["direction"], m["text"], now.timestamp()) for m in stored]
+            )
+            data = self._load_conversation(phone_number)
+            if "message_count" in data:
+                count = data["message_count"] + len(stored)
+            else:
+                # First turn, or a conversation stored before heads existed
+                count = self._conn.execute("SELECT COUNT(*) FROM messages WHERE phone = ?", (phone_number,)).fetchone()[0]
+            recent = data.get("recent", []) + [{**m, "timestamp": now.timestamp()} for m in stored]
+            head = {"recent": recent[-head_size:] if head_size > 0 else [], "message_count": count}
+            self._merge_conversation(phone_number, {**(metadata or {}), **head}, data)
+        return stored
+
+    def get_conversation_head(self, phone_number):
+        """
+        Same contract as firebase_logic.get_conversation_head:
+        {recent, message_count, order_state, awaiting_confirmation, reply_pending}, or None without a head
+        """
+        with self._lock:
+            data = self._load_conversation(phone_number)
+        if "message_count" not in data:
+            return None
+        return {
+            "recent": [{**m, "timestamp": _to_datetime(m["timestamp"])} for m in data.get("recent", [])],
+            "message_count": data["message_count"],
+            "order_state": data.get("order_state"),
+            "awaiting_confirmation": data.get("awaiting_confirmation", False),
+            "reply_pending": data.get("reply_pending", False),
+        }
+
+    def get_messages(self, phone_number, limit=None):
+        """Oldest first; limit keeps only the most recent `limit` messages"""
+        if limit is not None and limit <= 0:
+            return []
+        with self._lock:
+            if limit is None:
+                rows = self._conn.execute(
+                    "SELECT id, seq, direction, text, timestamp FROM messages WHERE phone = ? ORDER BY seq",
+                    (phone_number,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, seq, direction, text, timestamp FROM messages WHERE phone = ? ORDER BY seq DESC LIMIT ?",
+                    (phone_number, limit)
+                ).fetchall()
+                rows.reverse()
+        return [_row_to_message(row) for row in rows]
+
+    def _cursor_seq(self, phone_number, message_id):
+        row = self._conn.execute(
+            "SELECT seq FROM messages WHERE phone = ? AND id = ?", (phone_number, message_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_messages_page(self, phone_number, limit=50, before=None, after=None, since=None):
+        """Same contract as firebase_logic.get_messages_page: returns (messages, has_more)"""
+        where = "phone = ?"
+        params = [phone_number]
+        if since is not None:
+            where += " AND timestamp >= ?"
+            params.append(since.timestamp())
+
+        with self._lock:
+            if after is not None:
+                seq = self._cursor_seq(phone_number, after)
+                if seq is None:
+                    return [], False
+                rows = self._conn.execute(
+                    f"SELECT id, seq, direction, text, timestamp FROM messages WHERE {where} AND seq > ? ORDER BY seq LIMIT ?",
+                    params + [seq, limit + 1]
+                ).fetchall()
+                return [_row_to_message(row) for row in rows[:limit]], len(rows) > limit
+
+            if before is not None:
+                seq = self._cursor_seq(phone_number, before)
+                if seq is None:
+                    return [], False
+                where += " AND seq < ?"
+                params.append(seq)
+            rows = self._conn.execute(
+                f"SELECT id, seq, direction, text, timestamp FROM messages WHERE {where} ORDER BY seq DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        return [_row_to_message(row) for row in rows], has_more
+
+    def stream_messages(self, phone_number, since=None):
+        """Yield every message oldest first, a chunk at a time"""
+        last_seq = -1
+        min_ts = since.timestamp() if since is not None else float("-inf")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, seq, direction, text, timestamp FROM messages "
+                    "WHERE phone = ? AND seq > ? AND timestamp >= ? ORDER BY seq LIMIT ?",
+                    (phone_number, last_seq, min_ts, STREAM_CHUNK)
+                ).fetchall()
+            for row in rows:
+                yield _row_to_message(row)
+            if len(rows) < STREAM_CHUNK:
+                return
+            last_seq = rows[-1][1]
+
+    def clear_conversation(self, phone_number):
+        """Delete the conversation's messages and metadata; returns the message count"""
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM messages WHERE phone = ?", (phone_number,)).rowcount
+            self._conn.execute("DELETE FROM conversations WHERE phone = ?", (phone_number,))
+        return deleted
+
+    def purge_conversations(self, dry_run=False, older_than_days=None, progress=None):
+        """
+        Delete (or count, with dry_run) every conversation, or only those with no messages
+        in older_than_days; same semantics as bulk_purge.purge_all_conversations.
+        progress: bulk_purge.PurgeProgress to report to. Returns the message count.
+        """
+        cutoff = time.time() - older_than_days * 86400 if older_than_days else None
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT c.phone, MAX(m.timestamp), COUNT(m.id) FROM conversations c "
+                "LEFT JOIN messages m ON m.phone = c.phone GROUP BY c.phone "
+                "UNION SELECT phone, MAX(timestamp), COUNT(*) FROM messages "
+                "WHERE phone NOT IN (SELECT phone FROM conversations) GROUP BY phone"
+            ).fetchall()
+            purged = [(phone, count) for phone, last, count in rows if cutoff is None or last is None or last < cutoff]
+            if not dry_run:
+                phones = [(phone,) for phone, _ in purged]
+                self._conn.executemany("DELETE FROM messages WHERE phone = ?", phones)
+                self._conn.executemany("DELETE FROM conversations WHERE phone = ?", phones)
+        documents = sum(count for _, count in purged)
+        if progress is not None:
+            progress.add(documents=documents, conversations=len(purged), commits=0 if dry_run else 1)
+        return documents
+
+    def load_order_state(self, phone_number):
+        with self._lock:
+            row = self._conn.execute("SELECT data_json FROM conversations WHERE phone = ?", (phone_number,)).fetchone()
+        return json.loads(row[0]).get("order_state") if row else None
+
+    def save_order_state(self, phone_number, order_state):
+        fields = {"order_state": order_state}
+        if order_state is None:
+            # No running order, so nothing is waiting to be confirmed
+            fields["awaiting_confirmation"] = False
+        with self._lock, self._conn:
+            self._merge_conversation(phone_number, fields)
+
+    def load_history_summary(self, phone_number):
+        with self._lock:
+            return self._load_conversation(phone_number).get("history_summary")
+
+    def save_history_summary(self, phone_number, summary):
+        with self._lock, self._conn:
+            self._merge_conversation(phone_number, {"history_summary": summary})
+
+    def store_usage(self, usage, orders):
+        """Add token usage increments and store per-order cost rollups, in one transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO llm_usage (phone, call_type, calls, prompt_tokens, completion_tokens, cost_usd) "
+                "VALUES (:phone, :call_type, :calls, :prompt_tokens, :completion_tokens, :cost_usd) "
+                "ON CONFLICT (phone, call_type) DO UPDATE SET "
+                "calls = calls + excluded.calls, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "cost_usd = cost_usd + excluded.cost_usd",
+                usage
+            )
+            self._conn.executemany(
+                "INSERT INTO order_costs (phone, confirmed_at, data_json) VALUES (?, ?, ?)",
+                [(order["phone"], order["confirmed_at"], json.dumps(order)) for order in orders]
+            )
+
+    def get_usage(self, phone_number):
+        """call_type -> {calls, prompt_tokens, completion_tokens, cost_usd} for one phone"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT call_type, calls, prompt_tokens, completion_tokens, cost_usd FROM llm_usage WHERE phone = ?",
+                (phone_number,)
+            ).fetchall()
+        return {
+            call_type: {"calls": calls, "prompt_tokens": prompt, "completion_tokens": completion, "cost_usd": cost}
+            for call_type, calls, prompt, completion, cost in rows
+        }
+
+    def get_order_costs(self, phone_number):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data_json FROM order_costs WHERE phone = ? ORDER BY id", (phone_number,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def claim_webhook_request(self, sid, stale_after):
+        """
+        Mark a MessageSid as in flight. Returns None if this caller now owns it,
+        otherwise the existing record {status, response, updated}.
+        An in-flight claim older than stale_after seconds (its process died) is taken over.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            claimed = self._conn.execute(
+                "INSERT OR IGNORE INTO webhook_requests (sid, status, response_json, updated) VALUES (?, 'in_flight', NULL, ?)",
+                (sid, now)
+            ).rowcount
+            if claimed:
+                return None
+            status, response_json, updated = self._conn.execute(
+                "SELECT status, response_json, updated FROM webhook_requests WHERE sid = ?", (sid,)
+            ).fetchone()
+            if status == "in_flight" and updated < now - stale_after:
+                taken = self._conn.execute(
+                    "UPDATE webhook_requests SET updated = ? WHERE sid = ? AND status = 'in_flight' AND updated = ?",
+                    (now, sid, updated)
+                ).rowcount
+                if taken:
+                    return None
+        return {"status": status, "response": json.loads(response_json) if response_json else None, "updated": updated}
+
+    def get_webhook_request(self, sid):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, response_json, updated FROM webhook_requests WHERE sid = ?", (sid,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, response_json, updated = row
+        return {"status": status, "response": json.loads(response_json) if response_json else None, "updated": updated}
+
+    def finish_webhook_request(self, sid, response):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO webhook_requests (sid, status, response_json, updated) VALUES (?, 'done', ?, ?)",
+                (sid, json.dumps(response), time.time())
+            )
+
+    def release_webhook_request(self, sid):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM webhook_requests WHERE sid = ? AND status = 'in_flight'", (sid,))
+
+    def prune_webhook_requests(self, older_than):
+        """Delete records last updated more than older_than seconds ago; returns the count"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "DELETE FROM webhook_requests WHERE updated < ?", (time.time() - older_than,)
+            ).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_sqlite_store():
+    """The shared SQLite store, opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteConversationStore()
+        return _store
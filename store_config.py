@@ -0,0 +1,14 @@
+"""
+Conversation storage settings shared by firebase_logic and the SQLite store
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# firestore (default) or sqlite
+CONVERSATION_STORE = os.getenv("CONVERSATION_STORE", "firestore").lower()
+# Messages kept on the conversation head (the parent document), enough for one turn's context
+# (history_window.HISTORY_CONTEXT_MESSAGES) so a reply's history is a single read
+CONVERSATION_HEAD_SIZE = int(os.getenv("CONVERSATION_HEAD_SIZE", "30"))
@@ -0,0 +1,220 @@
+"""
+Per-stage timing spans, request trace IDs and Prometheus-format metrics
+Every external call (Firestore, OpenAI, Sheets) and the order parse runs inside
+span("<stage>"), which records its latency in a fixed-bucket histogram, tracks
+how many are in flight and counts errors. Recording is a couple of
+perf_counter() calls and one short lock, cheap enough to leave on.
+render_metrics() is served by app.py at /metrics.
+"""
+
+import os
+import time
+import bisect
+import threading
+import contextvars
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# TELEMETRY=false: spans still run the code, they just don't record anything
+TELEMETRY = os.getenv("TELEMETRY", "true").lower() == "true"
+# Spans slower than this are logged with their trace ID (0 turns it off)
+TELEMETRY_SLOW_MS = float(os.getenv("TELEMETRY_SLOW_MS", "2000"))
+# Histogram bucket upper bounds, in seconds
+TELEMETRY_BUCKETS = tuple(sorted(
+    float(b) for b in os.getenv("TELEMETRY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30").split(",")
+))
+
+METRIC_PREFIX = "sms"
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+def new_trace_id():
+    return os.urandom(8).hex()
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+class trace:
+    """
+    Context manager that sets the trace ID for everything run inside it.
+    trace_id: e.g. the Twilio MessageSid; a random one is made up if not given
+    """
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or new_trace_id()
+        self._token = None
+
+    def __enter__(self):
+        self._token = _trace_id.set(self.trace_id)
+        return self.trace_id
+
+    def __exit__(self, exc_type, exc, tb):
+        _trace_id.reset(self._token)
+        return False
+
+
+def log(message):
+    """print() with the current trace ID in front, so log lines of one request can be grouped"""
+    trace_id = _trace_id.get()
+    print(f"[{trace_id}] {message}" if trace_id else message)
+
+
+class _Stage:
+    __slots__ = ("counts", "total", "count", "in_flight", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(TELEMETRY_BUCKETS) + 1)  # last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.in_flight = 0
+        self.errors = 0
+
+
+_stages = {}
+_lock = threading.Lock()
+
+
+def _stage(name):
+    stage = _stages.get(name)
+    if stage is None:
+        with _lock:
+            stage = _stages.setdefault(name, _Stage())
+    return stage
+
+
+def observe(name, seconds, error=False):
+    """Record one finished call of a stage"""
+    if TELEMETRY:
+        _record(_stage(name), name, seconds, error)
+
+
+def _record(stage, name, seconds, error, finished=False):
+    bucket = bisect.bisect_left(TELEMETRY_BUCKETS, seconds)
+    with _lock:
+        if finished:
+            stage.in_flight -= 1
+        stage.counts[bucket] += 1
+        stage.total += seconds
+        stage.count += 1
+        if error:
+            stage.errors += 1
+    if TELEMETRY_SLOW_MS and seconds * 1000 >= TELEMETRY_SLOW_MS:
+        log(f"🐢 {name} took {seconds * 1000:.0f} ms{' (failed)' if error else ''}")
+
+
+class span:
+    """
+    with span("openai.reply"): ...
+    Times the block under the given stage name; an exception counts as an error and is re-raised.
+    """
+
+    __slots__ = ("name", "_stage", "_started")
+
+    def __init__(self, name):
+        self.name = name
+        self._stage = None
+        self._started = None
+
+    def __enter__(self):
+        if TELEMETRY:
+            self._stage = _stage(self.name)
+            with _lock:
+                self._stage.in_flight += 1
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._stage is None:
+            return False
+        elapsed = time.perf_counter() - self._started
+        # A generator closed early (GeneratorExit) isn't a failure
+        _record(self._stage, self.name, elapsed, exc_type is not None and issubclass(exc_type, Exception), finished=True)
+        return False
+
+
+def get_stage_stats():
+    """Per-stage count, errors, in-flight and average latency"""
+    with _lock:
+        return {
+            name: {
+                "count": stage.count,
+                "errors": stage.errors,
+                "in_flight": stage.in_flight,
+                "avg_ms": round(stage.total / stage.count * 1000, 2) if stage.count else 0.0,
+            }
+            for name, stage in sorted(_stages.items())
+        }
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+# Other modules' stats() dicts, exported as gauges: name -> callable returning {key: number}
+_collectors = {}
+
+
+def register_collector(name, collect):
+    """Export collect()'s numeric values as sms_<name>_<key> gauges on /metrics"""
+    _collectors[name] = collect
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        snapshot = [
+            (name, list(stage.counts), stage.total, stage.count, stage.in_flight, stage.errors)
+            for name, stage in sorted(_stages.items())
+        ]
+
+    histogram = f"{METRIC_PREFIX}_stage_duration_seconds"
+    lines = [
+        f"# HELP {histogram} Time spent in each stage of a turn",
+        f"# TYPE {histogram} histogram",
+    ]
+    for name, counts, total, count, _, _ in snapshot:
+        cumulative = 0
+        for bound, bucket_count in zip(TELEMETRY_BUCKETS + (float("inf"),), counts):
+            cumulative += bucket_count
+            lines.append(f'{histogram}_bucket{{stage="{name}",le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f'{histogram}_sum{{stage="{name}"}} {_format_value(total)}')
+        lines.append(f'{histogram}_count{{stage="{name}"}} {count}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_stage_in_flight Calls currently running in each stage")
+    lines.append(f"# TYPE {METRIC_PREFIX}_stage_in_flight gauge")
+    for name, _, _, _, in_flight, _ in snapshot:
+        lines.append(f'{METRIC_PREFIX}_stage_in_flight{{stage="{name}"}} {in_flight}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_stage_errors_total Calls in each stage that raised")
+    lines.append(f"# TYPE {METRIC_PREFIX}_stage_errors_total counter")
+    for name, _, _, _, _, errors in snapshot:
+        lines.append(f'{METRIC_PREFIX}_stage_errors_total{{stage="{name}"}} {errors}')
+
+    for collector, collect in sorted(_collectors.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            log(f"⚠️  Metrics collector {collector} failed: {e}")
+            continue
+        for key, value in values.items():
+            # Strings (modes, ids) and missing values aren't metrics
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            metric = f"{METRIC_PREFIX}_{collector}_{key}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: how long a fresh interpreter takes to import each module
+Usage: python tests/bench_import_time.py [--runs N] [--budget-ms MS] [--clients]
+  --budget-ms MS  exit non-zero if any module's median import time is over MS
+  --clients       also time first creation of each API client (needs credentials)
+"""
+
+import sys
+import os
+import subprocess
+import statistics
+import argparse
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+MODULES = ["firebase_logic", "sheets_logic", "openai_logic", "app"]
+
+def import_time_ms(module):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print((time.perf_counter() - start) * 1000)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+    return float(result.stdout.strip().splitlines()[-1])
+
+def bench_imports(runs):
+    print("🧊 Cold import time (fresh interpreter, median)")
+    medians = {}
+    for module in MODULES:
+        try:
+            timings = [import_time_ms(module) for _ in range(runs)]
+        except RuntimeError as e:
+            print(f"   {module:<16} ❌ {e}")
+            continue
+        medians[module] = statistics.median(timings)
+        print(f"   {module:<16} {medians[module]:8.1f} ms  (min {min(timings):.1f}, max {max(timings):.1f})")
+    return medians
+
+def bench_clients():
+    import clients
+
+    print("\n🔌 First client creation")
+    for name, getter in [
+        ("firestore", clients.get_firestore),
+        ("sheets", clients.get_sheets_service),
+        ("drive", clients.get_drive_service),
+        ("openai", clients.get_openai_client),
+    ]:
+        try:
+            getter()
+            print(f"   {name:<16} {clients.init_times[name] * 1000:8.1f} ms")
+        except Exception as e:
+            print(f"   {name:<16} ❌ {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "0")))
+    parser.add_argument("--clients", action="store_true")
+    args = parser.parse_args()
+
+    medians = bench_imports(args.runs)
+    if args.clients:
+        bench_clients()
+
+    if args.budget_ms:
+        over = {m: t for m, t in medians.items() if t > args.budget_ms}
+        if over:
+            print(f"\n❌ Over the {args.budget_ms:.0f} ms budget: {', '.join(over)}")
+            sys.exit(1)
+        print(f"\n✅ All imports within {args.budget_ms:.0f} ms")
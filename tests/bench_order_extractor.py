@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: rule-based order extractor vs. the LLM extraction path
+Usage: python tests/bench_order_extractor.py [--llm N]
+  --llm N  also time N real parse_order_from_conversation calls (needs OPENAI_API_KEY)
+"""
+
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_extractor import extract_items
+
+# Typical inbound texts, roughly in the mix we see from customers
+SAMPLE_MESSAGES = [
+    "10 lbs salmon, 5 pounds halibut",
+    "Hey! I need 2 cases of king salmon and 3kg cod please",
+    "salmon 20 lbs",
+    "ten pounds of spot prawns",
+    "16 oz crab",
+    "20 lbs",
+    "need 15 lbs black cod and 10 lbs rockfish",
+    "hi",
+    "Can you deliver Friday?",
+    "123 Main St, Seattle",
+    "what's the price of halibut?",
+    "actually make the salmon 25 lbs",
+]
+
+def bench_extractor(rounds):
+    hits = 0
+    for message in SAMPLE_MESSAGES:
+        _, confident = extract_items(message)
+        hits += confident
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in SAMPLE_MESSAGES:
+            extract_items(message)
+    elapsed = time.perf_counter() - start
+    per_message_us = elapsed / (rounds * len(SAMPLE_MESSAGES)) * 1e6
+
+    print("⚡ Rule-based extractor")
+    print(f"   {per_message_us:.1f} µs per message ({rounds * len(SAMPLE_MESSAGES)} messages)")
+    print(f"   Handled locally: {hits}/{len(SAMPLE_MESSAGES)} sample messages ({hits / len(SAMPLE_MESSAGES):.0%})")
+    return per_message_us
+
+def bench_llm(calls):
+    os.environ["ORDER_FAST_PATH"] = "false"
+    import openai_logic
+    openai_logic.ORDER_FAST_PATH = False
+
+    timings = []
+    for i in range(calls):
+        message = SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]
+        # Vary the text so the fingerprint memo doesn't answer for us
+        conversation = [{"direction": "received", "text": f"{message} (#{i})"}]
+        start = time.perf_counter()
+        openai_logic.parse_order_from_conversation(conversation)
+        timings.append(time.perf_counter() - start)
+
+    per_message_us = sum(timings) / len(timings) * 1e6
+    print("🤖 LLM extraction (gpt-3.5-turbo)")
+    print(f"   {per_message_us / 1000:.0f} ms per message ({calls} calls)")
+    return per_message_us
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--llm", type=int, default=0)
+    args = parser.parse_args()
+
+    local_us = bench_extractor(args.rounds)
+    if args.llm:
+        llm_us = bench_llm(args.llm)
+        print(f"\n📊 Extractor is ~{llm_us / local_us:,.0f}x faster per message")
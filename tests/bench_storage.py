@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Per-turn storage latency: SQLite backend vs. the Firestore path
+A turn is what the webhook does: read the recent history, then store the
+customer's message and the reply together.
+Usage: python tests/bench_storage.py [--turns N] [--firestore N]
+  --firestore N  also time N turns against Firestore (needs firebase.json; writes to a test phone, then clears it)
+"""
+
+import sys
+import os
+import time
+import tempfile
+import statistics
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCH_PHONE = "+15550009999"
+HISTORY_LIMIT = 20
+
+def run_turns(get_messages, store_turn, turns):
+    timings = []
+    for i in range(turns):
+        start = time.perf_counter()
+        get_messages(BENCH_PHONE, limit=HISTORY_LIMIT)
+        store_turn(BENCH_PHONE, [
+            {"text": f"need {i} lbs salmon", "direction": "received"},
+            {"text": "Sure thing! When do you need it?", "direction": "sent"},
+        ])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+    print(f"{label}")
+    print(f"   median {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms ({len(timings)} turns)")
+    return statistics.median(timings)
+
+def bench_sqlite(turns):
+    from sqlite_store import SQLiteConversationStore
+    from firebase_logic import _next_seq
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        timings = run_turns(
+            store.get_messages,
+            lambda phone, messages: store.store_turn(phone, messages, _next_seq),
+            turns
+        )
+        store.close()
+    return report("💾 SQLite (WAL)", timings)
+
+def bench_firestore(turns):
+    import firebase_logic
+
+    firebase_logic.clear_conversation(BENCH_PHONE)
+    try:
+        timings = run_turns(firebase_logic.get_messages, firebase_logic.store_turn, turns)
+    finally:
+        firebase_logic.clear_conversation(BENCH_PHONE)
+    return report("🔥 Firestore", timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=500)
+    parser.add_argument("--firestore", type=int, default=0)
+    args = parser.parse_args()
+
+    # The Firestore numbers must not be answered by the SQLite backend
+    os.environ["CONVERSATION_STORE"] = "firestore"
+
+    sqlite_ms = bench_sqlite(args.turns)
+    if args.firestore:
+        firestore_ms = bench_firestore(args.firestore)
+        print(f"\n📊 SQLite is ~{firestore_ms / sqlite_ms:,.0f}x faster per turn")
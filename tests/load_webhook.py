@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Load test for the /sms webhook
+Simulates many customers texting scripted order conversations at a target
+message rate. By default it starts app.py itself against local stand-ins:
+an OpenAI-compatible server with configurable latency, the SQLite store in
+place of Firestore (or the Firestore emulator) and a fake Sheets API.
+
+/sms only replies and stores messages; confirmed orders reach Sheets through
+process_confirmed_order, which the webhook doesn't call. The Sheets stand-in is
+there so nothing the app does can touch a real spreadsheet, and the report shows
+no Sheets calls. tests/replay_conversations.py drives the order path end to end.
+
+Usage: python tests/load_webhook.py [--phones 200] [--rate 50] [--duration 60]
+                                    [--openai-latency-ms 800] [--async] [--store sqlite|emulator]
+                                    [--url http://localhost:5001]   # use an already-running app
+"""
+
+import sys
+import os
+import time
+import random
+import tempfile
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sheets_outbox import TokenBucket
+from standins import FakeOpenAIServer, FakeSheetsServer, percentile
+
+# Each simulated customer works through one of these, then starts over
+CONVERSATIONS = [
+    ["Hi", "I need 10 lbs king salmon and 5 lbs halibut", "Friday", "123 Main St, Seattle", "yes"],
+    ["hello", "how much is halibut?", "ok 20 lbs halibut please", "deliver tomorrow to 500 Pike St, Seattle", "yes"],
+    ["Hey are you open tomorrow?", "2 cases of coho", "actually make it 3 cases", "Saturday, 88 Elm St, Tacoma", "confirm"],
+]
+
+
+class LoadResults:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []  # seconds, successful requests
+        self.statuses = {}  # status code (or exception name) -> count
+        self.started = time.monotonic()
+        self.finished = None
+
+    def record(self, status, seconds):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 200:
+                self.latencies.append(seconds)
+
+    @property
+    def total(self):
+        return sum(self.statuses.values())
+
+
+def start_app(port, openai_url, sheets_url, store, async_replies, debounce=None):
+    """Run app.py in a subprocess wired to the stand-ins; returns (process, temp dir)
+    The app's output goes to app.log in the temp dir, so a full pipe can never stall it"""
+    tmp = tempfile.mkdtemp(prefix="load_webhook_")
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "OPENAI_API_KEY": "standin",
+        "GOOGLE_API_ENDPOINT": sheets_url,
+        "TWILIO_SENDER": "stub",
+        "ASYNC_REPLIES": "true" if async_replies else "false",
+        "SHEETS_OUTBOX_PATH": os.path.join(tmp, "sheets_outbox.db"),
+    })
+    if debounce is not None:
+        env["TURN_DEBOUNCE"] = str(debounce)
+    if store == "sqlite":
+        env["CONVERSATION_STORE"] = "sqlite"
+        env["SQLITE_STORE_PATH"] = os.path.join(tmp, "conversations.db")
+    elif not env.get("FIRESTORE_EMULATOR_HOST"):
+        raise SystemExit("❌ --store emulator needs FIRESTORE_EMULATOR_HOST (gcloud emulators firestore start)")
+
+    code = f"from app import app; app.run(port={port}, threaded=True)"
+    with open(os.path.join(tmp, "app.log"), "wb") as log_file:
+        process = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=env,
+                                   stdout=log_file, stderr=subprocess.STDOUT)
+    return process, tmp
+
+
+def wait_for_app(url, process=None, log_dir=None, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            with open(os.path.join(log_dir, "app.log"), errors="replace") as log_file:
+                raise SystemExit(f"❌ app.py exited:\n{log_file.read()[-2000:]}")
+        try:
+            requests.get(f"{url}/queue/stats", timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.2)
+    raise SystemExit(f"❌ app not reachable at {url}")
+
+
+def run_customer(url, phone, bucket, stop_at, results):
+    """One simulated customer: send the script's messages one after another, at the global rate"""
+    session = requests.Session()
+    script = random.choice(CONVERSATIONS)
+    turn = 0
+    while time.monotonic() < stop_at:
+        if not bucket.acquire(timeout=max(0.0, stop_at - time.monotonic())):
+            return
+        data = {
+            "Body": script[turn % len(script)],
+            "From": phone,
+            "To": "+15559876543",
+            "MessageSid": f"SM{phone[-6:]}{turn:06d}{random.randint(0, 10**6):06d}",
+            "AccountSid": "AC_LOAD_TEST",
+            "NumMedia": "0",
+        }
+        started = time.perf_counter()
+        try:
+            response = session.post(f"{url}/sms", data=data, timeout=60)
+            status = response.status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        results.record(status, time.perf_counter() - started)
+        turn += 1
+
+
+def report(results, openai_server, sheets_server, queue_stats, turn_stats=None):
+    elapsed = (results.finished or time.monotonic()) - results.started
+    ok = len(results.latencies)
+    total = results.total
+    print("\n📊 Load test results")
+    print(f"   Requests: {total:,} in {elapsed:.1f}s → {total / elapsed:.1f} req/s ({ok / elapsed:.1f} successful/s)")
+    if results.latencies:
+        lat = results.latencies
+        print(f"   Latency:  p50 {percentile(lat, 50) * 1000:.0f} ms · p95 {percentile(lat, 95) * 1000:.0f} ms · "
+              f"p99 {percentile(lat, 99) * 1000:.0f} ms · max {max(lat) * 1000:.0f} ms")
+    errors = total - ok
+    print(f"   Errors:   {errors:,} ({errors / total:.1%})" if total else "   Errors:   none sent")
+    for status, count in sorted(results.statuses.items(), key=lambda kv: str(kv[0])):
+        if status != 200:
+            print(f"      {status}: {count:,}")
+
+    print("\n🔬 Per-stage breakdown")
+    openai_stats = openai_server.stats() if openai_server else {}
+    openai_ms_per_turn = 0.0
+    for kind, s in sorted(openai_stats.items()):
+        print(f"   openai/{kind:<11} {s['count']:>6,} calls · p50 {s['p50_ms']:.0f} ms · p95 {s['p95_ms']:.0f} ms · {s['errors']} errors")
+        if ok:
+            openai_ms_per_turn += s["mean_ms"] * s["count"] / ok
+    sheets_stats = sheets_server.stats() if sheets_server else {}
+    for route, s in sorted(sheets_stats.items()):
+        print(f"   sheets/{route:<11} {s['count']:>6,} calls · p50 {s['p50_ms']:.0f} ms · p95 {s['p95_ms']:.0f} ms · {s['errors']} errors")
+    if sheets_server and not sheets_stats:
+        print("   sheets         no calls (/sms doesn't write orders; see tests/replay_conversations.py)")
+    if results.latencies and openai_stats and not queue_stats:
+        mean_ms = sum(results.latencies) / ok * 1000
+        print(f"   app + storage  ~{max(0.0, mean_ms - openai_ms_per_turn):.0f} ms per turn "
+              f"(mean webhook {mean_ms:.0f} ms − OpenAI {openai_ms_per_turn:.0f} ms)")
+    if queue_stats:
+        print(f"   reply queue    max depth {queue_stats.get('max_depth')} · wait p95 {queue_stats.get('p95_wait_ms')} ms · "
+              f"{queue_stats.get('completed')} done · {queue_stats.get('failed')} failed · {queue_stats.get('rejected')} rejected")
+    if turn_stats:
+        print(f"   turns          {turn_stats['turns']:,} for {turn_stats['messages']:,} texts "
+              f"({turn_stats['coalescing_rate']:.0%} coalesced) · debounce adds avg {turn_stats['avg_added_ms']:.0f} ms, "
+              f"p95 {turn_stats['p95_added_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=200, help="simulated customers")
+    parser.add_argument("--rate", type=float, default=50, help="target messages per second, all customers together")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--openai-latency-ms", type=float, default=800)
+    parser.add_argument("--openai-jitter-ms", type=float, default=200)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0, help="share of completions answered with a 429")
+    parser.add_argument("--async", dest="async_replies", action="store_true", help="run the app with ASYNC_REPLIES=true")
+    parser.add_argument("--store", choices=["sqlite", "emulator"], default="sqlite")
+    parser.add_argument("--debounce", type=float, help="TURN_DEBOUNCE for the app, in seconds")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--url", help="load an already-running app instead of starting one")
+    args = parser.parse_args()
+
+    openai_server = sheets_server = process = log_dir = None
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        openai_server = FakeOpenAIServer(latency_ms=args.openai_latency_ms, jitter_ms=args.openai_jitter_ms,
+                                         error_rate=args.openai_error_rate).start()
+        sheets_server = FakeSheetsServer().start()
+        process, log_dir = start_app(args.port, openai_server.url, sheets_server.url, args.store, args.async_replies, args.debounce)
+        url = f"http://127.0.0.1:{args.port}"
+        print(f"🤖 OpenAI stand-in {openai_server.url} ({args.openai_latency_ms:.0f}±{args.openai_jitter_ms:.0f} ms)")
+        print(f"📊 Sheets stand-in {sheets_server.url}")
+    wait_for_app(url, process, log_dir)
+
+    print(f"🚀 {args.phones} customers, {args.rate:g} msg/s for {args.duration:g}s against {url}/sms")
+    # Burst capacity of one second's worth keeps the arrival rate close to the target
+    bucket = TokenBucket(args.rate * 60, capacity=max(1.0, args.rate))
+    bucket.tokens = 0
+    results = LoadResults()
+    stop_at = time.monotonic() + args.duration
+    try:
+        with ThreadPoolExecutor(max_workers=args.phones) as pool:
+            for i in range(args.phones):
+                pool.submit(run_customer, url, f"+1555{i:07d}", bucket, stop_at, results)
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopped early")
+    results.finished = time.monotonic()
+
+    queue_stats = turn_stats = None
+    try:
+        stats = requests.get(f"{url}/queue/stats", timeout=5).json()
+        queue_stats = stats if stats.get("async_replies") else None
+        turn_stats = stats.get("turns")
+    except requests.exceptions.RequestException:
+        pass
+
+    report(results, openai_server, sheets_server, queue_stats, turn_stats)
+
+    if process is not None:
+        process.terminate()
+        process.wait(timeout=10)
+        print(f"📝 App log: {os.path.join(log_dir, 'app.log')}")
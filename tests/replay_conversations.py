@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Replay real conversations through the whole order pipeline with stubbed I/O
+generate_ai_reply → parse_order_from_conversation → is_order_complete → process_confirmed_order,
+with completions served from a record/replay cassette (llm_replay.py) and Sheets
+writes going to an in-memory fake. Nothing touches the network in replay mode.
+
+Usage:
+  python tests/replay_conversations.py export [--limit 50] [--out tests/replay/conversations.json]
+      pull conversations from Firestore (phone numbers are hashed)
+  python tests/replay_conversations.py run [--conversations FILE] [--mode replay|record] [--cassette FILE]
+      replay them; record mode calls OpenAI once per new request and saves it to the cassette
+"""
+
+import sys
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+from contextlib import contextmanager
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(TESTS_DIR))
+sys.path.append(TESTS_DIR)
+
+import clients
+import history_window
+import openai_logic
+import sheets_logic
+from llm_client import LLMClient
+from llm_replay import ReplayClient, LLM_CASSETTE
+from response_cache import response_cache
+from llm_usage import usage_ledger
+from standins import InMemorySheetsService, InMemorySummaryStore, completion_kind, canned_content
+
+SAMPLE_CONVERSATIONS = os.path.join(TESTS_DIR, "fixtures", "sample_conversations.json")
+EXPORT_PATH = os.path.join(TESTS_DIR, "replay", "conversations.json")
+
+_STREET = re.compile(r"\b\d+\s+\w+(?:\s+\w+)?\s+(?:st|street|ave|avenue|rd|road|blvd|way|dr|drive)\b", re.IGNORECASE)
+
+
+def canned_fallback(kwargs):
+    """Completion for requests missing from the cassette: canned text, and an order that
+    becomes complete once the conversation mentions a street address"""
+    kind = completion_kind(kwargs)
+    if kind == "extraction" and _STREET.search(str(kwargs.get("messages", [])[-1].get("content", ""))):
+        order = dict(json.loads(canned_content(kind)))
+        order["delivery_date"] = "Friday, July 25, 2025"
+        order["delivery_address"] = "123 Main St, Seattle, WA"
+        return json.dumps(order)
+    return canned_content(kind)
+
+
+@contextmanager
+def replay_installed(cassette=LLM_CASSETTE, mode="replay", fallback=canned_fallback):
+    """Route openai_logic's completions through a ReplayClient inside the block; yields it"""
+    replay = ReplayClient(cassette, mode, fallback=fallback if mode == "replay" else None)
+    saved = (openai_logic.llm, usage_ledger.flush_interval, history_window._summary_store)
+    openai_logic.llm = LLMClient(replay, hedge=False)
+    # Token usage and rolling summaries stay in memory instead of going to Firestore
+    usage_ledger.flush_interval = 0
+    history_window.set_summary_store(InMemorySummaryStore())
+    try:
+        yield replay
+    finally:
+        # Replayed calls cost nothing: don't let their usage reach storage afterwards
+        usage_ledger.reset()
+        openai_logic.llm, usage_ledger.flush_interval = saved[:2]
+        history_window.set_summary_store(saved[2])
+
+
+@contextmanager
+def fake_sheets_installed():
+    """Send Sheets writes to an in-memory fake inside the block; yields it"""
+    service = InMemorySheetsService()
+    clients.set_client("sheets", service)
+    sheets_logic.invalidate_tab_index()
+    try:
+        yield service
+    finally:
+        clients.set_client("sheets", None)
+        sheets_logic.invalidate_tab_index()
+
+
+def reset_caches():
+    """Forget memoized parses, cached replies and rolling summaries so runs are comparable"""
+    with openai_logic._parse_cache_lock:
+        openai_logic._parse_cache.clear()
+    response_cache.clear()
+    history_window.set_summary_store(InMemorySummaryStore())
+    usage_ledger.reset()
+
+
+def load_conversations(path=SAMPLE_CONVERSATIONS):
+    with open(path) as f:
+        return json.load(f)
+
+
+def replay_conversation(conversation):
+    """
+    Run each customer message of a recorded conversation through the pipeline.
+    The recorded bot messages are used as history, so every run sends the same prompts.
+    Returns one dict per customer message.
+    """
+    phone = conversation["phone"]
+    pinned_before = openai_logic.PIN_TODAY
+    openai_logic.PIN_TODAY = conversation.get("date") or pinned_before
+    messages = conversation["messages"]
+    order = None
+    awaiting_confirmation = False
+    turns = []
+    for i, msg in enumerate(messages):
+        if msg["direction"] != "received":
+            continue
+        history = messages[:i + 1]
+        started = time.perf_counter()
+        turn = {"text": msg["text"], "confirmed": False, "confirmation_sent": False}
+
+        if awaiting_confirmation and openai_logic.check_for_confirmation(msg["text"]):
+            sheets_logic.process_confirmed_order(phone, order)
+            turn["confirmed"] = True
+            awaiting_confirmation = False
+        else:
+            turn["reply"] = openai_logic.generate_ai_reply(msg["text"], history, phone_number=phone)
+            order = openai_logic.parse_order_from_conversation(history, phone_number=phone)
+            if openai_logic.is_order_complete(order):
+                turn["confirmation_sent"] = bool(openai_logic.generate_order_confirmation_message(order, phone))
+                awaiting_confirmation = True
+        turn["seconds"] = time.perf_counter() - started
+        turns.append(turn)
+    openai_logic.PIN_TODAY = pinned_before
+    return turns
+
+
+def export_conversations(path=EXPORT_PATH, limit=50):
+    """Write up to `limit` Firestore conversations to `path`, phone numbers hashed"""
+    from firebase_logic import get_messages
+
+    exported = []
+    for conv_ref in clients.get_firestore().collection("conversations").list_documents(page_size=limit):
+        messages = get_messages(conv_ref.id)
+        if not any(m["direction"] == "received" for m in messages):
+            continue
+        first = messages[0].get("timestamp")
+        exported.append({
+            "phone": "replay-" + hashlib.sha256(conv_ref.id.encode()).hexdigest()[:10],
+            # Relative dates ("Friday") resolve the same way they did live
+            "date": first.strftime("%Y-%m-%d") if first else None,
+            "messages": [{"direction": m["direction"], "text": m["text"]} for m in messages],
+        })
+        if len(exported) >= limit:
+            break
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(exported, f, indent=1, ensure_ascii=False)
+    return exported
+
+
+def run(conversations_path, mode, cassette):
+    conversations = load_conversations(conversations_path)
+    with replay_installed(cassette, mode) as replay, fake_sheets_installed() as sheets:
+        reset_caches()
+        started = time.perf_counter()
+        turns = confirmed = 0
+        for conversation in conversations:
+            results = replay_conversation(conversation)
+            turns += len(results)
+            confirmed += sum(t["confirmed"] for t in results)
+        elapsed = time.perf_counter() - started
+        usage = usage_ledger.stats()
+
+    stats = replay.stats()
+    print(f"🔁 Replayed {len(conversations)} conversations, {turns} customer turns in {elapsed:.2f}s "
+          f"({elapsed / max(1, turns) * 1000:.1f} ms/turn)")
+    print(f"   Completions: {stats['requests']} ({stats['hits']} from cassette, {stats['misses']} missing"
+          f"{', ' + str(stats['recorded']) + ' recorded' if mode == 'record' else ''})")
+    print(f"   Prompt size: {stats['prompt_chars'] / max(1, stats['requests']):,.0f} chars per completion")
+    print(f"   Orders confirmed: {confirmed} → {sheets.calls['values.append']} rows appended to the in-memory sheet")
+    print(f"   Tokens: {usage['prompt_tokens']:,} prompt + {usage['completion_tokens']:,} completion "
+          f"({usage['estimated']} of {usage['calls']} calls estimated), ${usage['cost_usd']:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export")
+    export_parser.add_argument("--limit", type=int, default=50)
+    export_parser.add_argument("--out", default=EXPORT_PATH)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--conversations", default=SAMPLE_CONVERSATIONS)
+    run_parser.add_argument("--mode", choices=["replay", "record"], default="replay")
+    run_parser.add_argument("--cassette", default=LLM_CASSETTE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        exported = export_conversations(args.out, args.limit)
+        print(f"✅ Exported {len(exported)} conversations to {args.out}")
+    else:
+        run(args.conversations, args.mode, args.cassette)
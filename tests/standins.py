@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+Local stand-in servers for load and stress tests
+- FakeOpenAIServer: OpenAI-compatible /v1/chat/completions (plain, streamed and
+  JSON mode) with configurable latency; point the app at it with OPENAI_BASE_URL
+- FakeSheetsServer: the slice of the Sheets v4 API sheets_logic uses; point the
+  app at it with GOOGLE_API_ENDPOINT
+Both record per-route request counts and latencies for the load report.
+- InMemorySheetsService: the same Sheets slice in-process, for runs without any HTTP
+- InMemorySummaryStore: rolling history summaries in a dict (history_window.set_summary_store)
+- InMemoryFirestore: documents, queries, cursors and batches in-process (clients.set_client("firestore", ...))
+
+Usage: python tests/standins.py openai|sheets [--port N] [--latency-ms MS] [--jitter-ms MS]
+"""
+
+import sys
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+STANDIN_REPLY = "Sure thing! What do you need, and when should we deliver it?"
+STANDIN_ORDER = {
+    "items": [{"product": "King Salmon", "quantity": "10 lbs"}],
+    "delivery_date": None, "delivery_address": None, "notes": None,
+}
+
+
+def completion_kind(body):
+    """Which openai_logic call a chat completion request comes from"""
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        return "combined"
+    messages = body.get("messages") or [{}]
+    if "extracting structured order data" in str(messages[0].get("content", "")):
+        return "extraction"
+    if "summary" in str(messages[-1].get("content", "")).lower():
+        return "summary"
+    return "reply"
+
+
+def canned_content(kind):
+    """Deterministic completion text of the right shape for each kind"""
+    if kind == "combined":
+        return json.dumps({"reply": STANDIN_REPLY, "order": STANDIN_ORDER})
+    if kind == "extraction":
+        return json.dumps(STANDIN_ORDER)
+    if kind == "summary":
+        return "Customer is ordering King Salmon; delivery details still open."
+    return STANDIN_REPLY
+
+
+class StandIn(ABC):
+    """Threaded HTTP server on a background thread, with per-route stats; subclasses implement handle()"""
+
+    def __init__(self, port=0):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                return json.loads(raw) if raw else {}
+
+            def _dispatch(self, method):
+                started = time.perf_counter()
+                path = urlparse(self.path).path
+                try:
+                    route, status, payload = stand_in.handle(method, path, self._body(), self)
+                except Exception as e:
+                    route, status, payload = "error", 500, {"error": {"message": str(e)}}
+                if payload is not None:
+                    data = json.dumps(payload).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                stand_in.record(route, status, time.perf_counter() - started)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._lock = threading.Lock()
+        self.routes = {}  # route -> {"count", "errors", "latencies"}
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @abstractmethod
+    def handle(self, method, path, body, handler):
+        """Return (route name, status, JSON payload); payload None means the handler already wrote the response"""
+
+    def record(self, route, status, seconds):
+        with self._lock:
+            stats = self.routes.setdefault(route, {"count": 0, "errors": 0, "latencies": []})
+            stats["count"] += 1
+            stats["errors"] += status >= 400
+            stats["latencies"].append(seconds)
+
+    def stats(self):
+        """{route: {count, errors, p50_ms, p95_ms, mean_ms}}"""
+        with self._lock:
+            routes = {name: dict(s, latencies=list(s["latencies"])) for name, s in self.routes.items()}
+        report = {}
+        for name, s in routes.items():
+            latencies = s["latencies"]
+            report[name] = {
+                "count": s["count"],
+                "errors": s["errors"],
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+            }
+        return report
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeOpenAIServer(StandIn):
+    """Answers chat completions after latency_ms (+/- jitter_ms); error_rate returns 429s"""
+
+    def __init__(self, port=0, latency_ms=800, jitter_ms=200, error_rate=0.0):
+        super().__init__(port)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def _delay(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000)
+
+    def handle(self, method, path, body, handler):
+        if method == "GET" and path.endswith("/models"):
+            return "models", 200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]}
+        if not path.endswith("/chat/completions"):
+            return "unknown", 404, {"error": {"message": f"No stand-in for {path}"}}
+
+        kind = completion_kind(body)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        if random.random() < self.error_rate:
+            return kind, 429, {"error": {"message": "Rate limit reached (stand-in)", "type": "requests"}}
+
+        content = canned_content(kind)
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self._stream(handler, content, prompt_tokens if include_usage else None)
+            return kind, 200, None
+
+        self._delay()
+        return kind, 200, {
+            "id": f"chatcmpl-standin{random.randint(0, 10**9)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        }
+
+    def _stream(self, handler, content, prompt_tokens=None):
+        """
+        Server-sent events: first chunk after ~a third of the latency, the rest spread out.
+        prompt_tokens: send a final usage chunk (stream_options.include_usage)
+        """
+        words = re.findall(r"\S+\s*", content)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        total = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        time.sleep(total / 3)
+        for word in words:
+            chunk = {
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": "gpt-3.5-turbo",
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.flush()
+            time.sleep(total * 2 / 3 / max(1, len(words)))
+        if prompt_tokens is not None:
+            chunk = {
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": "gpt-3.5-turbo", "choices": [],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                          "total_tokens": prompt_tokens + len(content) // 4},
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+
+
+class FakeSheetsServer(StandIn):
+    """In-memory spreadsheets: tab listing, batchUpdate (addSheet / appendCells) and values.append"""
+
+    def __init__(self, port=0, latency_ms=50):
+        super().__init__(port)
+        self.latency_ms = latency_ms
+        self._sheets_lock = threading.Lock()
+        self.tabs = {}  # spreadsheet id -> {title: {"sheetId", "rows"}}
+
+    def _tabs(self, spreadsheet_id):
+        return self.tabs.setdefault(spreadsheet_id, {})
+
+    def handle(self, method, path, body, handler):
+        time.sleep(self.latency_ms / 1000)
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", path)
+        if not match:
+            return "unknown", 404, {"error": {"code": 404, "message": f"No stand-in for {path}"}}
+        spreadsheet_id, rest = match.group(1), unquote(match.group(2))
+
+        with self._sheets_lock:
+            tabs = self._tabs(spreadsheet_id)
+            if method == "GET" and rest == "":
+                return "get", 200, {"spreadsheetId": spreadsheet_id, "sheets": [
+                    {"properties": {"sheetId": tab["sheetId"], "title": title}} for title, tab in tabs.items()
+                ]}
+
+            if method == "POST" and rest == ":batchUpdate":
+                by_id = {tab["sheetId"]: tab for tab in tabs.values()}
+                replies = []
+                for request in body.get("requests", []):
+                    if "addSheet" in request:
+                        props = request["addSheet"]["properties"]
+                        if props["title"] in tabs:
+                            return "batchUpdate", 400, {"error": {"code": 400, "message": f"A sheet with the name \"{props['title']}\" already exists."}}
+                        sheet_id = props.get("sheetId", len(tabs) + 1)
+                        tabs[props["title"]] = by_id[sheet_id] = {"sheetId": sheet_id, "rows": []}
+                        replies.append({"addSheet": {"properties": {"sheetId": sheet_id, "title": props["title"]}}})
+                    elif "appendCells" in request:
+                        tab = by_id.get(request["appendCells"]["sheetId"])
+                        if tab is None:
+                            return "batchUpdate", 400, {"error": {"code": 400, "message": "No grid with that id"}}
+                        tab["rows"].extend(request["appendCells"]["rows"])
+                        replies.append({})
+                    else:
+                        replies.append({})
+                return "batchUpdate", 200, {"spreadsheetId": spreadsheet_id, "replies": replies}
+
+            match = re.match(r"^/values/(.+?)(?:!.*)?:append$", rest)
+            if method == "POST" and match:
+                title = match.group(1).strip("'")
+                tab = tabs.get(title)
+                if tab is None:
+                    return "values.append", 400, {"error": {"code": 400, "message": f"Unable to parse range: {title}"}}
+                tab["rows"].extend(body.get("values", []))
+                return "values.append", 200, {"spreadsheetId": spreadsheet_id, "updates": {"updatedRows": len(body.get("values", []))}}
+
+        return "unknown", 404, {"error": {"code": 404, "message": f"No stand-in for {method} {path}"}}
+
+    def row_count(self, spreadsheet_id=None):
+        with self._sheets_lock:
+            sheets = [self.tabs.get(spreadsheet_id, {})] if spreadsheet_id else list(self.tabs.values())
+            return sum(len(tab["rows"]) for tabs in sheets for tab in tabs.values())
+
+
+class InMemorySheetsService:
+    """In-process fake of the googleapiclient Sheets service, for stubbed-I/O runs without HTTP"""
+
+    class _Request:
+        def __init__(self, run):
+            self._run = run
+
+        def execute(self):
+            return self._run()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tabs = {}  # title -> {"sheetId", "rows"}
+        self.calls = {"get": 0, "batchUpdate": 0, "values.append": 0}
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        def run():
+            self._count("get")
+            with self._lock:
+                return {"sheets": [{"properties": {"sheetId": t["sheetId"], "title": title}} for title, t in self.tabs.items()]}
+        return self._Request(run)
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            self._count("batchUpdate")
+            with self._lock:
+                by_id = {t["sheetId"]: t for t in self.tabs.values()}
+                for request in body.get("requests", []):
+                    if "addSheet" in request:
+                        props = request["addSheet"]["properties"]
+                        if props["title"] in self.tabs:
+                            raise Exception(f"A sheet with the name \"{props['title']}\" already exists.")
+                        self.tabs[props["title"]] = by_id[props["sheetId"]] = {"sheetId": props["sheetId"], "rows": []}
+                    elif "appendCells" in request:
+                        by_id[request["appendCells"]["sheetId"]]["rows"].extend(request["appendCells"]["rows"])
+            return {"replies": []}
+        return self._Request(run)
+
+    def append(self, spreadsheetId, range, body, valueInputOption=None, **kwargs):
+        def run():
+            self._count("values.append")
+            title = range.split("!")[0].strip("'")
+            with self._lock:
+                self.tabs[title]["rows"].extend(body.get("values", []))
+            return {"updates": {"updatedRows": len(body.get("values", []))}}
+        return self._Request(run)
+
+    def row_count(self):
+        with self._lock:
+            return sum(len(t["rows"]) for t in self.tabs.values())
+
+
+
+class InMemorySummaryStore:
+    """history_window summary store in a dict, for runs without a conversation store"""
+
+    def __init__(self):
+        self.summaries = {}
+
+    def load(self, key):
+        return self.summaries.get(key)
+
+    def save(self, key, state):
+        if state is None:
+            self.summaries.pop(key, None)
+        else:
+            self.summaries[key] = state
+
+
+
+class InMemoryFirestore:
+    """
+    In-process fake of the Firestore client slice firebase_logic and bulk_purge use:
+    documents and subcollections, where / order_by / limit / limit_to_last / select,
+    start_after / end_before cursors, batches and count(). SERVER_TIMESTAMP becomes the
+    commit time, the same for every write of one commit. Transactions are batches that
+    run once: patch firestore.transactional with InMemoryFirestore.transactional.
+    """
+
+    DESCENDING = "DESCENDING"
+
+    @staticmethod
+    def transactional(function):
+        def run(transaction, *args, **kwargs):
+            result = function(transaction, *args, **kwargs)
+            transaction.commit()
+            return result
+        return run
+
+    class _Snapshot:
+        def __init__(self, reference, data):
+            self.reference = reference
+            self.id = reference.id
+            self.exists = data is not None
+            self._data = data
+
+        def to_dict(self):
+            return dict(self._data) if self._data is not None else None
+
+    class _Query:
+        def __init__(self, db, path, filters=(), orders=(), limit=None, last=False, start=None, end=None):
+            self._db, self._path = db, path
+            self._filters, self._orders = list(filters), list(orders)
+            self._limit, self._last, self._start, self._end = limit, last, start, end
+
+        def _copy(self, **changes):
+            fields = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                          last=self._last, start=self._start, end=self._end)
+            fields.update(changes)
+            return InMemoryFirestore._Query(self._db, self._path, **fields)
+
+        def where(self, field, op, value):
+            return self._copy(filters=self._filters + [(field, op, value)])
+
+        def order_by(self, field, direction="ASCENDING"):
+            return self._copy(orders=self._orders + [(field, direction)])
+
+        def limit(self, count):
+            return self._copy(limit=count, last=False)
+
+        def limit_to_last(self, count):
+            return self._copy(limit=count, last=True)
+
+        def select(self, fields):
+            return self
+
+        def start_after(self, snapshot):
+            return self._copy(start=snapshot)
+
+        def end_before(self, snapshot):
+            return self._copy(end=snapshot)
+
+        def _key(self, doc_id, data):
+            # Firestore leaves out documents missing an ordered field, and breaks ties by name
+            key = []
+            for field, direction in self._orders + [("__name__", "ASCENDING")]:
+                value = doc_id if field == "__name__" else data[field]
+                key.append((value, direction))
+            return key
+
+        @staticmethod
+        def _before(a, b):
+            for (value_a, direction), (value_b, _) in zip(a, b):
+                if value_a != value_b:
+                    return value_a > value_b if direction == InMemoryFirestore.DESCENDING else value_a < value_b
+            return False
+
+        def _matches(self, data):
+            ops = {"==": lambda a, b: a == b, ">=": lambda a, b: a >= b, ">": lambda a, b: a > b,
+                   "<=": lambda a, b: a <= b, "<": lambda a, b: a < b}
+            return all(field in data and ops[op](data[field], value) for field, op, value in self._filters)
+
+        def stream(self):
+            import functools
+
+            with self._db._lock:
+                docs = [(doc_id, dict(data)) for doc_id, data in self._db._children(self._path).items()]
+            fields = [field for field, _ in self._orders if field != "__name__"]
+            docs = [(doc_id, data) for doc_id, data in docs
+                    if self._matches(data) and all(field in data for field in fields)]
+            keyed = [(self._key(doc_id, data), doc_id, data) for doc_id, data in docs]
+            keyed.sort(key=functools.cmp_to_key(
+                lambda a, b: -1 if self._before(a[0], b[0]) else (1 if self._before(b[0], a[0]) else 0)))
+            if self._start is not None:
+                start = self._key(self._start.id, self._start.to_dict())
+                keyed = [entry for entry in keyed if self._before(start, entry[0])]
+            if self._end is not None:
+                end = self._key(self._end.id, self._end.to_dict())
+                keyed = [entry for entry in keyed if self._before(entry[0], end)]
+            if self._limit is not None:
+                keyed = keyed[-self._limit:] if self._last else keyed[:self._limit]
+            self._db.reads += 1
+            collection = InMemoryFirestore._Collection(self._db, self._path)
+            return [InMemoryFirestore._Snapshot(collection.document(doc_id), data) for _, doc_id, data in keyed]
+
+        def get(self):
+            return self.stream()
+
+        def count(self):
+            query = self
+
+            class _Count:
+                def get(self):
+                    return [[type("Aggregation", (), {"value": len(query.stream())})()]]
+            return _Count()
+
+    class _Collection(_Query):
+        def __init__(self, db, path):
+            super().__init__(db, path)
+
+        @property
+        def id(self):
+            return self._path[-1]
+
+        def document(self, doc_id=None):
+            import uuid
+            return InMemoryFirestore._Document(self._db, self._path + (doc_id or uuid.uuid4().hex[:20],))
+
+        def list_documents(self, page_size=None):
+            # Parents of subcollections count even if they were never written, like Firestore's
+            with self._db._lock:
+                ids = sorted({path[len(self._path)] for path in self._db._docs if path[:len(self._path)] == self._path
+                              and len(path) > len(self._path)})
+            return (self.document(doc_id) for doc_id in ids)
+
+    class _Document:
+        def __init__(self, db, path):
+            self._db, self._path = db, path
+            self.id = path[-1]
+
+        def collection(self, name):
+            return InMemoryFirestore._Collection(self._db, self._path + (name,))
+
+        def get(self, transaction=None):
+            with self._db._lock:
+                data = self._db._docs.get(self._path)
+            self._db.reads += 1
+            return InMemoryFirestore._Snapshot(self, dict(data) if data is not None else None)
+
+        def set(self, data, merge=False, now=None):
+            data = self._db._resolve(data, now)
+            with self._db._lock:
+                current = self._db._docs.get(self._path) if merge else None
+                self._db._docs[self._path] = {**(current or {}), **data}
+                self._db.writes += 1
+
+        def update(self, data, now=None):
+            data = self._db._resolve(data, now)
+            with self._db._lock:
+                self._db._docs[self._path].update(data)
+                self._db.writes += 1
+
+        def delete(self):
+            with self._db._lock:
+                self._db._docs.pop(self._path, None)
+                self._db.writes += 1
+
+    class _Batch:
+        def __init__(self, db):
+            self._db = db
+            self._ops = []
+
+        def set(self, reference, data, merge=False):
+            self._ops.append(lambda now: reference.set(data, merge=merge, now=now))
+
+        def update(self, reference, data):
+            self._ops.append(lambda now: reference.update(data, now=now))
+
+        def delete(self, reference):
+            self._ops.append(lambda now: reference.delete())
+
+        def commit(self):
+            now = datetime.now(timezone.utc)
+            for op in self._ops:
+                op(now)
+            self._db.commits += 1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}  # (collection, doc_id, subcollection, doc_id, ...) -> fields
+        self.reads = self.writes = self.commits = 0
+
+    def _resolve(self, data, now=None):
+        try:
+            from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+        except ImportError:
+            return data
+        now = now or datetime.now(timezone.utc)
+        return {key: now if value is SERVER_TIMESTAMP else value for key, value in data.items()}
+
+    def _children(self, path):
+        return {doc_path[-1]: data for doc_path, data in self._docs.items()
+                if len(doc_path) == len(path) + 1 and doc_path[:len(path)] == path}
+
+    def collection(self, name):
+        return self._Collection(self, (name,))
+
+    def batch(self):
+        return self._Batch(self)
+
+    def transaction(self):
+        return self._Batch(self)
+
+    def document_count(self):
+        with self._lock:
+            return len(self._docs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("service", choices=["openai", "sheets"])
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=None)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    if args.service == "openai":
+        server = FakeOpenAIServer(args.port, latency_ms=args.latency_ms if args.latency_ms is not None else 800, jitter_ms=args.jitter_ms)
+        print(f"🤖 OpenAI stand-in on {server.url}/v1  (export OPENAI_BASE_URL={server.url}/v1)")
+    else:
+        server = FakeSheetsServer(args.port, latency_ms=args.latency_ms if args.latency_ms is not None else 50)
+        print(f"📊 Sheets stand-in on {server.url}  (export GOOGLE_API_ENDPOINT={server.url})")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats(), indent=2))
+        sys.exit(0)
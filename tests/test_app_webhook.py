@@ -0,0 +1,145 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from datetime import datetime, timedelta, timezone
+
+pytest.importorskip("flask")
+
+import app
+from reply_queue import QueueFullError
+
+PHONE = "+15551234567"
+
+class FakeConversations:
+    """get_messages / store_turn / generate_ai_reply stand-ins for app's webhook turn"""
+
+    def __init__(self, messages):
+        self.messages = {PHONE: list(messages)}
+        self.reply_calls = []
+        self.limits = []
+        self.metadata = []
+
+    def get_messages(self, phone_number, limit=None):
+        self.limits.append(limit)
+        messages = self.messages.get(phone_number, [])
+        return [dict(msg) for msg in (messages[-limit:] if limit else messages)]
+
+    def store_turn(self, phone_number, messages, metadata=None):
+        self.messages.setdefault(phone_number, []).extend(messages)
+        self.metadata.append(metadata)
+
+    def generate_ai_reply(self, user_message, conversation_history=None, phone_number=None):
+        self.reply_calls.append((user_message, conversation_history, phone_number))
+        return "Sure thing! When do you need it?"
+
+def _patched(fake):
+    originals = {name: getattr(app, name) for name in ("get_messages", "store_turn", "generate_ai_reply")}
+    for name in originals:
+        setattr(app, name, getattr(fake, name))
+    return originals
+
+def test_webhook_turn_gets_phone_and_history():
+    fake = FakeConversations([
+        {"direction": "received", "text": "hi"},
+        {"direction": "sent", "text": "Hey! What can I get you?"},
+    ])
+    originals = _patched(fake)
+    debounce = app.turn_scheduler.debounce
+    app.turn_scheduler.debounce = 0
+    try:
+        response = app.app.test_client().post("/sms", data={"From": PHONE, "Body": "10 lbs salmon"})
+    finally:
+        app.turn_scheduler.debounce = debounce
+        for name, value in originals.items():
+            setattr(app, name, value)
+
+    assert response.status_code == 200
+    assert response.get_json() == {"reply": "Sure thing! When do you need it?"}
+    message, history, phone_number = fake.reply_calls[0]
+    # Accounted to this phone, with the stored conversation plus the new text
+    assert phone_number == PHONE and message == "10 lbs salmon"
+    assert [m["text"] for m in history] == ["hi", "Hey! What can I get you?", "10 lbs salmon"]
+    # Only the newest messages are read; older ones are in the stored summary
+    assert fake.limits == [app.HISTORY_CONTEXT_MESSAGES]
+    assert [m["text"] for m in fake.messages[PHONE]][-2:] == ["10 lbs salmon", "Sure thing! When do you need it?"]
+    print("✅ Webhook replies see the conversation and are accounted to the sender")
+
+def test_sync_mode_does_not_debounce_by_default():
+    if app.ASYNC_REPLIES or "TURN_DEBOUNCE" in os.environ:
+        print("⏭️  TURN_DEBOUNCE or ASYNC_REPLIES set in the environment")
+        return
+    # A lone text is answered right away instead of waiting out a burst window
+    assert app.turn_scheduler.debounce == 0
+    print("✅ Sync webhooks only merge texts that arrive while a reply is being generated")
+
+class FakeReplyQueue:
+    """ReplyQueue stand-in: has_room() answers `room`, submit() fails unless `accept`"""
+
+    def __init__(self, room, accept):
+        self.room, self.accept = room, accept
+        self.submitted = []
+
+    def has_room(self):
+        return self.room
+
+    def submit(self, *args):
+        if not self.accept:
+            raise QueueFullError("Reply queue is full (1 jobs)")
+        self.submitted.append(args)
+
+def test_async_full_queue_stores_once():
+    fake = FakeConversations([])
+    originals = _patched(fake)
+    reply_queue = app.reply_queue
+    client = app.app.test_client()
+    try:
+        # Full before anything is stored: 503, and Twilio's retry starts from scratch
+        app.reply_queue = FakeReplyQueue(room=False, accept=False)
+        response = client.post("/sms", data={"From": PHONE, "Body": "10 lbs salmon"})
+        assert response.status_code == 503 and fake.messages[PHONE] == []
+
+        # Filled up between the check and the submit: the stored message is acked, not retried
+        app.reply_queue = FakeReplyQueue(room=True, accept=False)
+        response = client.post("/sms", data={"From": PHONE, "Body": "10 lbs salmon"})
+        assert response.status_code == 200
+        assert [m["text"] for m in fake.messages[PHONE]] == ["10 lbs salmon"]
+        assert fake.metadata == [{"reply_pending": True}]
+
+        app.reply_queue = FakeReplyQueue(room=True, accept=True)
+        response = client.post("/sms", data={"From": PHONE, "Body": "and 5 lbs halibut"})
+        assert response.status_code == 200 and len(app.reply_queue.submitted) == 1
+    finally:
+        app.reply_queue = reply_queue
+        for name, value in originals.items():
+            setattr(app, name, value)
+    print("✅ A full reply queue never leaves a message to be stored twice")
+
+def test_messages_query_parameters():
+    calls = []
+    get_messages_page = app.get_messages_page
+    app.get_messages_page = lambda phone, limit, before, after, since: calls.append((limit, since)) or ([], False)
+    client = app.app.test_client()
+    try:
+        # Not a number: rejected instead of falling back to the full-history stream
+        for limit in ("abc", "0", str(app.MESSAGES_PAGE_MAX + 1)):
+            assert client.get(f"/messages?phone={PHONE}&limit={limit}").status_code == 400
+        assert calls == []
+
+        # since is compared with UTC timestamps: no offset means UTC, an offset is converted
+        client.get(f"/messages?phone={PHONE}&limit=5&since=2025-07-21T09:00:00")
+        client.get(f"/messages?phone={PHONE}&limit=5&since=2025-07-21T02:00:00-07:00")
+        client.get(f"/messages?phone={PHONE}&limit=5&since=2025-07-21T09:00:00Z")
+        expected = datetime(2025, 7, 21, 9, tzinfo=timezone.utc)
+        assert calls == [(5, expected)] * 3
+        assert all(since.utcoffset() == timedelta(0) for _, since in calls)
+    finally:
+        app.get_messages_page = get_messages_page
+    print("✅ /messages rejects a non-numeric limit and reads since as UTC")
+
+if __name__ == "__main__":
+    test_webhook_turn_gets_phone_and_history()
+    test_sync_mode_does_not_debounce_by_default()
+    test_async_full_queue_stores_once()
+    test_messages_query_parameters()
@@ -0,0 +1,112 @@
+import sys
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_purge
+import clear_history
+from bulk_purge import purge_all_conversations
+from sqlite_store import SQLiteConversationStore
+from standins import InMemoryFirestore
+
+def make_db(conversations=20, days_ago=lambda i: 0):
+    """Conversation i has 3*i messages, the newest sent days_ago(i) days ago"""
+    db = InMemoryFirestore()
+    now = datetime.now(timezone.utc)
+    for i in range(conversations):
+        conv_ref = db.collection("conversations").document(f"+1555000{i:04d}")
+        if i % 2 == 0:
+            conv_ref.set({"message_count": 3 * i})  # Others only have the messages subcollection
+        for n in range(3 * i):
+            conv_ref.collection("messages").document().set({
+                "direction": "received", "text": f"msg {n}",
+                "timestamp": now - timedelta(days=days_ago(i), minutes=n),
+            })
+    return db
+
+def test_purge_pages_and_batches():
+    db = make_db()
+    dry = purge_all_conversations(db, dry_run=True, workers=4, batch_size=7, quiet=True)
+    assert dry["conversations"] == 20 and dry["documents"] == 3 * sum(range(20))
+    assert dry["commits"] == 0 and db.document_count() == 3 * sum(range(20)) + 10
+
+    summary = purge_all_conversations(db, workers=4, batch_size=7, quiet=True)
+    assert summary["documents"] == dry["documents"] and summary["conversations"] == 20
+    assert db.document_count() == 0
+    # Every commit deletes at most batch_size messages
+    assert summary["commits"] >= summary["documents"] / 7
+    print(f"✅ Purged {summary['documents']} messages in {summary['commits']} batched commits")
+
+def test_purge_only_idle_conversations():
+    db = make_db(days_ago=lambda i: 40 if i < 10 else 1)
+    summary = purge_all_conversations(db, workers=4, older_than_days=30, quiet=True)
+    # The 10 idle conversations go (one of them has no messages at all), the active ones stay
+    assert summary["conversations"] == 10 and summary["documents"] == 3 * sum(range(10))
+    remaining = {ref.id for ref in db.collection("conversations").list_documents()}
+    assert remaining == {f"+1555000{i:04d}" for i in range(10, 20)}
+    print("✅ --older-than-days keeps conversations with recent messages")
+
+def test_purge_reads_conversations_in_chunks():
+    db = make_db(conversations=200)
+    pulled, done, ahead = [0], [0], [0]
+    lock = threading.Lock()
+    list_documents = db.collection("conversations").list_documents()
+    refs = list(list_documents)
+
+    def counted_refs():
+        for ref in refs:
+            with lock:
+                pulled[0] += 1
+                ahead[0] = max(ahead[0], pulled[0] - done[0])
+            yield ref
+
+    def counted_purge(db, phone_number, *args, **kwargs):
+        with lock:
+            done[0] += 1
+        return 0
+
+    collection = type("Conversations", (), {"list_documents": lambda self, page_size=None: counted_refs()})()
+    fake_db = type("Db", (), {"collection": lambda self, name: collection})()
+    original = bulk_purge.purge_conversation
+    bulk_purge.purge_conversation = counted_purge
+    try:
+        purge_all_conversations(fake_db, workers=4, quiet=True)
+    finally:
+        bulk_purge.purge_conversation = original
+    assert done[0] == 200
+    # Never more than one chunk (workers * 4) taken from the listing ahead of the purges
+    assert ahead[0] <= 16
+    print(f"✅ 200 conversations purged with at most {ahead[0]} queued at once")
+
+def test_clear_history_uses_configured_store():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        seq = iter(range(1, 10_000))
+        for i in range(3):
+            store.store_turn(f"+1555000{i:04d}", [{"text": "hi", "direction": "received"}] * (i + 1), lambda: next(seq))
+        # Conversation 0 went quiet 40 days ago
+        store._conn.execute("UPDATE messages SET timestamp = timestamp - 40 * 86400 WHERE phone = '+15550000000'")
+        store._conn.commit()
+
+        originals = clear_history.CONVERSATION_STORE, clear_history.get_sqlite_store
+        clear_history.CONVERSATION_STORE, clear_history.get_sqlite_store = "sqlite", lambda: store
+        try:
+            dry = clear_history.clear_all_conversations(dry_run=True)
+            assert dry["conversations"] == 3 and dry["documents"] == 6
+            assert clear_history.clear_all_conversations(older_than_days=30)["documents"] == 1
+            assert store.get_messages("+15550000000") == [] and len(store.get_messages("+15550000002")) == 3
+            summary = clear_history.clear_all_conversations()
+            assert summary["conversations"] == 2 and summary["documents"] == 5
+            assert store.get_messages("+15550000002") == [] and store.get_conversation_head("+15550000002") is None
+        finally:
+            clear_history.CONVERSATION_STORE, clear_history.get_sqlite_store = originals
+            store.close()
+    print("✅ clear_history clears the SQLite store when CONVERSATION_STORE=sqlite")
+
+if __name__ == "__main__":
+    test_purge_pages_and_batches()
+    test_purge_only_idle_conversations()
+    test_purge_reads_conversations_in_chunks()
+    test_clear_history_uses_configured_store()
@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import Catalog, CATALOG_EXAMPLE_PATH, answer_product_question, canonicalize_order, get_catalog, set_catalog
+
+def test_fuzzy_matching():
+    catalog = Catalog.load(CATALOG_EXAMPLE_PATH)
+    for name, expected in [
+        ("king salmon", "King Salmon"),
+        ("salmon king", "King Salmon"),
+        ("chinook", "King Salmon"),
+        ("dungeness crabs", "Dungeness Crab"),
+        ("sable fish", "Black Cod"),
+        ("pizza", None),
+        ("salmon", None),  # Too generic to pick a species
+    ]:
+        product = catalog.match(name)
+        assert (product["name"] if product else None) == expected, name
+    print("✅ Free-text names resolve to catalog products")
+
+def test_price_questions_answered_locally():
+    set_catalog(Catalog.load(CATALOG_EXAMPLE_PATH))
+    try:
+        _check_price_answers()
+    finally:
+        set_catalog(None)
+
+def _check_price_answers():
+    assert "$" in answer_product_question("how much is halibut?")
+    assert "$" in answer_product_question("Hey! What's the price of king salmon?")
+    assert "out of" in answer_product_question("do you have spot prawns?")
+    # Orders and unknown products still go to the LLM
+    assert answer_product_question("10 lbs salmon") is None
+    assert answer_product_question("how much for the pizza") is None
+    print("✅ Price and availability questions answered from the catalog")
+
+def test_canonicalize_items():
+    catalog = Catalog([{"name": "Pacific Halibut", "aliases": ["halibut"], "price_per_lb": 22.0, "available": True}])
+    items = catalog.canonicalize_items([{"product": "halibut", "quantity": "5 lbs"}, {"product": "mystery fish", "quantity": "1 lbs"}])
+    assert items == [{"product": "Pacific Halibut", "quantity": "5 lbs"}, {"product": "mystery fish", "quantity": "1 lbs"}]
+
+def test_no_catalog_by_default():
+    set_catalog(None)
+    # Without CATALOG_PATH nothing is quoted or renamed
+    assert get_catalog().products == []
+    assert answer_product_question("how much is halibut?") is None
+    order = {"items": [{"product": "halibut", "quantity": "5 lbs"}]}
+    assert canonicalize_order(order) == order
+    print("✅ No catalog configured: no price answers, no renaming")
+
+if __name__ == "__main__":
+    test_fuzzy_matching()
+    test_price_questions_answered_locally()
+    test_canonicalize_items()
+    test_no_catalog_by_default()
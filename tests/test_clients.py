@@ -0,0 +1,53 @@
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients
+
+def test_client_created_once_across_threads():
+    clients.reset_clients()
+    created = []
+
+    def factory():
+        time.sleep(0.05)  # Widen the race window
+        created.append(object())
+        return created[-1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients._get("fake", factory))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert all(r is created[0] for r in results)
+    assert "fake" in clients.init_times
+    clients.reset_clients()
+    print("✅ 8 concurrent callers shared one client")
+
+def test_import_creates_no_clients():
+    clients.reset_clients()
+    import sheets_logic
+    import firebase_logic
+
+    assert sheets_logic.tab_name_for_date("2025-01-17") == "2025-01-17 (Fri, Jan 17)"
+    assert clients._clients == {}
+    print("✅ Importing sheets_logic / firebase_logic created no clients")
+
+def test_warm_up_reports_failures():
+    clients._WARMERS["broken"] = lambda: 1 / 0
+    try:
+        # Must not raise
+        clients.warm_up(["broken", "unknown"])
+        clients.warm_up(["broken"], background=True).join()
+    finally:
+        del clients._WARMERS["broken"]
+    print("✅ Warm-up failures are reported, not raised")
+
+if __name__ == "__main__":
+    test_client_created_once_across_threads()
+    test_import_creates_no_clients()
+    test_warm_up_reports_failures()
@@ -0,0 +1,59 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_cache import ConversationCache
+
+def test_write_through_and_tail():
+    cache = ConversationCache(max_conversations=10, ttl=60, tail=3)
+    phone = "+15551234567"
+
+    assert cache.get(phone) is None  # Miss before anything is cached
+    cache.put(phone, [{"direction": "received", "text": "hi"}], complete=True)
+    cache.append(phone, {"direction": "sent", "text": "Hey! What can I get you?"})
+
+    messages = cache.get(phone)
+    assert [m["text"] for m in messages] == ["hi", "Hey! What can I get you?"]
+
+    # Growing past the tail keeps the newest messages and drops completeness
+    cache.append(phone, {"direction": "received", "text": "10 lbs salmon"})
+    cache.append(phone, {"direction": "sent", "text": "Sure thing!"})
+    assert cache.get(phone) is None
+    assert [m["text"] for m in cache.get(phone, limit=2)] == ["10 lbs salmon", "Sure thing!"]
+
+    print(f"✅ Cache stats: {cache.stats()}")
+
+def test_stale_entry_dropped():
+    cache = ConversationCache(max_conversations=10, ttl=60, tail=10)
+    phone = "+15551234567"
+    cache.put(phone, [{"direction": "received", "text": "hi"}], complete=True, message_count=1)
+    cache.append(phone, {"direction": "sent", "text": "Hey!"})
+    assert len(cache.get(phone, message_count=2)) == 2
+
+    # Another process stored a message since: the stored count is ahead of the cached copy
+    assert cache.get(phone, message_count=3) is None
+    assert cache.get(phone) is None  # Dropped, not just skipped
+    assert cache.stats()["stale"] == 1
+    print("✅ An entry behind the stored message count is dropped")
+
+def test_lru_eviction_and_ttl():
+    cache = ConversationCache(max_conversations=2, ttl=0.05, tail=10)
+    cache.put("+1", [], complete=True)
+    cache.put("+2", [], complete=True)
+    cache.get("+1")  # +1 is now most recently used
+    cache.put("+3", [], complete=True)
+
+    assert cache.get("+2") is None
+    assert cache.get("+1") == []
+    assert cache.stats()["evictions"] == 1
+
+    time.sleep(0.06)
+    assert cache.get("+3") is None
+    assert cache.stats()["expirations"] >= 1
+    print(f"✅ Cache stats: {cache.stats()}")
+
+if __name__ == "__main__":
+    test_write_through_and_tail()
+    test_stale_entry_dropped()
+    test_lru_eviction_and_ttl()
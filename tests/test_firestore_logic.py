@@ -0,0 +1,194 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_admin import firestore
+
+import clients
+import firebase_logic
+from llm_usage import usage_ledger
+from conversation_cache import ConversationCache
+from standins import InMemoryFirestore
+
+PHONE = "+15550005555"
+
+class firestore_standin:
+    """firebase_logic on an InMemoryFirestore, whatever CONVERSATION_STORE says"""
+
+    def __enter__(self):
+        self.db = InMemoryFirestore()
+        self.originals = (firebase_logic.CONVERSATION_STORE, firestore.transactional, usage_ledger.flush_interval)
+        firebase_logic.CONVERSATION_STORE = "firestore"
+        firestore.transactional = InMemoryFirestore.transactional
+        usage_ledger.flush_interval = 0
+        clients.set_client("firestore", self.db)
+        firebase_logic.conversation_cache.invalidate()
+        return self.db
+
+    def __exit__(self, *exc):
+        firebase_logic.CONVERSATION_STORE, firestore.transactional, usage_ledger.flush_interval = self.originals
+        clients.reset_clients()
+        firebase_logic.conversation_cache.invalidate()
+        return False
+
+def turn(i):
+    return [{"text": f"order {i}", "direction": "received"}, {"text": f"reply {i}", "direction": "sent"}]
+
+def test_turn_is_one_commit():
+    with firestore_standin() as db:
+        firebase_logic.store_turn(PHONE, turn(0), metadata={"awaiting_confirmation": True})
+        assert db.commits == 1
+
+        stored = [snapshot.to_dict() for snapshot in db.collection("conversations").document(PHONE).collection("messages").stream()]
+        # One commit, one server timestamp: seq orders the two messages
+        assert len(stored) == 2 and stored[0]["timestamp"] == stored[1]["timestamp"]
+        by_seq = sorted(stored, key=lambda m: m["seq"])
+        assert [m["text"] for m in by_seq] == ["order 0", "reply 0"]
+
+        head = firebase_logic.get_conversation_head(PHONE)
+        assert head["message_count"] == 2 and head["awaiting_confirmation"]
+        assert [m["text"] for m in head["recent"]] == ["order 0", "reply 0"]
+
+        reads = db.reads
+        for i in range(1, 4):
+            firebase_logic.store_turn(PHONE, turn(i))
+        assert db.commits == 4
+        # The running count is on the parent document: no count() query after the first turn
+        assert db.reads - reads == 3
+        firebase_logic.conversation_cache.invalidate()
+        messages = firebase_logic.get_messages(PHONE)
+        assert [m["text"] for m in messages] == [text for i in range(4) for text in (f"order {i}", f"reply {i}")]
+        assert firebase_logic.get_conversation_head(PHONE)["message_count"] == 8
+    print("✅ Each turn is one commit, in order despite shared server timestamps")
+
+def test_store_message_is_a_one_message_turn():
+    with firestore_standin() as db:
+        firebase_logic.store_message(PHONE, "hi", "received")
+        firebase_logic.store_message(PHONE, "hello!", "sent")
+        assert db.commits == 2
+        assert [m["text"] for m in firebase_logic.get_messages(PHONE)] == ["hi", "hello!"]
+        assert firebase_logic.get_conversation_head(PHONE)["message_count"] == 2
+    print("✅ store_message keeps working as a one-message turn")
+
+def test_cache_checked_against_head():
+    with firestore_standin() as db:
+        for i in range(40):
+            firebase_logic.store_turn(PHONE, turn(i))
+        firebase_logic.conversation_cache.invalidate()
+        stats = firebase_logic.get_cache_stats()
+
+        # Longer than the head: one tail query, then the head read alone answers each turn
+        tail = firebase_logic.get_messages(PHONE, limit=40)
+        reads = db.reads
+        for i in range(40, 43):
+            firebase_logic.store_turn(PHONE, turn(i))
+            assert db.reads - reads == 1  # The store_turn transaction's head read
+            reads = db.reads
+            tail = firebase_logic.get_messages(PHONE, limit=40)
+            assert db.reads - reads == 1 and tail[-1]["text"] == f"reply {i}"
+            reads = db.reads
+        assert firebase_logic.get_cache_stats()["hits"] - stats["hits"] == 3
+
+        # Another process writes: this one's cached copy no longer matches the head's count
+        local_cache = firebase_logic.conversation_cache
+        firebase_logic.conversation_cache = ConversationCache()
+        try:
+            firebase_logic.store_turn(PHONE, turn(43))
+        finally:
+            firebase_logic.conversation_cache = local_cache
+        tail = firebase_logic.get_messages(PHONE, limit=40)
+        assert [m["text"] for m in tail[-2:]] == ["order 43", "reply 43"]
+        assert firebase_logic.get_cache_stats()["stale"] == stats["stale"] + 1
+
+        # Cleared elsewhere: no head, so nothing is served from the cache
+        db.collection("conversations").document(PHONE).delete()
+        for ref in db.collection("conversations").document(PHONE).collection("messages").list_documents():
+            ref.delete()
+        assert firebase_logic.get_messages(PHONE, limit=40) == []
+    print("✅ Cached conversations are checked against the head's message count")
+
+def test_cursor_pages_split_same_timestamp_turns():
+    with firestore_standin():
+        for i in range(5):
+            firebase_logic.store_turn(PHONE, turn(i))
+        expected = [text for i in range(5) for text in (f"order {i}", f"reply {i}")]
+
+        # Newest page first, then back in time; limit 3 splits turns whose messages share a timestamp
+        page, has_more = firebase_logic.get_messages_page(PHONE, 3)
+        assert [m["text"] for m in page] == expected[-3:] and has_more
+        pages = [page]
+        while has_more:
+            page, has_more = firebase_logic.get_messages_page(PHONE, 3, before=pages[0][0]["id"])
+            pages.insert(0, page)
+        assert [m["text"] for page in pages for m in page] == expected
+
+        # Forward from the oldest message: every message once, in order
+        oldest = pages[0][0]
+        texts = [oldest["text"]]
+        after = oldest["id"]
+        while True:
+            page, has_more = firebase_logic.get_messages_page(PHONE, 3, after=after)
+            texts += [m["text"] for m in page]
+            if not has_more:
+                break
+            after = page[-1]["id"]
+        assert texts == expected
+
+        # since: whole turns from the third one on
+        since = firebase_logic.get_messages(PHONE)[4]["timestamp"]
+        page, has_more = firebase_logic.get_messages_page(PHONE, 50, since=since)
+        assert [m["text"] for m in page] == expected[4:] and not has_more
+        assert firebase_logic.get_messages_page(PHONE, 3, after="no-such-message") == ([], False)
+    print("✅ Cursor pages never repeat or skip messages that share a timestamp")
+
+def test_legacy_messages_without_seq():
+    with firestore_standin() as db:
+        messages_ref = db.collection("conversations").document(PHONE).collection("messages")
+        # Stored before messages had a seq (and before conversation heads)
+        for i in range(3):
+            messages_ref.document(f"legacy{i}").set({"direction": "received", "text": f"legacy {i}", "timestamp": firestore.SERVER_TIMESTAMP})
+        legacy = [f"legacy {i}" for i in range(3)]
+        assert [m["text"] for m in firebase_logic.get_messages(PHONE)] == legacy
+
+        firebase_logic.store_turn(PHONE, turn(0))
+        expected = legacy + ["order 0", "reply 0"]
+        firebase_logic.conversation_cache.invalidate()
+        assert firebase_logic.get_conversation_head(PHONE)["message_count"] == 5
+        assert [m["text"] for m in firebase_logic.get_messages(PHONE)] == expected
+        assert [m["text"] for m in firebase_logic.stream_messages(PHONE)] == expected
+        page, has_more = firebase_logic.get_messages_page(PHONE, 3)
+        assert [m["text"] for m in page] == expected[-3:] and has_more
+    print("✅ Messages stored without a seq stay visible, ordered by timestamp")
+
+def test_stream_and_backfilled_seq():
+    with firestore_standin() as db:
+        messages_ref = db.collection("conversations").document(PHONE).collection("messages")
+        messages_ref.document("legacy").set({"direction": "received", "text": "legacy hi", "timestamp": firestore.SERVER_TIMESTAMP})
+        for i in range(3):
+            firebase_logic.store_turn(PHONE, turn(i))
+        expected = ["legacy hi"] + [text for i in range(3) for text in (f"order {i}", f"reply {i}")]
+        assert [m["text"] for m in firebase_logic.stream_messages(PHONE)] == expected
+
+        # A new conversation is ordered by seq from its first turn
+        firebase_logic.store_turn("+15550006666", turn(0))
+        assert firebase_logic.get_conversation_head("+15550006666")["seq_ordered"]
+
+        import backfill_seq
+        summary = backfill_seq.backfill_all_conversations()
+        assert summary == {**summary, "conversations": 2, "messages": 1}
+        assert firebase_logic.get_conversation_head(PHONE)["seq_ordered"]
+        assert firebase_logic.backfill_seq(PHONE) == 0
+        assert [m["text"] for m in firebase_logic.stream_messages(PHONE)] == expected
+        page, _ = firebase_logic.get_messages_page(PHONE, 3)
+        assert [m["text"] for m in page] == expected[-3:]
+        since = firebase_logic.get_messages(PHONE)[3]["timestamp"]
+        assert [m["text"] for m in firebase_logic.stream_messages(PHONE, since=since)] == expected[3:]
+    print("✅ backfill_seq.py moves every conversation over to (timestamp, seq) order")
+
+if __name__ == "__main__":
+    test_turn_is_one_commit()
+    test_store_message_is_a_one_message_turn()
+    test_cache_checked_against_head()
+    test_cursor_pages_split_same_timestamp_turns()
+    test_legacy_messages_without_seq()
+    test_stream_and_backfilled_seq()
@@ -0,0 +1,185 @@
+import sys
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clients
+from clients import GoogleHttpPool, SharedCredentials
+
+class SingleThreadedHttp:
+    """httplib2.Http stand-in that records any request made while another one is still running on it"""
+
+    overlaps = 0
+
+    def __init__(self, credentials):
+        self.busy = False
+        self.closed = False
+
+    def request(self, uri, method="GET", body=None, headers=None):
+        if self.busy:
+            SingleThreadedHttp.overlaps += 1
+        self.busy = True
+        time.sleep(0.01)
+        self.busy = False
+        if uri == "boom":
+            raise ConnectionError("connection reset")
+        return {"status": "200"}, b"{}"
+
+    def close(self):
+        self.closed = True
+
+class ExpiringCredentials:
+    """google-auth credentials stand-in whose refresh is slow and counted"""
+
+    def __init__(self):
+        self.token = None
+        self.refreshes = 0
+
+    @property
+    def valid(self):
+        return self.token is not None
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+
+    def before_request(self, request, method, url, headers):
+        headers["authorization"] = f"Bearer {self.token}"
+
+def test_pool_lends_one_transport_per_request():
+    SingleThreadedHttp.overlaps = 0
+    pool = GoogleHttpPool(credentials=None, size=4, http_factory=SingleThreadedHttp)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda i: pool.request(f"https://sheets/{i}"), range(200)))
+
+    stats = pool.stats()
+    assert SingleThreadedHttp.overlaps == 0
+    assert stats["requests"] == 200 and stats["in_use"] == 0
+    assert stats["idle"] == 4 and stats["peak_in_use"] <= 16
+
+    # A transport that failed mid-request isn't handed out again
+    idle = list(pool._idle)
+    try:
+        pool.request("boom")
+        assert False, "error was swallowed"
+    except ConnectionError:
+        pass
+    assert pool.stats()["discarded"] > stats["discarded"]
+    assert any(http.closed for http in idle)
+    print(f"✅ 200 requests from 16 threads, no transport shared mid-request: {pool.stats()}")
+
+def test_shared_credentials_refresh_once():
+    inner = ExpiringCredentials()
+    credentials = SharedCredentials(inner)
+    headers = [{} for _ in range(8)]
+    threads = [threading.Thread(target=credentials.before_request, args=(None, "GET", "u", h)) for h in headers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inner.refreshes == 1 and credentials.refreshes == 1
+    assert all(h["authorization"] == "Bearer token-1" for h in headers)
+
+    # Several requests rejected with the same token: still one refresh
+    threads = [threading.Thread(target=credentials.refresh, args=(None,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inner.refreshes == 2 and credentials.token == "token-2"
+    print("✅ 8 threads with an expired token triggered one refresh")
+
+def test_fork_drops_inherited_clients():
+    if not hasattr(os, "fork"):
+        print("⏭️  No fork on this platform")
+        return
+    clients.reset_clients()
+    clients._get("google_http", lambda: GoogleHttpPool(credentials=None, http_factory=SingleThreadedHttp))
+    clients.set_client("sheets", object())
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: the pool it inherited is gone, the installed fake stays
+        ok = "google_http" not in clients._clients and "sheets" in clients._clients
+        fresh = clients._get("google_http", lambda: "rebuilt") == "rebuilt"
+        os._exit(0 if ok and fresh else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert isinstance(clients._clients["google_http"], GoogleHttpPool)  # Parent unaffected
+    clients.reset_clients()
+    print("✅ A forked child rebuilds its clients instead of sharing the parent's connections")
+
+class OverlapCheckingHttp:
+    """Wraps a real transport and counts requests made on it while another one is still running"""
+
+    overlaps = 0
+    _lock = threading.Lock()
+
+    def __init__(self, http):
+        self.http = http
+        self.busy = False
+
+    def request(self, *args, **kwargs):
+        with OverlapCheckingHttp._lock:
+            if self.busy:
+                OverlapCheckingHttp.overlaps += 1
+            self.busy = True
+        try:
+            return self.http.request(*args, **kwargs)
+        finally:
+            self.busy = False
+
+    def close(self):
+        self.http.close()
+
+def test_concurrent_orders_against_fake_sheets():
+    pytest.importorskip("googleapiclient")
+    pytest.importorskip("google_auth_httplib2")
+    from standins import FakeSheetsServer
+    import sheets_logic
+
+    server = FakeSheetsServer(latency_ms=5).start()
+    endpoint = clients.GOOGLE_API_ENDPOINT
+    clients.GOOGLE_API_ENDPOINT = server.url
+    clients.reset_clients()
+    sheets_logic.invalidate_tab_index()
+    OverlapCheckingHttp.overlaps = 0
+    # The pool the Sheets service would build, with each real transport watched for shared use
+    clients._get("google_http", lambda: GoogleHttpPool(
+        clients.get_google_credentials(),
+        http_factory=lambda credentials: OverlapCheckingHttp(clients._new_authorized_http(credentials))))
+    try:
+        dates = ["2025-01-17", "2025-01-18", "2025-01-19"]
+        orders = [(dates[i % len(dates)], {
+            "phone": f"+1555000{i:04d}",
+            "order": [{"product": "King Salmon", "quantity": f"{i} lbs"}],
+            "delivery_address": "Pike Place Chowder, 1530 Post Alley",
+        }) for i in range(160)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(lambda args: sheets_logic.add_order_to_sheet(*args), orders))
+
+        assert results == [sheets_logic.MASTER_SPREADSHEET_ID] * len(orders)
+        tabs = server.tabs[sheets_logic.MASTER_SPREADSHEET_ID]
+        assert len(tabs) == len(dates)
+        # Every order landed exactly once, after its tab's header row
+        assert server.row_count() == len(orders) + len(dates)
+        stats = clients.get_google_http_stats()
+        # Requests really ran side by side, and never two of them on one transport
+        assert OverlapCheckingHttp.overlaps == 0
+        assert stats["in_use"] == 0 and stats["peak_in_use"] > 1 and stats["transports"] >= stats["peak_in_use"]
+        print(f"✅ {len(orders)} concurrent add_order_to_sheet calls, all rows written: {stats}")
+    finally:
+        server.stop()
+        clients.GOOGLE_API_ENDPOINT = endpoint
+        clients.reset_clients()
+        sheets_logic.invalidate_tab_index()
+
+if __name__ == "__main__":
+    test_pool_lends_one_transport_per_request()
+    test_shared_credentials_refresh_once()
+    test_fork_drops_inherited_clients()
+    test_concurrent_orders_against_fake_sheets()
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history_window
+from history_window import window_history
+from standins import InMemorySummaryStore
+
+def make_history(count):
+    history = []
+    for i in range(count):
+        direction = "received" if i % 2 == 0 else "sent"
+        history.append({"direction": direction, "text": f"message number {i} about salmon and halibut"})
+    return history
+
+def test_window_stays_bounded():
+    store = InMemorySummaryStore()
+    history_window.set_summary_store(store)
+    calls = []
+
+    def summarize(previous_summary, messages):
+        calls.append(len(messages))
+        return f"{previous_summary}+{len(messages)}"
+
+    history = []
+    for turn in range(60):
+        history = make_history(turn + 1)
+        summary, recent = window_history(history, summarize, key="+15550000001", max_messages=10, token_budget=10_000)
+        assert len(recent) <= 10
+        assert history[-1] in recent
+
+    print(f"✅ 60 messages, {len(calls)} summary refreshes, last window {len(recent)} messages")
+    # Refreshes fold several messages at a time instead of one per turn
+    assert len(calls) < 15
+    assert sum(calls) + len(recent) == 60
+    # Kept by the store, not by the process: only what the last refresh covers
+    assert store.summaries["+15550000001"]["covered"] == sum(calls)
+    history_window.set_summary_store(None)
+
+def test_changed_history_resets_summary():
+    store = InMemorySummaryStore()
+    history_window.set_summary_store(store)
+    summarize = lambda previous, messages: "summary"
+    window_history(make_history(30), summarize, key="+15550000002", max_messages=10)
+    summary, recent = window_history(make_history(3), summarize, key="+15550000002", max_messages=10)
+    assert summary == ""
+    assert len(recent) == 3
+
+    # A different history that still overflows: summarized afresh, not on top of the old one
+    history = [dict(msg, text=msg["text"].replace("salmon", "cod")) for msg in make_history(30)]
+    summary, recent = window_history(history, lambda previous, messages: f"{previous}|{len(messages)}", key="+15550000002", max_messages=10)
+    assert summary == f"|{30 - len(recent)}"
+    history_window.set_summary_store(None)
+    print("✅ Cleared conversation starts without the old summary")
+
+def test_window_from_stored_tail():
+    store = InMemorySummaryStore()
+    history_window.set_summary_store(store)
+    folded = []
+
+    def summarize(previous_summary, messages):
+        folded.extend(msg["text"] for msg in messages)
+        return f"{len(folded)} folded"
+
+    stored = []
+    for turn in range(60):
+        # Each turn sees only the newest 15 stored messages plus its new, not yet stored, text
+        new = {"direction": "received", "text": f"message number {turn} about salmon and halibut"}
+        summary, recent = window_history(stored[-15:] + [new], summarize, key="+15550000004", max_messages=10, token_budget=10_000)
+        assert len(recent) <= 10 and recent[-1] is new
+        stored.append(dict(new, id=f"m{turn}"))
+
+    # Every message folded exactly once, in order, and the rest still verbatim
+    assert folded + [msg["text"] for msg in recent] == [msg["text"] for msg in stored]
+    assert summary == f"{len(folded)} folded"
+    assert store.summaries["+15550000004"]["covered_id"] == f"m{len(folded) - 1}"
+    history_window.set_summary_store(None)
+    print(f"✅ Windowed from a 15-message tail: {len(folded)} messages folded, none twice")
+
+def test_summary_on_conversation_document():
+    import tempfile
+    import firebase_logic
+    from sqlite_store import SQLiteConversationStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        local_store = firebase_logic._local_store
+        firebase_logic._local_store = lambda: store
+        calls = []
+        summarize = lambda previous, messages: calls.append(len(messages)) or "King Salmon, Fridays"
+        try:
+            window_history(make_history(30), summarize, key="+15550000003", max_messages=10)
+            stored = store.load_history_summary("+15550000003")
+            assert stored["summary"] == "King Salmon, Fridays" and stored["covered"] == calls[0]
+            # A fresh process (nothing in memory) picks it up without summarizing again
+            summary, _ = window_history(make_history(31), summarize, key="+15550000003", max_messages=10)
+            assert summary == "King Salmon, Fridays" and len(calls) == 1
+            # Clearing the conversation takes the summary with it
+            store.clear_conversation("+15550000003")
+            assert store.load_history_summary("+15550000003") is None
+        finally:
+            firebase_logic._local_store = local_store
+            store.close()
+    print("✅ Rolling summary is kept on the conversation document")
+
+if __name__ == "__main__":
+    test_window_stays_bounded()
+    test_changed_history_resets_summary()
+    test_window_from_stored_tail()
+    test_summary_on_conversation_document()
@@ -0,0 +1,107 @@
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idempotency import IdempotencyCache, NEW, DONE, IN_FLIGHT
+from sqlite_store import SQLiteConversationStore
+
+RESPONSE = {"status": 200, "body": '{"reply":"Sure thing!"}', "mimetype": "application/json"}
+
+class SQLiteRecords:
+    """The SQLite store's webhook_requests table, as firebase_logic uses it with CONVERSATION_STORE=sqlite"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def claim(self, sid, stale_after, ttl):
+        return self.store.claim_webhook_request(sid, stale_after)
+
+    def get(self, sid):
+        return self.store.get_webhook_request(sid)
+
+    def finish(self, sid, response, ttl):
+        self.store.finish_webhook_request(sid, response)
+
+    def release(self, sid):
+        self.store.release_webhook_request(sid)
+
+    def prune(self, older_than):
+        return self.store.prune_webhook_requests(older_than)
+
+def test_retry_gets_the_first_response():
+    cache = IdempotencyCache()
+    assert cache.begin("SM1") == (NEW, None)
+    cache.complete("SM1", RESPONSE)
+    assert cache.begin("SM1") == (DONE, RESPONSE)
+    # A failed attempt is released so the retry does the work
+    assert cache.begin("SM2") == (NEW, None)
+    cache.fail("SM2")
+    assert cache.begin("SM2") == (NEW, None)
+    stats = cache.stats()
+    assert stats["duplicates"] == 1 and stats["requests"] == 4
+    print("✅ Retry after completion served from cache; failed SID can be retried")
+
+def test_concurrent_retry_waits_for_the_first():
+    cache = IdempotencyCache(wait=2)
+    assert cache.begin("SM1")[0] == NEW
+    results = []
+    retry = threading.Thread(target=lambda: results.append(cache.begin("SM1")))
+    retry.start()
+    time.sleep(0.1)
+    assert not results  # Still waiting on the first request
+    cache.complete("SM1", RESPONSE)
+    retry.join()
+    assert results == [(DONE, RESPONSE)]
+    assert cache.stats()["waited"] == 1
+
+    cache = IdempotencyCache(wait=0.1)
+    cache.begin("SM2")
+    assert cache.begin("SM2") == (IN_FLIGHT, None)
+    assert cache.stats()["gave_up"] == 1
+    print("✅ Concurrent retry waited instead of recomputing; gives up after the wait limit")
+
+def test_records_shared_across_processes():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        first = IdempotencyCache(records=SQLiteRecords(store), wait=2)
+        second = IdempotencyCache(records=SQLiteRecords(store), wait=2)
+
+        assert first.begin("SM1")[0] == NEW
+        results = []
+        retry = threading.Thread(target=lambda: results.append(second.begin("SM1")))
+        retry.start()
+        time.sleep(0.3)
+        first.complete("SM1", RESPONSE)
+        retry.join()
+        assert results == [(DONE, RESPONSE)]
+        assert second.stats()["duplicates_from_store"] == 1
+
+        # A process that restarted only has the stored record
+        restarted = IdempotencyCache(records=SQLiteRecords(store))
+        assert restarted.begin("SM1") == (DONE, RESPONSE)
+
+        # An abandoned claim is taken over once it's stale
+        assert first.begin("SM2")[0] == NEW
+        assert IdempotencyCache(records=SQLiteRecords(store), wait=0.3).begin("SM2") == (IN_FLIGHT, None)
+        assert IdempotencyCache(records=SQLiteRecords(store), stale_after=0).begin("SM2") == (NEW, None)
+        store.close()
+    print("✅ Stored records catch retries on other processes and after restarts")
+
+def test_bounded_cache_keeps_in_flight_claims():
+    cache = IdempotencyCache(max_entries=3)
+    cache.begin("SM-busy")
+    for i in range(5):
+        cache.begin(f"SM{i}")
+        cache.complete(f"SM{i}", RESPONSE)
+    assert cache.stats()["entries"] == 3
+    assert cache._entries["SM-busy"]["state"] == IN_FLIGHT
+    print("✅ Cache stays bounded without dropping in-flight claims")
+
+if __name__ == "__main__":
+    test_retry_gets_the_first_response()
+    test_concurrent_retry_waits_for_the_first()
+    test_records_shared_across_processes()
+    test_bounded_cache_keeps_in_flight_claims()
@@ -0,0 +1,112 @@
+import sys
+import os
+import time
+import threading
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import LLMClient, DeadlineExceeded
+
+class RateLimitError(Exception):
+    status_code = 429
+
+class BadRequestError(Exception):
+    status_code = 400
+
+class FakeOpenAI:
+    """chat.completions.create that plays back a script of delays / errors"""
+
+    def __init__(self, script):
+        self.script = list(script)  # each step: seconds to sleep, or an exception to raise
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            step = self.script.pop(0) if self.script else 0
+            call = self.calls
+        if isinstance(step, Exception):
+            raise step
+        time.sleep(step)
+        return SimpleNamespace(call=call)
+
+def test_retries_429_then_succeeds():
+    client = LLMClient(FakeOpenAI([RateLimitError(), RateLimitError(), 0]), backoff_base=0.01, hedge=False)
+    response = client.chat(model="gpt-3.5-turbo", messages=[])
+    assert response.call == 3
+    stats = client.stats()
+    assert stats["retries"] == 2 and stats["requests"] == 3 and stats["failures"] == 0
+    print("✅ Two 429s retried with backoff, third attempt succeeded")
+
+def test_non_retryable_error_raised_immediately():
+    fake = FakeOpenAI([BadRequestError("bad"), 0])
+    client = LLMClient(fake, backoff_base=0.01, hedge=False)
+    try:
+        client.chat(model="gpt-3.5-turbo", messages=[])
+        assert False, "expected BadRequestError"
+    except BadRequestError:
+        pass
+    assert fake.calls == 1 and client.stats()["failures"] == 1
+    print("✅ 400 not retried")
+
+def test_deadline_bounds_total_time():
+    client = LLMClient(FakeOpenAI([RateLimitError()] * 10), max_attempts=10, backoff_base=0.1, hedge=False)
+    started = time.monotonic()
+    try:
+        client.chat(deadline=0.3, model="gpt-3.5-turbo", messages=[])
+        assert False, "expected DeadlineExceeded"
+    except DeadlineExceeded:
+        pass
+    assert time.monotonic() - started < 0.5
+    assert client.stats()["deadline_exceeded"] == 1
+    print("✅ Retries stop at the deadline")
+
+def test_hedge_beats_slow_primary():
+    # Primary takes 1s, the hedge fired after 0.05s answers immediately
+    client = LLMClient(FakeOpenAI([1.0, 0]), hedge=True, hedge_delay=0.05)
+    started = time.monotonic()
+    response = client.chat(model="gpt-3.5-turbo", messages=[])
+    elapsed = time.monotonic() - started
+    assert response.call == 2 and elapsed < 0.5
+    stats = client.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    print(f"✅ Hedged request answered in {elapsed * 1000:.0f} ms instead of ~1000 ms")
+
+def test_losing_hedge_response_is_reported():
+    client = LLMClient(FakeOpenAI([0.3, 0]), hedge=True, hedge_delay=0.05)
+    discarded = []
+    finished = threading.Event()
+
+    def on_discarded(response):
+        discarded.append(response)
+        finished.set()
+
+    response = client.chat(model="gpt-3.5-turbo", messages=[], on_discarded=on_discarded)
+    assert response.call == 2 and not discarded
+    # The slow primary still finishes (and is billed) after the backup won
+    assert finished.wait(2)
+    assert [r.call for r in discarded] == [1]
+    print("✅ The losing hedged request's response is handed back for token accounting")
+
+def test_streams_stay_out_of_hedge_delay():
+    client = LLMClient(FakeOpenAI([0.05] * 20 + [0.001] * 40), hedge=True, hedge_delay=0.5)
+    for _ in range(20):
+        client.chat(model="gpt-3.5-turbo", messages=[], hedge=False)
+    delay = client.current_hedge_delay()
+    # Streams come back at the headers, far sooner than a whole completion
+    for _ in range(40):
+        client.chat(model="gpt-3.5-turbo", messages=[], stream=True)
+    assert client.current_hedge_delay() == delay and delay >= 0.04
+    stats = client.stats()
+    assert stats["stream_headers_p95_ms"] < 10 <= stats["p95_ms"]
+    print(f"✅ Streamed requests reported apart ({stats['stream_headers_p95_ms']} ms to headers), hedge delay kept at {delay * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    test_retries_429_then_succeeds()
+    test_non_retryable_error_raised_immediately()
+    test_deadline_bounds_total_time()
+    test_hedge_beats_slow_primary()
+    test_losing_hedge_response_is_reported()
+    test_streams_stay_out_of_hedge_delay()
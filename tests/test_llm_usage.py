@@ -0,0 +1,143 @@
+import sys
+import os
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_usage import UsageLedger, TokenBudgetExceeded, cost_usd
+from sqlite_store import SQLiteConversationStore
+
+PHONE = "+15550001111"
+
+def _response(content, prompt_tokens=0, completion_tokens=0):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+    )
+
+def test_prompt_budget_trims_oldest_history():
+    ledger = UsageLedger(prompt_budget=200, conversation_budget=0, flush_interval=0)
+    messages = [{"role": "system", "content": "You sell fish."}]
+    for i in range(20):
+        messages.append({"role": "user" if i % 2 == 0 else "assistant", "content": f"message number {i} " * 10})
+    messages.append({"role": "user", "content": "10 lbs salmon"})
+
+    fitted = ledger.fit_prompt(messages, PHONE)
+    assert fitted[0] == messages[0] and fitted[-1] == messages[-1]
+    assert 2 < len(fitted) < len(messages)
+    assert fitted[1:-1] == messages[len(messages) - len(fitted) + 1:-1]  # Newest history kept
+    assert ledger.stats()["trimmed"] == 1
+
+    try:
+        ledger.fit_prompt([{"role": "user", "content": "salmon " * 1000}], PHONE)
+        assert False, "oversized prompt was accepted"
+    except TokenBudgetExceeded:
+        pass
+    assert ledger.stats()["rejected"] == 1
+    print(f"✅ Prompt trimmed to {len(fitted)} of {len(messages)} messages; unfittable prompt rejected")
+
+def test_conversation_budget_and_order_rollup():
+    ledger = UsageLedger(prompt_budget=0, conversation_budget=1000, flush_interval=0)
+    prompt = [{"role": "user", "content": "hi"}]
+    ledger.record_response("reply", PHONE, "gpt-3.5-turbo", _response("Hey!", 600, 20), prompt)
+    ledger.record_response("extract", PHONE, "gpt-3.5-turbo", _response('{"items": []}'), prompt)
+    assert ledger.stats()["estimated"] == 1  # No usage reported by the second response
+
+    try:
+        ledger.fit_prompt([{"role": "user", "content": "x " * 1600}], PHONE)
+        assert False, "conversation budget not enforced"
+    except TokenBudgetExceeded:
+        pass
+
+    rollup = ledger.close_order(PHONE, order_ref="order-1")
+    assert rollup["calls"] == 2 and rollup["prompt_tokens"] > 600
+    assert set(rollup["by_type"]) == {"reply", "extract"}
+    assert rollup["cost_usd"] > cost_usd("gpt-3.5-turbo", 600, 20)
+    # The next order starts from zero
+    assert ledger.conversation_usage(PHONE)["calls"] == 0
+    ledger.fit_prompt([{"role": "user", "content": "x " * 1600}], PHONE)
+    print(f"✅ Conversation budget enforced; order rolled up at ${rollup['cost_usd']:.6f}")
+
+def test_flush_retries_and_sqlite_sink():
+    failing = {"on": True}
+    flushed = []
+
+    def sink(usage, orders):
+        if failing["on"]:
+            raise RuntimeError("storage down")
+        flushed.append((usage, orders))
+
+    ledger = UsageLedger(flush_interval=0, sink=sink)
+    ledger.record("reply", PHONE, "gpt-3.5-turbo", 100, 10)
+    ledger.close_order(PHONE)
+    assert ledger.flush() == 0 and ledger.stats()["flush_errors"] == 1
+    ledger.record("reply", PHONE, "gpt-3.5-turbo", 50, 5)
+    failing["on"] = False
+    assert ledger.flush() == 2
+    usage, orders = flushed[0]
+    assert usage == [{"phone": PHONE, "call_type": "reply", "calls": 2, "prompt_tokens": 150,
+                      "completion_tokens": 15, "cost_usd": usage[0]["cost_usd"]}]
+    assert len(orders) == 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "usage.db"))
+        store.store_usage(usage, orders)
+        store.store_usage(usage, [])
+        assert store.get_usage(PHONE)["reply"]["prompt_tokens"] == 300
+        assert store.get_order_costs(PHONE)[0]["prompt_tokens"] == 100
+        store.close()
+    print("✅ Failed flush kept for retry; usage increments add up in SQLite")
+
+def test_budgets_off_by_default():
+    if os.getenv("PROMPT_TOKEN_BUDGET") or os.getenv("CONVERSATION_TOKEN_BUDGET"):
+        print("⏭️  Budgets set in the environment")
+        return
+    ledger = UsageLedger(flush_interval=0)
+    # A long extraction prompt ([system, user], nothing to trim) goes through untouched
+    messages = [{"role": "system", "content": "Extract the order."}, {"role": "user", "content": "salmon " * 20000}]
+    ledger.record("reply", PHONE, "gpt-3.5-turbo", 10**6, 10**5)
+    assert ledger.fit_prompt(messages, PHONE) == messages
+    assert ledger.stats()["rejected"] == 0
+    print("✅ No budgets unless configured")
+
+def test_order_rolled_up_once_after_a_failed_write():
+    import sheets_logic
+    from llm_usage import usage_ledger
+
+    attempts = []
+
+    def flaky_add_order(delivery_date, order_data):
+        attempts.append(order_data)
+        if len(attempts) == 1:
+            raise RuntimeError("Sheets unavailable")
+        return "sheet-id"
+
+    original, outbox = sheets_logic.add_order_to_sheet, sheets_logic.USE_SHEETS_OUTBOX
+    sheets_logic.add_order_to_sheet, sheets_logic.USE_SHEETS_OUTBOX = flaky_add_order, False
+    flush_interval, usage_ledger.flush_interval = usage_ledger.flush_interval, 0
+    usage_ledger.reset()
+    try:
+        usage_ledger.record("reply", PHONE, "gpt-3.5-turbo", 100, 10)
+        order = {"items": [{"product": "King Salmon", "quantity": "10 lbs"}], "delivery_date": "2025-01-17"}
+        try:
+            sheets_logic.process_confirmed_order(PHONE, order)
+            assert False, "write error was swallowed"
+        except RuntimeError:
+            pass
+        # Still open: the retry below closes it
+        assert usage_ledger.stats()["orders"] == 0
+        assert usage_ledger.conversation_usage(PHONE)["calls"] == 1
+        assert sheets_logic.process_confirmed_order(PHONE, order) == "sheet-id"
+        assert usage_ledger.stats()["orders"] == 1
+    finally:
+        sheets_logic.add_order_to_sheet, sheets_logic.USE_SHEETS_OUTBOX = original, outbox
+        usage_ledger.reset()
+        usage_ledger.flush_interval = flush_interval
+    print("✅ A failed Sheets write doesn't book a second cost rollup on retry")
+
+if __name__ == "__main__":
+    test_prompt_budget_trims_oldest_history()
+    test_conversation_budget_and_order_rollup()
+    test_flush_retries_and_sqlite_sink()
+    test_budgets_off_by_default()
+    test_order_rolled_up_once_after_a_failed_write()
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_extractor import extract_items, extract_order
+from catalog import Catalog, CATALOG_EXAMPLE_PATH, set_catalog
+
+def test_units_convert_to_pounds():
+    items, confident = extract_items("Hey! I need 2 cases of king salmon, 1kg cod and 32 oz crab please")
+    print(f"Extracted: {items}")
+    assert confident
+    assert items == [
+        {"product": "king salmon", "quantity": "20 lbs"},
+        {"product": "cod", "quantity": "2.2 lbs"},
+        {"product": "crab", "quantity": "2 lbs"},
+    ]
+
+def test_low_confidence_falls_back():
+    for message in ["123 Main St, Seattle", "July 25", "what's the price of halibut?", "actually make the salmon 25 lbs"]:
+        items, confident = extract_items(message)
+        assert not confident, message
+    assert extract_order(["10 lbs salmon", "deliver Friday"]) is None
+    print("✅ Dates, addresses, questions and edits go to the LLM")
+
+def test_merges_into_previous_order():
+    previous = {"items": [{"product": "salmon", "quantity": "10 lbs"}], "delivery_date": "Friday, July 25, 2025",
+                "delivery_address": None, "notes": None}
+    order = extract_order(["15 lbs salmon and 5 lbs halibut"], previous)
+    assert order["items"] == [{"product": "salmon", "quantity": "15 lbs"}, {"product": "halibut", "quantity": "5 lbs"}]
+    assert order["delivery_date"] == "Friday, July 25, 2025"
+    print(f"✅ Merged order: {order}")
+
+def test_numbers_need_a_unit_or_known_product():
+    # A zip code or street number next to a word isn't a quantity
+    for message in ["Seattle 98101", "98101 seattle", "10 salmon", "2 boxes salmon", "salmon 3 bags", "4 pieces halibut"]:
+        items, confident = extract_items(message)
+        assert (items, confident) == ([], False), message
+    assert extract_order(["10 lbs salmon", "Seattle 98101"]) is None
+
+    # A product from the catalog counts as pounds without a unit
+    set_catalog(Catalog.load(CATALOG_EXAMPLE_PATH))
+    try:
+        assert extract_items("10 king salmon") == ([{"product": "king salmon", "quantity": "10 lbs"}], True)
+        assert extract_items("Seattle 98101") == ([], False)
+        assert extract_items("3 boxes king salmon") == ([], False)
+    finally:
+        set_catalog(None)
+    print("✅ Zip codes and packaging without a weight go to the LLM")
+
+if __name__ == "__main__":
+    test_units_convert_to_pounds()
+    test_low_confidence_falls_back()
+    test_merges_into_previous_order()
+    test_numbers_need_a_unit_or_known_product()
@@ -0,0 +1,144 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import order_state
+
+PHONE = "+15550003333"
+
+class FakeParser:
+    """Stored order state in a dict, and parse calls recorded instead of sent to the LLM"""
+
+    def __init__(self):
+        self.stored = {}
+        self.full_parses = []
+        self.updates = []
+
+    def load_order_state(self, phone_number):
+        return self.stored.get(phone_number)
+
+    def save_order_state(self, phone_number, state):
+        self.stored[phone_number] = state
+
+    def parse_order_from_conversation(self, conversation, phone_number=None):
+        self.full_parses.append([msg["text"] for msg in conversation])
+        return {"items": [{"product": "King Salmon", "quantity": "10 lbs"}]}
+
+    def parse_order_update(self, previous_order, new_messages, fingerprint=None, phone_number=None):
+        self.updates.append(list(new_messages))
+        return {"items": previous_order["items"] + [{"product": "Halibut", "quantity": "5 lbs"}]}
+
+def _install(fake):
+    names = ("load_order_state", "save_order_state", "parse_order_from_conversation", "parse_order_update")
+    originals = {name: getattr(order_state, name) for name in names}
+    for name in names:
+        setattr(order_state, name, getattr(fake, name))
+    order_state._states.clear()
+    return originals
+
+def _restore(originals):
+    for name, value in originals.items():
+        setattr(order_state, name, value)
+    order_state._states.clear()
+
+def conversation(*texts):
+    history = []
+    for text in texts:
+        history.append({"direction": "received", "text": text})
+        history.append({"direction": "sent", "text": "Got it!"})
+    return history
+
+def test_continuation_parses_only_new_messages():
+    fake = FakeParser()
+    originals = _install(fake)
+    try:
+        order_state.update_order_state(PHONE, conversation("10 lbs king salmon"))
+        assert len(fake.full_parses) == 1 and fake.updates == []
+
+        # Same customer messages (only our replies differ): stored order, no call
+        same = conversation("10 lbs king salmon")[:1]
+        order_state.update_order_state(PHONE, same)
+        assert len(fake.full_parses) == 1 and fake.updates == []
+
+        # Messages appended after the parsed prefix: just those go to the extractor
+        order = order_state.update_order_state(PHONE, conversation("10 lbs king salmon", "and 5 lbs halibut", "Friday"))
+        assert fake.updates == [["and 5 lbs halibut", "Friday"]] and len(fake.full_parses) == 1
+        assert [item["product"] for item in order["items"]] == ["King Salmon", "Halibut"]
+        assert fake.stored[PHONE]["parsed_count"] == 3
+    finally:
+        _restore(originals)
+    print("✅ Appended messages are parsed incrementally from the fingerprinted prefix")
+
+def test_changed_prefix_reparses_everything():
+    fake = FakeParser()
+    originals = _install(fake)
+    try:
+        order_state.update_order_state(PHONE, conversation("10 lbs king salmon", "Friday"))
+        # An earlier message differs, so the stored fingerprint isn't a prefix any more
+        order_state.update_order_state(PHONE, conversation("10 lbs coho", "Friday", "123 Main St"))
+        assert fake.updates == [] and len(fake.full_parses) == 2
+        # Fewer customer messages than were parsed (history cleared): full parse too
+        order_state.update_order_state(PHONE, conversation("hi"))
+        assert fake.updates == [] and len(fake.full_parses) == 3
+    finally:
+        _restore(originals)
+    print("✅ Edited or cleared history falls back to a full parse")
+
+def test_state_cache_is_bounded():
+    fake = FakeParser()
+    originals = _install(fake)
+    size, ttl = order_state.CONVERSATION_CACHE_SIZE, order_state.CONVERSATION_CACHE_TTL
+    order_state.CONVERSATION_CACHE_SIZE = 3
+    try:
+        for i in range(10):
+            order_state.update_order_state(f"+1555000{i:04d}", conversation("10 lbs king salmon"))
+        assert len(order_state._states) == 3 and len(fake.stored) == 10
+
+        # Evicted or expired entries come back from the conversation document
+        order_state.CONVERSATION_CACHE_TTL = 0
+        order_state.update_order_state("+15550000000", conversation("10 lbs king salmon", "Friday"))
+        assert fake.updates == [["Friday"]] and len(fake.full_parses) == 10
+    finally:
+        order_state.CONVERSATION_CACHE_SIZE, order_state.CONVERSATION_CACHE_TTL = size, ttl
+        _restore(originals)
+    print("✅ Order states cached for at most CONVERSATION_CACHE_SIZE phones")
+
+def test_cleared_conversation_forgets_order():
+    import tempfile
+    import firebase_logic
+    from sqlite_store import SQLiteConversationStore
+    from llm_usage import usage_ledger
+
+    fake = FakeParser()
+    originals = _install(fake)
+    # The real stored state, on the SQLite store's conversation row
+    order_state.load_order_state = firebase_logic.load_order_state
+    order_state.save_order_state = firebase_logic.save_order_state
+    local_store, flush_interval = firebase_logic._local_store, usage_ledger.flush_interval
+    usage_ledger.flush_interval = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        firebase_logic._local_store = lambda: store
+        try:
+            history = conversation("10 lbs king salmon")
+            firebase_logic.store_turn(PHONE, history)
+            order_state.update_order_state(PHONE, history)
+            usage_ledger.record("reply", PHONE, "gpt-3.5-turbo", 100, 20)
+            assert order_state.get_order_state(PHONE) is not None
+            assert usage_ledger.conversation_usage(PHONE)["calls"] == 1
+
+            firebase_logic.clear_conversation(PHONE)
+            assert order_state.get_order_state(PHONE) is None
+            assert usage_ledger.conversation_usage(PHONE)["calls"] == 0
+        finally:
+            firebase_logic._local_store, usage_ledger.flush_interval = local_store, flush_interval
+            usage_ledger.reset()
+            _restore(originals)
+            store.close()
+    print("✅ Clearing a conversation drops its cached order and open usage totals")
+
+if __name__ == "__main__":
+    test_continuation_parses_only_new_messages()
+    test_changed_prefix_reparses_everything()
+    test_state_cache_is_bounded()
+    test_cleared_conversation_forgets_order()
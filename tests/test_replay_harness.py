@@ -0,0 +1,33 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import clients
+import history_window
+import openai_logic
+from llm_usage import usage_ledger
+from replay_conversations import (
+    SAMPLE_CONVERSATIONS, replay_installed, fake_sheets_installed, reset_caches,
+    load_conversations, replay_conversation,
+)
+
+def test_replay_restores_what_it_replaced():
+    llm, flush_interval, summary_store = openai_logic.llm, usage_ledger.flush_interval, history_window._summary_store
+    conversation = load_conversations(SAMPLE_CONVERSATIONS)[0]
+    # Canned completions only: no cassette file
+    with replay_installed(os.path.join(os.path.dirname(__file__), "no-such-cassette.json")) as replay, fake_sheets_installed() as sheets:
+        assert openai_logic.llm is not llm and clients._clients["sheets"] is sheets
+        reset_caches()
+        turns = replay_conversation(conversation)
+        assert turns and replay.requests > 0
+
+    assert openai_logic.llm is llm and usage_ledger.flush_interval == flush_interval
+    assert history_window._summary_store is summary_store
+    # Nothing recorded during the replay is left to be flushed to storage
+    assert usage_ledger.stats()["pending_flush"] == 0
+    assert "sheets" not in clients._clients and "sheets" not in clients._installed
+    print(f"✅ Replayed {len(turns)} turns, then put the real clients back")
+
+if __name__ == "__main__":
+    test_replay_restores_what_it_replaced()
@@ -0,0 +1,86 @@
+import sys
+import os
+import json
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai_logic
+from llm_client import LLMClient
+from llm_usage import usage_ledger
+from response_cache import response_cache
+from catalog import Catalog, CATALOG_EXAMPLE_PATH, set_catalog
+
+PHONE = "+15550004444"
+PREVIOUS = {"items": [{"product": "King Salmon", "quantity": "10 lbs"}], "delivery_date": None,
+            "delivery_address": None, "notes": None}
+
+class FakeOpenAI:
+    """chat.completions.create returning a fixed message content and recording each request"""
+
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+        )
+
+def run_turn(content, message="add 5 lbs halibut", previous_order=PREVIOUS):
+    """generate_reply_and_order against a fake completion; returns (reply, order, fake)"""
+    fake = FakeOpenAI(content)
+    llm, flush_interval = openai_logic.llm, usage_ledger.flush_interval
+    openai_logic.llm, usage_ledger.flush_interval = LLMClient(fake, hedge=False), 0
+    response_cache.clear()
+    try:
+        history = [{"direction": "received", "text": message}]
+        reply, order = openai_logic.generate_reply_and_order(message, history, previous_order, phone_number=PHONE)
+    finally:
+        openai_logic.llm, usage_ledger.flush_interval = llm, flush_interval
+        usage_ledger.reset()
+    return reply, order, fake
+
+def test_reply_and_order_from_one_call():
+    order = dict(PREVIOUS, items=PREVIOUS["items"] + [{"product": "halibut", "quantity": "5 lbs"}])
+    reply, parsed, fake = run_turn(json.dumps({"reply": " Added 5 lbs halibut! ", "order": order}))
+    assert len(fake.requests) == 1 and fake.requests[0]["response_format"] == {"type": "json_object"}
+    # The order so far is part of the prompt
+    assert json.dumps(PREVIOUS) in fake.requests[0]["messages"][0]["content"]
+    assert reply == "Added 5 lbs halibut!"
+    assert [item["quantity"] for item in parsed["items"]] == ["10 lbs", "5 lbs"]
+    print("✅ One call returned the reply and the updated order")
+
+def test_unreadable_order_falls_back_to_none():
+    # Not JSON at all: the text is still the reply, the order is unknown
+    reply, order, _ = run_turn("Sure, 5 lbs halibut coming up!")
+    assert reply == "Sure, 5 lbs halibut coming up!" and order is None
+    # JSON without a usable order object
+    for content in [{"reply": "Got it"}, {"reply": "Got it", "order": "5 lbs halibut"}, {"reply": "Got it", "order": None}]:
+        reply, order, _ = run_turn(json.dumps(content))
+        assert reply == "Got it" and order is None, content
+    print("✅ Unreadable orders come back as None (callers keep the stored order)")
+
+def test_no_llm_call_keeps_previous_order():
+    set_catalog(Catalog.load(CATALOG_EXAMPLE_PATH))
+    try:
+        reply, order, fake = run_turn(json.dumps({"reply": "unused", "order": {}}), message="how much is halibut?")
+    finally:
+        set_catalog(None)
+    assert fake.requests == [] and "Pacific Halibut" in reply and order == PREVIOUS
+
+    budget = usage_ledger.prompt_budget
+    usage_ledger.prompt_budget = 5
+    try:
+        reply, order, fake = run_turn(json.dumps({"reply": "unused", "order": {}}))
+    finally:
+        usage_ledger.prompt_budget = budget
+    assert fake.requests == [] and reply == openai_logic.BUDGET_EXCEEDED_REPLY and order == PREVIOUS
+    print("✅ Catalog answers and over-budget turns leave the order as it was")
+
+if __name__ == "__main__":
+    test_reply_and_order_from_one_call()
+    test_unreadable_order_falls_back_to_none()
+    test_no_llm_call_keeps_previous_order()
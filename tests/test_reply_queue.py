@@ -0,0 +1,53 @@
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_queue import ReplyQueue, QueueFullError, StubSender
+
+def test_replies_sent_in_background():
+    sender = StubSender()
+
+    def handler(phone, text):
+        time.sleep(0.01)  # Pretend to be the OpenAI call
+        sender.send(phone, f"Reply to: {text}")
+
+    reply_queue = ReplyQueue(handler, workers=2, maxsize=10)
+    reply_queue.start()
+    for i in range(5):
+        reply_queue.submit("+15551234567", f"message {i}")
+
+    pending = reply_queue.shutdown(drain=True, timeout=5)
+    stats = reply_queue.stats()
+    print(f"Queue stats: {stats}")
+
+    assert pending == 0
+    assert len(sender.sent) == 5
+    assert stats["completed"] == 5
+    print("✅ All queued replies were sent before shutdown")
+
+def test_queue_full_is_rejected():
+    release = threading.Event()
+    reply_queue = ReplyQueue(lambda *args: release.wait(5), workers=1, maxsize=1)
+    reply_queue.start()
+
+    reply_queue.submit("job 1")  # Picked up by the worker
+    time.sleep(0.05)
+    assert reply_queue.has_room()
+    reply_queue.submit("job 2")  # Sits in the queue
+    assert not reply_queue.has_room()
+    try:
+        reply_queue.submit("job 3")
+        raise AssertionError("Expected QueueFullError")
+    except QueueFullError as e:
+        print(f"✅ Rejected as expected: {e}")
+
+    release.set()
+    reply_queue.shutdown(drain=True, timeout=5)
+    assert reply_queue.stats()["rejected"] == 1
+    assert not reply_queue.has_room()  # Shut down
+
+if __name__ == "__main__":
+    test_replies_sent_in_background()
+    test_queue_full_is_rejected()
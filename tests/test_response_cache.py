@@ -0,0 +1,55 @@
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, normalize_message
+
+FIRST_TURN = [{"direction": "received", "text": "hi"}]
+MID_CONVERSATION = [
+    {"direction": "received", "text": "10 lbs salmon"},
+    {"direction": "sent", "text": "Sure thing! When do you need it?"},
+    {"direction": "received", "text": "hi"},
+]
+
+def test_normalization():
+    assert normalize_message("Hiii!! ") == "hi"
+    assert normalize_message("HI :)") == "hi"
+    assert normalize_message("Are you open tomorrow?") == "are you open tomorrow"
+    assert normalize_message("What's up") == "whats up"
+    print("✅ Greetings normalize to the same key")
+
+def test_hit_after_miss_and_bypass_rules():
+    cache = ResponseCache(positions=["first"])
+    key = cache.key_for("Hello!", FIRST_TURN)
+    assert key == ("hello", "first")
+    assert cache.get(key) is None
+    cache.put(key, "Hey! What can I get for you today?", latency_ms=900)
+    assert cache.get(cache.key_for("hello", None)) == "Hey! What can I get for you today?"
+
+    # Mid-conversation, quantities, confirmations and long texts go to the LLM
+    assert cache.key_for("hi", MID_CONVERSATION) is None
+    assert cache.key_for("10 lbs salmon", FIRST_TURN) is None
+    assert cache.key_for("yes", FIRST_TURN) is None
+    assert cache.key_for("hi there I was wondering what you have in stock this week", FIRST_TURN) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["bypassed"] == 4
+    assert stats["saved_ms"] == 900
+    print(f"✅ Hit after first miss, bypass rules respected (hit in {stats['avg_hit_us']} µs)")
+
+def test_ttl_and_eviction():
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    for text in ["hi", "hello", "hey"]:
+        cache.put((text, "first"), f"reply to {text}")
+    assert cache.get(("hi", "first")) is None  # Evicted, least recently used
+    assert cache.stats()["evictions"] == 1
+    assert cache.get(("hey", "first")) == "reply to hey"
+    time.sleep(0.06)
+    assert cache.get(("hey", "first")) is None  # Expired
+    print("✅ Size bound and TTL both enforced")
+
+if __name__ == "__main__":
+    test_normalization()
+    test_hit_after_miss_and_bypass_rules()
+    test_ttl_and_eviction()
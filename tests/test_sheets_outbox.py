@@ -0,0 +1,138 @@
+import sys
+import os
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheets_outbox import SheetsOutbox
+
+class FakeSheetsService:
+    """Just enough of spreadsheets().batchUpdate(...).execute() to record calls"""
+
+    def __init__(self, fail_times=0):
+        self.batch_calls = []
+        self.fail_times = fail_times
+
+    def spreadsheets(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.batch_calls.append(body)
+        return self
+
+    def execute(self):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise Exception("429 Quota exceeded")
+        return {}
+
+def make_fake_sheets(service):
+    tabs = {"2025-07-25 (Fri, Jul 25)": 1}
+
+    def create_tabs(titles):
+        for title in titles:
+            tabs.setdefault(title, len(tabs) + 1)
+        return titles
+
+    return SimpleNamespace(
+        MASTER_SPREADSHEET_ID="test-spreadsheet",
+        sheets_service=service,
+        tab_name_for_date=lambda d: "2025-07-25 (Fri, Jul 25)" if d == "2025-07-25" else d,
+        build_order_row=lambda d, order: [order["phone"], order["order"], d],
+        get_tab_index=lambda refresh=False: dict(tabs),
+        create_tabs=create_tabs,
+    )
+
+def test_rows_coalesced_per_tab():
+    service = FakeSheetsService()
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = SheetsOutbox(os.path.join(tmp, "outbox.db"), writes_per_minute=6000, sheets=make_fake_sheets(service))
+        for i in range(3):
+            outbox.enqueue("2025-07-25", {"phone": f"+1555000000{i}", "order": "10 lbs salmon"})
+        outbox.enqueue("2025-07-26", {"phone": "+15550000009", "order": "5 lbs cod"})
+
+        assert outbox.stats() == {"pending": 4, "flushed": 0, "failed": 0}
+        assert outbox.flush_once() == 4
+        assert outbox.stats() == {"pending": 0, "flushed": 4, "failed": 0}
+
+    # One batchUpdate per tab, all of that tab's rows in one appendCells
+    assert len(service.batch_calls) == 2
+    assert sorted(len(call["requests"][0]["appendCells"]["rows"]) for call in service.batch_calls) == [1, 3]
+    print("✅ 4 orders for 2 tabs flushed in one batchUpdate per tab")
+
+def test_failed_flush_is_retried():
+    service = FakeSheetsService(fail_times=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = SheetsOutbox(os.path.join(tmp, "outbox.db"), writes_per_minute=6000, sheets=make_fake_sheets(service))
+        outbox.enqueue("2025-07-25", {"phone": "+15550000001", "order": "10 lbs salmon"})
+
+        assert outbox.flush_once() == 0
+        assert outbox.stats()["pending"] == 1
+        # Skip the backoff wait
+        outbox._conn.execute("UPDATE outbox SET next_attempt = 0")
+        assert outbox.flush_once() == 1
+        assert outbox.stats() == {"pending": 0, "flushed": 1, "failed": 0}
+    print("✅ Order survived a 429 and was flushed on retry")
+
+class RejectingSheetsService(FakeSheetsService):
+    """Rejects any batchUpdate that carries a row for `bad_phone`"""
+
+    def __init__(self, bad_phone):
+        super().__init__()
+        self.bad_phone = bad_phone
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.fail_times = int(self.bad_phone in json.dumps(body))
+        return super().batchUpdate(spreadsheetId, body)
+
+def test_bad_row_fails_alone():
+    service = RejectingSheetsService("+15550000002")
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = SheetsOutbox(os.path.join(tmp, "outbox.db"), writes_per_minute=6000, sheets=make_fake_sheets(service))
+        for i in range(4):
+            outbox.enqueue("2025-07-25", {"phone": f"+1555000000{i}", "order": "10 lbs salmon"})
+        # No tab can be made for an empty delivery date: the row waits instead of landing elsewhere
+        outbox.enqueue("", {"phone": "+15550000009", "order": "5 lbs cod"})
+
+        assert outbox.flush_once() == 3
+        assert outbox.stats() == {"pending": 2, "flushed": 3, "failed": 0}
+        errors = dict(outbox._conn.execute("SELECT delivery_date, last_error FROM outbox WHERE status = 'pending'").fetchall())
+        assert "Quota" in errors["2025-07-25"] and "No sheet tab" in errors[""]
+
+    # The batch of 4, then each of its rows alone; nothing sent for the tab-less row
+    assert [len(call["requests"][0]["appendCells"]["rows"]) for call in service.batch_calls] == [4, 1, 1, 1, 1]
+    print("✅ A rejected row and a row without a tab didn't hold back the other 3")
+
+def test_flushers_sharing_a_file_send_each_row_once():
+    service = FakeSheetsService()
+    sheets = make_fake_sheets(service)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "outbox.db")
+        first = SheetsOutbox(path, writes_per_minute=6000, sheets=sheets)
+        second = SheetsOutbox(path, writes_per_minute=6000, sheets=sheets)
+        for i in range(50):
+            first.enqueue("2025-07-25", {"phone": f"+1555000{i:04d}", "order": "10 lbs salmon"})
+
+        # Rows leased by one flusher are invisible to the other until the lease runs out
+        claimed = first._claim_rows()
+        assert len(claimed) == 50
+        assert second.flush_once() == 0
+        first._conn.execute("UPDATE outbox SET claimed_until = 0")
+        first._conn.commit()
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            flushed = sum(executor.map(lambda outbox: outbox.flush_once(), [first, second] * 4))
+        assert flushed == 50
+        assert second.stats() == {"pending": 0, "flushed": 50, "failed": 0}
+
+    rows = [row for call in service.batch_calls for row in call["requests"][0]["appendCells"]["rows"]]
+    assert len(rows) == 50
+    print("✅ Two flushers on one outbox file appended each of 50 rows once")
+
+if __name__ == "__main__":
+    test_rows_coalesced_per_tab()
+    test_failed_flush_is_retried()
+    test_bad_row_fails_alone()
+    test_flushers_sharing_a_file_send_each_row_once()
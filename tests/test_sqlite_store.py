@@ -0,0 +1,119 @@
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_store import SQLiteConversationStore
+
+PHONE = "+15550001111"
+
+def make_seq():
+    counter = iter(range(1, 10**6))
+    return lambda: next(counter)
+
+def test_store_and_read_in_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        next_seq = make_seq()
+        store.store_turn(PHONE, [
+            {"text": "10 lbs salmon", "direction": "received"},
+            {"text": "Sure thing! When do you need it?", "direction": "sent"},
+        ], next_seq)
+        store.store_turn(PHONE, [{"text": "Friday", "direction": "received"}], next_seq)
+        store.store_turn("+15550002222", [{"text": "other customer", "direction": "received"}], next_seq)
+
+        messages = store.get_messages(PHONE)
+        assert [m["text"] for m in messages] == ["10 lbs salmon", "Sure thing! When do you need it?", "Friday"]
+        assert isinstance(messages[0]["timestamp"], datetime)
+        assert [m["text"] for m in store.get_messages(PHONE, limit=1)] == ["Friday"]
+        assert store.get_messages(PHONE, limit=0) == []
+
+        assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        plan = " ".join(str(row) for row in store._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE phone = ? ORDER BY seq", (PHONE,)))
+        assert "messages_phone_seq" in plan
+        store.close()
+    print("✅ Messages come back in order, per phone, via the (phone, seq) index")
+
+def test_pagination_and_streaming():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        next_seq = make_seq()
+        for i in range(7):
+            store.store_turn(PHONE, [{"text": f"msg {i}", "direction": "received"}], next_seq)
+
+        newest, has_more = store.get_messages_page(PHONE, limit=3)
+        assert [m["text"] for m in newest] == ["msg 4", "msg 5", "msg 6"] and has_more
+        older, has_more = store.get_messages_page(PHONE, limit=3, before=newest[0]["id"])
+        assert [m["text"] for m in older] == ["msg 1", "msg 2", "msg 3"] and has_more
+        oldest, has_more = store.get_messages_page(PHONE, limit=3, before=older[0]["id"])
+        assert [m["text"] for m in oldest] == ["msg 0"] and not has_more
+        newer, has_more = store.get_messages_page(PHONE, limit=3, after=older[-1]["id"])
+        assert [m["text"] for m in newer] == ["msg 4", "msg 5", "msg 6"] and not has_more
+        assert store.get_messages_page(PHONE, after="missing") == ([], False)
+
+        assert [m["text"] for m in store.stream_messages(PHONE)] == [f"msg {i}" for i in range(7)]
+        future = datetime.now(timezone.utc) + timedelta(minutes=1)
+        assert list(store.stream_messages(PHONE, since=future)) == []
+        store.close()
+    print("✅ Cursor pages and streaming match the Firestore contract")
+
+def test_order_state_and_clear():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        store.store_turn(PHONE, [{"text": "hi", "direction": "received"}], make_seq(), metadata={"name": "Pike Place"})
+        assert store.load_order_state(PHONE) is None
+
+        order = {"items": [{"product": "King Salmon", "quantity": "10 lbs"}]}
+        store.save_order_state(PHONE, {"order": order})
+        assert store.load_order_state(PHONE) == {"order": order}
+
+        assert store.clear_conversation(PHONE) == 1
+        assert store.get_messages(PHONE) == []
+        assert store.load_order_state(PHONE) is None
+        store.close()
+    print("✅ Order state round-trips and clear_conversation removes everything")
+
+def test_conversation_head():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteConversationStore(os.path.join(tmp, "conversations.db"))
+        next_seq = make_seq()
+        assert store.get_conversation_head(PHONE) is None
+        for i in range(5):
+            store.store_turn(PHONE, [
+                {"text": f"msg {i}", "direction": "received"},
+                {"text": f"reply {i}", "direction": "sent"},
+            ], next_seq, head_size=4)
+
+        head = store.get_conversation_head(PHONE)
+        assert head["message_count"] == 10
+        # The newest messages, same shape as get_messages
+        assert head["recent"] == store.get_messages(PHONE, limit=4)
+        assert head["order_state"] is None and not head["awaiting_confirmation"]
+
+        store.save_order_state(PHONE, {"order": {"items": []}})
+        store.store_turn(PHONE, [{"text": "Confirm?", "direction": "sent"}], next_seq,
+                         metadata={"awaiting_confirmation": True}, head_size=4)
+        head = store.get_conversation_head(PHONE)
+        assert head["awaiting_confirmation"] and head["order_state"] == {"order": {"items": []}}
+        assert head["message_count"] == 11 and head["recent"][-1]["text"] == "Confirm?"
+        # Resetting the order clears the pending confirmation with it
+        store.save_order_state(PHONE, None)
+        assert not store.get_conversation_head(PHONE)["awaiting_confirmation"]
+
+        # A conversation stored before heads existed gets its count from the messages table;
+        # its head then holds fewer messages than the count, so readers know it's partial
+        store.store_turn("+15550002222", [{"text": "old", "direction": "received"}], next_seq)
+        store._conn.execute("DELETE FROM conversations WHERE phone = '+15550002222'")
+        store.store_turn("+15550002222", [{"text": "new", "direction": "received"}], next_seq)
+        head = store.get_conversation_head("+15550002222")
+        assert head["message_count"] == 2 and [m["text"] for m in head["recent"]] == ["new"]
+        store.close()
+    print("✅ Conversation head holds the recent messages, count and confirmation state")
+
+if __name__ == "__main__":
+    test_store_and_read_in_order()
+    test_pagination_and_streaming()
+    test_order_state_and_clear()
+    test_conversation_head()
@@ -0,0 +1,68 @@
+import sys
+import os
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai_logic
+from llm_client import LLMClient
+from llm_usage import usage_ledger
+from catalog import Catalog, CATALOG_EXAMPLE_PATH, set_catalog
+
+# Keep the fake completions' token usage out of storage
+usage_ledger.flush_interval = 0
+
+def make_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+class FakeStreamingOpenAI:
+    """chat.completions.create(stream=True) yielding chunks with a delay between them"""
+
+    def __init__(self, pieces, delay=0.02):
+        self.pieces = pieces
+        self.delay = delay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, timeout=None, stream=False, **kwargs):
+        assert stream
+
+        def chunks():
+            yield SimpleNamespace(choices=[])  # Role-only / keep-alive chunk
+            for piece in self.pieces:
+                time.sleep(self.delay)
+                yield make_chunk(piece)
+        return chunks()
+
+def test_chunks_arrive_incrementally():
+    openai_logic.llm = LLMClient(FakeStreamingOpenAI([" Sure", " thing!", " When", " do you need it?"]), hedge=False)
+    history = [
+        {"direction": "received", "text": "10 lbs halibut"},
+        {"direction": "sent", "text": "Got it!"},
+        {"direction": "received", "text": "can you deliver it"},
+    ]
+    timing = {}
+    replies = usage_ledger.by_call_type().get("reply", {}).get("calls", 0)
+    chunks = list(openai_logic.stream_ai_reply("can you deliver it", history, timing=timing))
+
+    assert chunks[0] == "Sure"  # Leading whitespace trimmed like generate_ai_reply
+    assert "".join(chunks) == "Sure thing! When do you need it?"
+    assert 0 < timing["ttft_ms"] < timing["total_ms"]
+    # Accounted like any other reply
+    usage = usage_ledger.by_call_type()
+    assert usage["reply"]["calls"] == replies + 1 and "stream" not in usage
+    print(f"✅ {len(chunks)} chunks, first after {timing['ttft_ms']:.0f} ms, done after {timing['total_ms']:.0f} ms")
+
+def test_local_answer_is_one_chunk():
+    timing = {}
+    set_catalog(Catalog.load(CATALOG_EXAMPLE_PATH))
+    try:
+        chunks = list(openai_logic.stream_ai_reply("how much is halibut?", timing=timing))
+    finally:
+        set_catalog(None)
+    assert len(chunks) == 1 and "Pacific Halibut" in chunks[0]
+    assert timing["ttft_ms"] == timing["total_ms"]
+    print("✅ Catalog answers stream as a single chunk")
+
+if __name__ == "__main__":
+    test_chunks_arrive_incrementally()
+    test_local_answer_is_one_chunk()
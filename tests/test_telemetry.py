@@ -0,0 +1,82 @@
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telemetry
+from telemetry import span, trace, observe, current_trace_id, register_collector, render_metrics, get_stage_stats
+
+def test_span_records_latency_and_errors():
+    telemetry.reset()
+    with span("test.ok"):
+        time.sleep(0.01)
+    try:
+        with span("test.ok"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    stats = get_stage_stats()["test.ok"]
+    assert stats["count"] == 2 and stats["errors"] == 1 and stats["in_flight"] == 0
+    assert stats["avg_ms"] >= 5
+    print(f"✅ Span timed and counted its error (avg {stats['avg_ms']} ms)")
+
+def test_in_flight_and_trace_ids():
+    telemetry.reset()
+    inside = threading.Event()
+    release = threading.Event()
+    seen = {}
+
+    def worker():
+        with trace("SM123"), span("test.slow"):
+            seen["trace_id"] = current_trace_id()
+            inside.set()
+            release.wait(1)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    inside.wait(1)
+    assert get_stage_stats()["test.slow"]["in_flight"] == 1
+    # Trace IDs don't leak into other threads
+    assert current_trace_id() is None
+    release.set()
+    thread.join()
+    assert seen["trace_id"] == "SM123"
+    assert get_stage_stats()["test.slow"]["in_flight"] == 0
+    with trace() as trace_id:
+        assert current_trace_id() == trace_id and len(trace_id) == 16
+    assert current_trace_id() is None
+    print("✅ In-flight gauge and trace IDs scoped to the request")
+
+def test_prometheus_format():
+    telemetry.reset()
+    observe("openai.reply", 0.3)
+    observe("openai.reply", 45, error=True)
+    register_collector("test_queue", lambda: {"depth": 3, "mode": "replay", "avg_wait_ms": 1.5})
+    text = render_metrics()
+    assert '# TYPE sms_stage_duration_seconds histogram' in text
+    assert 'sms_stage_duration_seconds_bucket{stage="openai.reply",le="0.5"} 1' in text
+    assert 'sms_stage_duration_seconds_bucket{stage="openai.reply",le="+Inf"} 2' in text
+    assert 'sms_stage_duration_seconds_count{stage="openai.reply"} 2' in text
+    assert 'sms_stage_errors_total{stage="openai.reply"} 1' in text
+    assert 'sms_stage_in_flight{stage="openai.reply"} 0' in text
+    assert "sms_test_queue_depth 3" in text and "sms_test_queue_avg_wait_ms 1.5" in text
+    assert "mode" not in text  # Strings aren't exported
+    print("✅ /metrics renders histograms, counters and collector gauges")
+
+def test_span_overhead():
+    telemetry.reset()
+    rounds = 20000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        with span("test.overhead"):
+            pass
+    per_span_us = (time.perf_counter() - started) / rounds * 1e6
+    assert per_span_us < 50
+    print(f"✅ Span overhead {per_span_us:.2f} µs")
+
+if __name__ == "__main__":
+    test_span_records_latency_and_errors()
+    test_in_flight_and_trace_ids()
+    test_prometheus_format()
+    test_span_overhead()
@@ -0,0 +1,93 @@
+"""
+Per-turn benchmark suite (pytest-benchmark), replaying conversations with stubbed I/O
+Tracks CPU time per turn, prompt size and allocations so regressions show up across commits.
+
+  pip install pytest pytest-benchmark
+  pytest tests/test_turn_benchmarks.py --benchmark-timer=time.process_time --benchmark-autosave
+  pytest tests/test_turn_benchmarks.py --benchmark-timer=time.process_time --benchmark-compare
+
+REPLAY_CONVERSATIONS / LLM_CASSETTE point it at exported conversations and a recorded cassette;
+by default it uses tests/fixtures/sample_conversations.json with canned completions.
+"""
+
+import sys
+import os
+import tracemalloc
+import pytest
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+pytest.importorskip("pytest_benchmark")
+
+import openai_logic
+from replay_conversations import (
+    SAMPLE_CONVERSATIONS, replay_installed, fake_sheets_installed, reset_caches,
+    load_conversations, replay_conversation,
+)
+from llm_replay import LLM_CASSETTE
+
+CONVERSATIONS = load_conversations(os.getenv("REPLAY_CONVERSATIONS", SAMPLE_CONVERSATIONS))
+CUSTOMER_TURNS = sum(1 for c in CONVERSATIONS for m in c["messages"] if m["direction"] == "received")
+
+
+@pytest.fixture
+def replay():
+    with replay_installed(os.getenv("LLM_CASSETTE", LLM_CASSETTE), "replay") as replay, fake_sheets_installed():
+        reset_caches()
+        # Prompts embed today's date; pin it so they hash to the same cassette entries every day
+        pinned_before = openai_logic.PIN_TODAY
+        openai_logic.PIN_TODAY = pinned_before or CONVERSATIONS[0].get("date")
+        try:
+            yield replay
+        finally:
+            openai_logic.PIN_TODAY = pinned_before
+
+
+def _replay_all():
+    reset_caches()
+    for conversation in CONVERSATIONS:
+        replay_conversation(conversation)
+
+
+def _record_sizes(benchmark, replay, turns):
+    """Prompt size and peak allocations of one extra run, stored with the benchmark"""
+    replay.requests = replay.prompt_chars = 0
+    tracemalloc.start()
+    _replay_all()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark.extra_info["turns"] = turns
+    benchmark.extra_info["completions_per_turn"] = round(replay.requests / turns, 2)
+    benchmark.extra_info["prompt_chars_per_turn"] = round(replay.prompt_chars / turns)
+    benchmark.extra_info["peak_alloc_kb"] = round(peak / 1024, 1)
+
+
+def test_full_pipeline_per_conversation_set(benchmark, replay):
+    """Every customer turn: reply, order parse, completeness check, confirmation to Sheets"""
+    benchmark(_replay_all)
+    _record_sizes(benchmark, replay, CUSTOMER_TURNS)
+    benchmark.extra_info["cpu_ms_per_turn"] = round(benchmark.stats.stats.mean / CUSTOMER_TURNS * 1000, 3)
+
+
+def test_reply_prompt_build(benchmark, replay):
+    """generate_ai_reply on the longest conversation's last turn (prompt building and windowing)"""
+    conversation = max(CONVERSATIONS, key=lambda c: len(c["messages"]))
+    last = max(i for i, m in enumerate(conversation["messages"]) if m["direction"] == "received")
+    history = conversation["messages"][:last + 1]
+
+    def run():
+        reset_caches()
+        return openai_logic.generate_ai_reply(history[-1]["text"], history, phone_number=conversation["phone"])
+
+    assert benchmark(run)
+    benchmark.extra_info["prompt_chars"] = replay.prompt_chars // max(1, replay.requests)
+
+
+def test_order_parse(benchmark, replay):
+    """parse_order_from_conversation on full conversations, memo cleared each round"""
+    def run():
+        reset_caches()
+        return [openai_logic.parse_order_from_conversation(c["messages"]) for c in CONVERSATIONS]
+
+    orders = benchmark(run)
+    assert all(order is not None for order in orders)
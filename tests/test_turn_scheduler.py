@@ -0,0 +1,106 @@
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from turn_scheduler import TurnScheduler
+
+class RecordingTurns:
+    """run_turn stand-in: records each turn's texts and checks turns never overlap per phone"""
+
+    def __init__(self, seconds=0.05):
+        self.seconds = seconds
+        self.turns = []
+        self.running = set()
+        self.overlaps = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, phone, texts, trace_id=None):
+        with self._lock:
+            if phone in self.running:
+                self.overlaps += 1
+            self.running.add(phone)
+        time.sleep(self.seconds)
+        with self._lock:
+            self.running.discard(phone)
+            self.turns.append((phone, list(texts)))
+        return f"reply to {' / '.join(texts)}"
+
+def _send_burst(scheduler, phone, texts, gap, replies, wait=True):
+    threads = []
+    for i, text in enumerate(texts):
+        def send(text=text, i=i):
+            replies[i] = scheduler.submit(phone, text, wait=wait)
+        thread = threading.Thread(target=send)
+        thread.start()
+        threads.append(thread)
+        time.sleep(gap)
+    for thread in threads:
+        thread.join()
+
+def test_burst_becomes_one_turn():
+    turns = RecordingTurns()
+    scheduler = TurnScheduler(turns, debounce=0.2, max_wait=2)
+    replies = {}
+    _send_burst(scheduler, "+1", ["hey", "need salmon", "20 lbs"], 0.05, replies)
+
+    assert turns.turns == [("+1", ["hey", "need salmon", "20 lbs"])]
+    # Only the last text's caller gets the reply
+    assert replies == {0: None, 1: None, 2: "reply to hey / need salmon / 20 lbs"}
+    stats = scheduler.stats()
+    assert stats["turns"] == 1 and stats["coalesced"] == 2 and stats["coalescing_rate"] == 0.667
+    assert stats["avg_added_ms"] >= 150 and stats["active_phones"] == 0
+    print(f"✅ 3 texts → 1 turn (debounce added avg {stats['avg_added_ms']} ms)")
+
+def test_one_turn_at_a_time_per_phone():
+    turns = RecordingTurns(seconds=0.2)
+    scheduler = TurnScheduler(turns, debounce=0, max_wait=0)
+    replies = {}
+    # The 2nd and 3rd text arrive while the first turn runs and are handled together after it
+    _send_burst(scheduler, "+1", ["10 lbs salmon", "actually 20", "and 5 lbs halibut"], 0.05, replies)
+
+    assert turns.overlaps == 0
+    assert turns.turns == [("+1", ["10 lbs salmon"]), ("+1", ["actually 20", "and 5 lbs halibut"])]
+    assert replies[0] == "reply to 10 lbs salmon" and replies[1] is None
+    assert replies[2] == "reply to actually 20 / and 5 lbs halibut"
+    print("✅ Texts sent during a running turn wait for it and share the next turn")
+
+def test_phones_run_in_parallel_and_errors_reach_the_caller():
+    turns = RecordingTurns(seconds=0.2)
+    scheduler = TurnScheduler(turns, debounce=0, max_wait=0)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=scheduler.submit, args=(f"+{i}", "hi")) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - started < 0.5
+    assert len(turns.turns) == 5
+
+    def failing_turn(phone, texts, trace_id=None):
+        raise RuntimeError("LLM down")
+
+    scheduler = TurnScheduler(failing_turn, debounce=0, max_wait=0)
+    try:
+        scheduler.submit("+1", "hi")
+        assert False, "error was swallowed"
+    except RuntimeError:
+        pass
+    assert scheduler.stats()["failed"] == 1
+    print("✅ Different phones don't wait for each other; failures re-raised to the caller")
+
+def test_fire_and_forget_submits():
+    turns = RecordingTurns()
+    scheduler = TurnScheduler(turns, debounce=0.1, max_wait=1)
+    replies = {}
+    _send_burst(scheduler, "+1", ["hey", "need crab"], 0.02, replies, wait=False)
+    assert replies == {0: None, 1: None}
+    assert turns.turns == [("+1", ["hey", "need crab"])]
+    print("✅ Async submits coalesce too")
+
+if __name__ == "__main__":
+    test_burst_becomes_one_turn()
+    test_one_turn_at_a_time_per_phone()
+    test_phones_run_in_parallel_and_errors_reach_the_caller()
+    test_fire_and_forget_submits()
@@ -0,0 +1,180 @@
+"""
+Per-phone turn scheduler with burst coalescing
+Customers often send several texts in a row ("hey", "need salmon", "20 lbs").
+The scheduler runs at most one turn at a time per phone number, and texts that
+arrive within TURN_DEBOUNCE seconds of each other (or while that phone's
+previous turn is still running) are merged into a single turn, so each burst
+costs one LLM call and replies can't overtake each other.
+
+No extra threads: the thread that submits the first text of a burst waits out
+the debounce window and runs the turn; the others just add their text to it.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from dotenv import load_dotenv
+from telemetry import trace, observe, log
+
+load_dotenv()
+
+TURN_DEBOUNCE = float(os.getenv("TURN_DEBOUNCE", "1.0"))  # seconds of quiet that end a burst
+TURN_MAX_WAIT = float(os.getenv("TURN_MAX_WAIT", "4.0"))  # seconds a burst can delay its first text
+LATENCY_WINDOW = 1000
+
+
+class _Ticket:
+    __slots__ = ("text", "trace_id", "arrived", "waiting", "lead", "done", "reply", "error")
+
+    def __init__(self, text, trace_id, waiting):
+        self.text = text
+        self.trace_id = trace_id
+        self.arrived = time.monotonic()
+        self.waiting = waiting  # a thread is blocked on this ticket and can take over as leader
+        self.lead = False
+        self.done = False
+        self.reply = None
+        self.error = None
+
+
+class _Conversation:
+    __slots__ = ("pending", "leader", "running")
+
+    def __init__(self):
+        self.pending = []
+        self.leader = False
+        self.running = False
+
+
+class TurnScheduler:
+    """
+    run_turn(phone_number, texts, trace_id) -> reply: does the work of one turn for
+    all the texts of a burst (oldest first)
+    """
+
+    def __init__(self, run_turn, debounce=TURN_DEBOUNCE, max_wait=TURN_MAX_WAIT):
+        self.run_turn = run_turn
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._conversations = {}
+        self._added = deque(maxlen=LATENCY_WINDOW)  # seconds from arrival to turn start, per text
+
+        # Metrics
+        self.messages = 0
+        self.turns = 0
+        self.turn_messages = 0  # texts in finished turns
+        self.failed = 0
+
+    def submit(self, phone_number, text, trace_id=None, wait=True):
+        """
+        Add a text to the phone's next turn.
+        wait=True: block until the turn that includes it has run. Returns the reply if this was
+        the last text of its turn, None if a later text's request carries the reply instead.
+        wait=False: return right away (the reply is delivered by run_turn, e.g. sent out via Twilio).
+        Re-raises run_turn's exception in the last text's caller.
+        """
+        with self._lock:
+            conversation = self._conversations.get(phone_number)
+            if conversation is None:
+                conversation = self._conversations[phone_number] = _Conversation()
+            ticket = _Ticket(text, trace_id, wait)
+            conversation.pending.append(ticket)
+            self.messages += 1
+            self._changed.notify_all()
+
+            if conversation.leader:
+                if not wait:
+                    return None
+                while not ticket.done and not ticket.lead:
+                    self._changed.wait()
+                if ticket.done:
+                    return self._result(ticket)
+            conversation.leader = True
+
+        self._lead(phone_number, conversation)
+        return self._result(ticket) if wait else None
+
+    def _result(self, ticket):
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.reply
+
+    def _next_batch(self, conversation):
+        """Wait (lock held) until the burst has gone quiet and no turn is running, then take it"""
+        while True:
+            if not conversation.running and conversation.pending:
+                now = time.monotonic()
+                ready_at = min(conversation.pending[-1].arrived + self.debounce,
+                               conversation.pending[0].arrived + self.max_wait)
+                if now >= ready_at:
+                    batch, conversation.pending = conversation.pending, []
+                    return batch
+                self._changed.wait(ready_at - now)
+            else:
+                self._changed.wait()
+
+    def _lead(self, phone_number, conversation):
+        """Run turns for this phone until its queue is empty or another waiting caller takes over"""
+        while True:
+            with self._lock:
+                batch = self._next_batch(conversation)
+                conversation.running = True
+                started = time.monotonic()
+                for ticket in batch:
+                    self._added.append(started - ticket.arrived)
+            for ticket in batch:
+                observe("turn.coalesce_wait", started - ticket.arrived)
+
+            last = batch[-1]
+            with trace(last.trace_id):
+                try:
+                    last.reply = self.run_turn(phone_number, [ticket.text for ticket in batch], last.trace_id)
+                except Exception as e:
+                    last.error = e
+                    if not last.waiting:
+                        # Nobody to re-raise it to
+                        log(f"❌ Turn for {phone_number} failed: {e}")
+
+            with self._lock:
+                conversation.running = False
+                self.turns += 1
+                self.turn_messages += len(batch)
+                if last.error is not None:
+                    self.failed += 1
+                for ticket in batch:
+                    ticket.done = True
+                if not conversation.pending:
+                    conversation.leader = False
+                    del self._conversations[phone_number]
+                    self._changed.notify_all()
+                    return
+                # Texts that came in during the turn: hand the next turn to a caller that's
+                # blocked anyway, so this caller's reply isn't held up by it
+                successor = next((ticket for ticket in reversed(conversation.pending) if ticket.waiting), None)
+                if successor is not None:
+                    successor.lead = True
+                    self._changed.notify_all()
+                    return
+                self._changed.notify_all()
+
+    def stats(self):
+        """Coalescing rate and the latency debouncing adds"""
+        with self._lock:
+            added = sorted(self._added)
+            pending = sum(len(c.pending) for c in self._conversations.values())
+            return {
+                "messages": self.messages,
+                "turns": self.turns,
+                "failed": self.failed,
+                "coalesced": self.turn_messages - self.turns,
+                # Share of texts that didn't need a turn of their own
+                "coalescing_rate": round(1 - self.turns / self.turn_messages, 3) if self.turn_messages else 0.0,
+                "active_phones": len(self._conversations),
+                "pending": pending,
+                "avg_added_ms": round(sum(added) / len(added) * 1000, 1) if added else 0.0,
+                "p95_added_ms": round(added[min(len(added) - 1, int(len(added) * 0.95))] * 1000, 1) if added else 0.0,
+                "max_added_ms": round(added[-1] * 1000, 1) if added else 0.0,
+            }